@@ -15,25 +15,129 @@ To run the app:
     python app.py
 
 Access the portal at http://localhost:5000
+
+pandas and the chart spreadsheet are loaded on first use; see
+benchmarks/startup_bench.py for the startup cost.
+
+To start with a large synthetic dataset instead of empty stores:
+    python -m portal.synthetic --out data/synthetic
+    PORTAL_DATA_DIR=data/synthetic python app.py
+
+To keep journal postings across restarts:
+    PORTAL_JOURNAL_DIR=data/journal python app.py
+
+To run several workers over the same data:
+    PORTAL_SHARED_LOG=data/portal.log gunicorn -w 4 app:app
+
+To record and report amounts in currencies other than USD, load dated
+exchange rates (CSV with date,currency,rate columns; see portal/fx.py):
+    PORTAL_FX_RATES=data/fx_rates.csv python app.py
 """
 
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify
-import pandas as pd
+from flask import (Flask, Response, g, has_request_context, render_template, request, redirect,
+                   url_for, session, jsonify)
+from contextlib import nullcontext
+from datetime import date, datetime, timedelta
+import hashlib
+import json
 import os
+import threading
+
+from portal import batch, compression, metrics
+from portal.aging import DEFAULT_EDGES, AgingReport, parse_edges
+from portal.cash import CashPosition
+from portal.consolidation import consolidate, group_balances, parse_pairs
+from portal.fingerprint import FingerprintIndex, request_digest
+from portal.fx import DEFAULT_CURRENCY, LedgerConversion, MissingRate, RateTable
+from portal.hierarchy import AccountTree
+from portal.journal_log import JournalLog
+from portal.ledger import (JournalError, balanced_lines, build_entry, entry_fields, parse_csv,
+                           parse_ndjson, postings)
+from portal.metrics import timed
+from portal.periods import PeriodClosed, check_open, close_period, closed_before, open_positions
+from portal.records import BankTransaction, Bill, Customer, Invoice, JournalEntry, Record, Vendor
+from portal.search import SearchIndex
+from portal.shared import SharedStore
+from portal.throttle import Throttle, parse_rate, store_from_env
 
 app = Flask(__name__)
 app.secret_key = os.environ.get("FLASK_SECRET_KEY", "pretium_secret_key")
+metrics.init_app(app)
+# Registered after metrics so response size metrics see the compressed body.
+compression.init_app(app)
+_json_default = app.json.default
+
+def _record_json(value):
+    return value.to_json() if isinstance(value, Record) else _json_default(value)
+
+app.json.default = _record_json
+
+# Login throttles.  Both are token buckets checked before the password
+# comparison; set THROTTLE_REDIS_URL to share the buckets across workers.
+_throttle_store = store_from_env()
+LOGIN_IP_THROTTLE = Throttle("login_ip", *parse_rate(os.environ.get("LOGIN_THROTTLE_IP_RATE", "30/min")),
+                             store=_throttle_store)
+LOGIN_USER_THROTTLE = Throttle("login_username", *parse_rate(os.environ.get("LOGIN_THROTTLE_USERNAME_RATE", "10/min")),
+                               store=_throttle_store)
+
+# The chart of accounts is loaded on first use rather than at import, so
+# starting the app (and collecting tests) does not pay for pandas, openpyxl
+# and the spreadsheet parse.  The parsed rows are kept in a JSON cache next
+# to the workbook, keyed by its size and mtime, so later starts skip
+# openpyxl entirely.  Set PORTAL_PRELOAD_CHART=1 to load it at startup.
+CHART_COLUMNS = ["code", "name", "type", "description"]
+CHART_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cchart_of_accounts.xlsx")
+CHART_CACHE_PATH = os.environ.get(
+    "PORTAL_CHART_CACHE", os.path.join(os.path.dirname(CHART_PATH), ".cache", "chart_of_accounts.json"))
+chart_df = None
+# Bumped whenever the chart is replaced or changed; keys _from_chart's cache.
+_chart_version = 0
 
-# Load chart of accounts once on startup.  The file must be in the
-# current working directory.  It is assumed to have at least the
-# columns: code, name, type and description.
-try:
-    chart_path = os.path.join(os.path.dirname(__file__), "cchart_of_accounts.xlsx")
-    chart_df = pd.read_excel(chart_path)
-except Exception as e:
-    # If the file cannot be loaded we fall back to an empty DataFrame.
-    print(f"Warning: could not read cchart_of_accounts.xlsx: {e}")
-    chart_df = pd.DataFrame(columns=["code", "name", "type", "description"])
+def _load_chart():
+    """Read the chart from the warm cache, or parse the workbook and cache it."""
+    import pandas as pd
+    try:
+        stat = os.stat(CHART_PATH)
+    except OSError as e:
+        print(f"Warning: could not read cchart_of_accounts.xlsx: {e}")
+        return pd.DataFrame(columns=CHART_COLUMNS)
+    key = [stat.st_size, stat.st_mtime_ns]
+    try:
+        with open(CHART_CACHE_PATH, encoding="utf-8") as handle:
+            cached = json.load(handle)
+        if cached.get("key") == key:
+            return pd.DataFrame.from_records(cached["rows"], columns=cached["columns"])
+    except (OSError, ValueError, KeyError):
+        pass
+    try:
+        df = pd.read_excel(CHART_PATH)
+    except Exception as e:
+        # If the file cannot be loaded we fall back to an empty DataFrame.
+        print(f"Warning: could not read cchart_of_accounts.xlsx: {e}")
+        return pd.DataFrame(columns=CHART_COLUMNS)
+    try:
+        os.makedirs(os.path.dirname(CHART_CACHE_PATH), exist_ok=True)
+        with open(CHART_CACHE_PATH, "w", encoding="utf-8") as handle:
+            json.dump({"key": key, "columns": list(df.columns),
+                       "rows": json.loads(df.to_json(orient="values"))}, handle)
+    except OSError:
+        pass
+    return df
+
+def _chart():
+    """Return the chart of accounts DataFrame, loading it on first use."""
+    if chart_df is None:
+        _set_chart(_load_chart())
+    return chart_df
+
+def _set_chart(chart):
+    """Replace the chart of accounts (None to reload it on next use)."""
+    global chart_df, _chart_version
+    chart_df = chart
+    _chart_version += 1
+
+if os.environ.get("PORTAL_PRELOAD_CHART"):
+    _chart()
 
 # In‑memory user store.  In a real application use a database and
 # password hashing.  The default admin user is provided for
@@ -44,18 +148,229 @@ USERS = {
 
 # Additional in-memory storage for customers, vendors, invoices, bills,
 # bank transactions and journal entries.  In a production system these
-# would be persisted in a database.
+# would be persisted in a database.  Rows are the compact record types of
+# portal/records.py, which read like dicts.
 CUSTOMERS = []
 VENDORS = []
 INVOICES = []
 BILLS = []
 BANK_TRANSACTIONS = []
 JOURNAL_ENTRIES = []
+RECORD_TYPES = {
+    'customers': Customer, 'vendors': Vendor, 'invoices': Invoice, 'bills': Bill,
+    'bank_transactions': BankTransaction, 'journal_entries': JournalEntry,
+}
+
+# Period closes, oldest first (see portal/periods.py).  The latest one
+# holds the frozen balances statements start from and locks postings dated
+# before it.
+PERIOD_CLOSES = []
+
+# Currencies.  Invoices, bills, bank transactions and journal entries carry
+# a ``currency``; records without one are in the base currency.  Statements
+# convert into a reporting currency with the rates in PORTAL_FX_RATES, a CSV
+# of ``date,currency,rate`` giving the value of one unit in the base
+# currency.  Only the base currency is accepted when no rates are loaded.
+BASE_CURRENCY = os.environ.get('PORTAL_BASE_CURRENCY', DEFAULT_CURRENCY)
+FX_RATES = (RateTable.from_csv(os.environ['PORTAL_FX_RATES'], BASE_CURRENCY)
+            if os.environ.get('PORTAL_FX_RATES') else RateTable(BASE_CURRENCY))
+
+# Entities.  Journal entries may name the legal entity that books them;
+# entries without one belong to DEFAULT_ENTITY.  A chart ``entity`` column
+# reserves an account to one entity (blank: shared by all).  Consolidated
+# statements remove intercompany balances through the account pairs in
+# PORTAL_ELIMINATIONS, e.g. ``1310:2310,4910:5910`` (see
+# portal/consolidation.py).
+DEFAULT_ENTITY = os.environ.get('PORTAL_DEFAULT_ENTITY', 'main')
+ELIMINATIONS = parse_pairs(os.environ.get('PORTAL_ELIMINATIONS', ''))
+
+def load_dataset(directory):
+    """Replace the in-memory stores with a dataset written by ``portal.synthetic``.
+
+    ``directory`` holds ``chart.csv`` and one NDJSON file per store.  Missing
+    files leave the corresponding store untouched.
+    """
+    chart_path = os.path.join(directory, 'chart.csv')
+    if os.path.exists(chart_path):
+        import pandas as pd
+        _set_chart(pd.read_csv(chart_path, keep_default_na=False))
+    stores = {
+        'customers': CUSTOMERS, 'vendors': VENDORS, 'invoices': INVOICES, 'bills': BILLS,
+        'bank_transactions': BANK_TRANSACTIONS, 'journal_entries': JOURNAL_ENTRIES,
+    }
+    for name, store in stores.items():
+        path = os.path.join(directory, f'{name}.ndjson')
+        if not os.path.exists(path):
+            continue
+        record = RECORD_TYPES[name].from_dict
+        with open(path, encoding='utf-8') as handle:
+            store[:] = [record(json.loads(line)) for line in handle]
+    users_path = os.path.join(directory, 'users.ndjson')
+    if os.path.exists(users_path):
+        with open(users_path, encoding='utf-8') as handle:
+            for line in handle:
+                row = json.loads(line)
+                USERS.setdefault(row['username'], row['password'])
+
+
+if os.environ.get('PORTAL_DATA_DIR'):
+    load_dataset(os.environ['PORTAL_DATA_DIR'])
+
+# Durable journal.  When PORTAL_JOURNAL_DIR is set every posting is appended
+# to a group-committed log there and the journal is rebuilt from the latest
+# snapshot plus the log tail on startup.  Postings are serialised by
+# _journal_lock so ids, the in-memory list and the log stay in step.
+_journal_lock = threading.Lock()
+JOURNAL_LOG = None
+if os.environ.get('PORTAL_JOURNAL_DIR'):
+    JOURNAL_LOG = JournalLog(
+        os.environ['PORTAL_JOURNAL_DIR'],
+        commit_interval=float(os.environ.get('PORTAL_JOURNAL_COMMIT_MS', '2')) / 1000,
+        checkpoint_every=int(os.environ.get('PORTAL_JOURNAL_CHECKPOINT_EVERY', '100000')),
+    )
+    _recovered = JOURNAL_LOG.recover()
+    if _recovered or not JOURNAL_ENTRIES:
+        JOURNAL_ENTRIES[:] = [JournalEntry.from_dict(entry) for entry in _recovered]
+    else:
+        # First start on top of a loaded dataset: it becomes the base snapshot.
+        JOURNAL_LOG.adopt(JOURNAL_ENTRIES)
+    # Period closes are few; they are kept beside the log, one JSON line each.
+    _closes_path = os.path.join(JOURNAL_LOG.directory, 'closes.ndjson')
+    if os.path.exists(_closes_path):
+        with open(_closes_path, encoding='utf-8') as handle:
+            PERIOD_CLOSES[:] = [json.loads(line) for line in handle if line.strip()]
+
+def _apply_account(account):
+    global _chart_version
+    chart = _chart()
+    if 'entity' in account and 'entity' not in chart.columns:
+        chart['entity'] = ''
+    chart.loc[len(chart)] = account
+    _chart_version += 1
+
+# Fingerprint counts of the bank transactions, for skipping re-uploaded rows.
+# _bank_lock keeps the duplicate check and the append of an upload together.
+BANK_FINGERPRINTS = FingerprintIndex(BANK_TRANSACTIONS)
+_bank_lock = threading.Lock()
+
+# Shared state for multi-worker deployments.  When PORTAL_SHARED_LOG names a
+# file, every worker keeps its own copy of the stores and all writes go
+# through that one change log (see portal/shared.py), so gunicorn can run
+# several workers against the same data.  Writes must happen inside
+# _writing().  The log is itself the durable record, so it replaces
+# PORTAL_JOURNAL_DIR.  Bank upload idempotency keys go through the log too, so
+# a retry is recognised by any worker.  With PORTAL_SHARED_COMPACT set the
+# log is compacted at startup (see SharedStore.compact).
+SHARED = None
+if os.environ.get('PORTAL_SHARED_LOG'):
+    if JOURNAL_LOG is not None:
+        raise RuntimeError('PORTAL_SHARED_LOG and PORTAL_JOURNAL_DIR cannot be used together')
+    SHARED = SharedStore(
+        os.environ['PORTAL_SHARED_LOG'],
+        {
+            'customers': CUSTOMERS, 'vendors': VENDORS, 'invoices': INVOICES, 'bills': BILLS,
+            'bank_transactions': BANK_TRANSACTIONS, 'journal_entries': JOURNAL_ENTRIES,
+            'period_closes': PERIOD_CLOSES,
+        },
+        appliers={'accounts': _apply_account,
+                  'bank_idempotency': lambda record: BANK_FINGERPRINTS.remember(**record)},
+        datetime_fields={'journal_entries': ('date',)},
+        record_types={kind: record.from_dict for kind, record in RECORD_TYPES.items()},
+        fsync=bool(os.environ.get('PORTAL_SHARED_FSYNC')),
+        snapshots={'bank_idempotency': BANK_FINGERPRINTS.remembered},
+    )
+    SHARED.sync()
+    if os.environ.get('PORTAL_SHARED_COMPACT'):
+        SHARED.compact()
+
+def _writing():
+    """Context for any change to the stores; serialises writers across workers."""
+    return SHARED.write() if SHARED is not None else nullcontext()
+
+@app.before_request
+def _sync_shared():
+    if SHARED is not None:
+        SHARED.sync()
+
+@app.after_request
+def _wait_for_journal(response):
+    """Hold the response until this request's postings are on disk."""
+    seq = g.pop('journal_seq', None)
+    if seq is not None:
+        JOURNAL_LOG.wait(seq)
+    return response
+
+def _party(store, party_id):
+    """Return the customer or vendor with ``party_id`` (an int or digit string), or None."""
+    if isinstance(party_id, str) and party_id.isdigit():
+        party_id = int(party_id)
+    return store[party_id - 1] if isinstance(party_id, int) and 0 < party_id <= len(store) else None
+
+def _party_name(store, party_id):
+    party = _party(store, party_id)
+    return party['name'] if party else ''
+
+# Search index over the stores.  It indexes records appended since the last
+# query, so writes need no extra bookkeeping.
+SEARCH_STORES = {
+    'customer': CUSTOMERS, 'vendor': VENDORS, 'invoice': INVOICES, 'bill': BILLS,
+    'journal_entry': JOURNAL_ENTRIES,
+}
+SEARCH = SearchIndex({
+    'customer': (CUSTOMERS, 'owner', lambda c: (c['name'], c.get('contact'))),
+    'vendor': (VENDORS, 'owner', lambda v: (v['name'], v.get('contact'))),
+    'invoice': (INVOICES, 'owner', lambda inv: [_party_name(CUSTOMERS, inv['customer_id'])]
+                + [item.get('description') for item in inv['items']]),
+    'bill': (BILLS, 'owner', lambda bill: [_party_name(VENDORS, bill['vendor_id'])]
+             + [item.get('description') for item in bill['items']]),
+    'journal_entry': (JOURNAL_ENTRIES, 'user',
+                      lambda je: (je['description'], *(line.get('description') for line in je.get('lines') or ()))),
+})
+
+# Daily cash inflows and outflows, maintained from the journal.
+CASH_POSITION = CashPosition(JOURNAL_ENTRIES)
+
+# Per-entry conversion factors into each reporting currency.
+JOURNAL_FX = LedgerConversion(JOURNAL_ENTRIES, FX_RATES)
+
+# Aging reports keep columnar copies of the invoice and bill stores.
+AR_AGING = AgingReport(INVOICES, 'customer_id', rates=FX_RATES)
+AP_AGING = AgingReport(BILLS, 'vendor_id', rates=FX_RATES)
 
 def _generate_id(data_list):
     """Generate a simple incremental ID based on the length of a list."""
     return len(data_list) + 1
 
+def _parse_currency(value, default=None):
+    """Return ``value`` as a currency code (``default`` or the base currency if
+    empty), or None if no rates are loaded for it."""
+    code = str(value).strip().upper() if value else (default or BASE_CURRENCY)
+    return code if code in FX_RATES.currencies else None
+
+def _check_rate(currency, day):
+    """Raise ``MissingRate`` unless an amount in ``currency`` on ``day`` can be converted.
+
+    Checked when records are added, so one unconvertible row cannot break
+    every later statement."""
+    if currency and currency != BASE_CURRENCY:
+        FX_RATES.rate(currency, day)
+
+def _unknown_currency():
+    known = ', '.join(sorted(FX_RATES.currencies))
+    return jsonify({'status': 'fail', 'message': f'Unknown currency; rates are loaded for {known}'}), 400
+
+@app.errorhandler(JournalError)
+def _journal_error(error):
+    return jsonify({'status': 'fail', 'message': str(error)}), 400
+
+@app.errorhandler(PeriodClosed)
+def _period_closed(error):
+    return jsonify({'status': 'fail', 'message': str(error)}), 409
+
+@app.errorhandler(MissingRate)
+def _missing_rate(error):
+    return jsonify({'status': 'fail', 'message': f'Cannot convert: {error}'}), 400
+
 def _get_current_user():
     """Return the current user record if logged in."""
     username = session.get('username')
@@ -63,35 +378,115 @@ def _get_current_user():
         return None
     return {'username': username, 'role': 'admin' if username == 'Admin' else 'client'}
 
-def create_journal_entry(debit_account, credit_account, amount, description, user):
-    """Create a simple journal entry.  Debit and credit are account codes."""
-    JOURNAL_ENTRIES.append({
-        'id': _generate_id(JOURNAL_ENTRIES),
-        'date': pd.Timestamp.today(),
-        'debit_account': debit_account,
-        'credit_account': credit_account,
-        'amount': amount,
-        'description': description,
-        'user': user
-    })
+@timed
+def create_journal_entry(debit_account, credit_account, amount, description, user, currency=None,
+                         entity=None):
+    """Create a simple journal entry.  Debit and credit are account codes.
+
+    ``amount`` is in ``currency``, the base currency by default, and the
+    entry is booked by ``entity``, the default entity if None."""
+    fields = {'debit_account': debit_account, 'credit_account': credit_account, 'amount': amount}
+    if entity:
+        fields['entity'] = entity
+    _post_entries([(fields, description, currency, None)], user)
+
+@timed
+def _post_entries(batch, user):
+    """Append ``(fields, description, currency, date)`` entries to the journal.
+
+    ``fields`` are the account fields from ``portal.ledger.entry_fields``,
+    with an optional ``entity``; a None date means now.  The batch is
+    appended under one lock and, with PORTAL_JOURNAL_DIR, waits for a single
+    group commit.  Returns the ids."""
+    now = datetime.now()
+    with _writing(), _journal_lock:
+        close = _latest_close()
+        for fields, _, currency, day in batch:
+            check_open(close, day or now)
+            _check_entity(fields)
+            _check_rate(currency, day or now)
+        first_id = _generate_id(JOURNAL_ENTRIES)
+        for fields, description, currency, day in batch:
+            entry = JournalEntry(
+                id=_generate_id(JOURNAL_ENTRIES),
+                date=day or now,
+                debit_account=fields['debit_account'],
+                credit_account=fields['credit_account'],
+                amount=fields['amount'],
+                description=description,
+                user=user,
+                currency=currency or BASE_CURRENCY,
+                lines=fields.get('lines'),
+                entity=fields.get('entity')
+            )
+            JOURNAL_ENTRIES.append(entry)
+            if JOURNAL_LOG is not None:
+                seq = JOURNAL_LOG.append(entry)
+                if has_request_context():
+                    g.journal_seq = seq
+        if JOURNAL_LOG is not None and JOURNAL_LOG.needs_checkpoint():
+            threading.Thread(target=JOURNAL_LOG.begin_checkpoint(JOURNAL_ENTRIES),
+                             name='journal-checkpoint', daemon=True).start()
+        return range(first_id, len(JOURNAL_ENTRIES) + 1)
 
-def compute_income_statement():
+def _check_entity(fields):
+    """Raise ``JournalError`` if the entry ``fields`` post to another entity's account."""
+    owners = _from_chart(_build_account_entities)
+    if not owners:
+        return
+    entity = fields.get('entity') or DEFAULT_ENTITY
+    for account, _ in postings(fields):
+        owner = owners.get(str(account))
+        if owner is not None and owner != entity:
+            raise JournalError(f'account {account} belongs to entity {owner}')
+
+def _latest_close():
+    return PERIOD_CLOSES[-1] if PERIOD_CLOSES else None
+
+def _converted(currency=None):
+    """Yield ``(account, amount)`` for every posting in the open period, in ``currency``.
+
+    Amounts are debits minus credits.  Entries folded into the latest period
+    close are skipped; see ``_closed_balances``.  Factors come precomputed
+    from ``JOURNAL_FX``; in the common case of a single-currency journal
+    reported in the base currency there are none."""
+    factors = JOURNAL_FX.factors(currency or BASE_CURRENCY)
+    entries = JOURNAL_ENTRIES
+    for position in open_positions(entries, _latest_close()):
+        if factors is None:
+            yield from postings(entries[position])
+        else:
+            factor = factors[position]
+            for account, amount in postings(entries[position]):
+                yield account, amount * factor
+
+def _closed_balances(currency=None):
+    """Return the latest close's frozen balances as a dict, in ``currency``.
+
+    They are kept in the base currency and translated at the close date's rates."""
+    close = _latest_close()
+    if close is None:
+        return {}
+    reporting = currency or BASE_CURRENCY
+    factor = FX_RATES.factor(BASE_CURRENCY, closed_before(close), reporting)
+    return {account: value * factor for account, value in close['balances']}
+
+@timed
+def compute_income_statement(currency=None):
     """Compute a simple income statement from journal entries.
-    Returns revenue, expenses and net income."""
+    Returns revenue, expenses and net income in ``currency`` (default base)
+    for the open period, i.e. since the latest period close."""
+    types = _from_chart(_build_account_types)
     revenue_total = 0
     expense_total = 0
-    for entry in JOURNAL_ENTRIES:
-        # Simplistic logic: if credit account is revenue, add to revenue_total.
-        # if debit account is expense, add to expense_total.
-        credit_ac = entry['credit_account']
-        debit_ac = entry['debit_account']
-        # Find account types from chart
-        credit_row = chart_df[chart_df['code'] == credit_ac]
-        debit_row = chart_df[chart_df['code'] == debit_ac]
-        if not credit_row.empty and credit_row.iloc[0]['type'] == 'Revenue':
-            revenue_total += entry['amount']
-        if not debit_row.empty and debit_row.iloc[0]['type'] == 'Expense':
-            expense_total += entry['amount']
+    for account, amount in _converted(currency):
+        # Simplistic logic: credits to revenue accounts add to revenue_total,
+        # debits to expense accounts add to expense_total.
+        acc_type = types.get(account)
+        if acc_type == 'Revenue' and amount < 0:
+            revenue_total -= amount
+        elif acc_type == 'Expense' and amount > 0:
+            expense_total += amount
     net_income = revenue_total - expense_total
     return {
         'revenue': revenue_total,
@@ -99,21 +494,24 @@ def compute_income_statement():
         'net_income': net_income
     }
 
-def compute_balance_sheet():
+@timed
+def compute_balance_sheet(currency=None):
     """Compute a simple balance sheet from journal entries.
-    Returns assets, liabilities and equity balances."""
+    Returns assets, liabilities and equity balances in ``currency`` (default base)."""
+    chart = _chart()
     # Build a dict of account balances
     balances = {}
-    for acc_code in chart_df['code']:
+    for acc_code in chart['code']:
         balances[acc_code] = 0.0
-    for entry in JOURNAL_ENTRIES:
-        balances[entry['debit_account']] += entry['amount']
-        balances[entry['credit_account']] -= entry['amount']
+    for account, value in _closed_balances(currency).items():
+        balances[account] = balances.get(account, 0.0) + value
+    for account, amount in _converted(currency):
+        balances[account] += amount
     assets = 0
     liabilities = 0
     equity = 0
     for acc_code, balance in balances.items():
-        row = chart_df[chart_df['code'] == acc_code]
+        row = chart[chart['code'] == acc_code]
         if row.empty:
             continue
         acc_type = row.iloc[0]['type']
@@ -129,17 +527,20 @@ def compute_balance_sheet():
         'equity': equity
     }
 
-def compute_cash_flow():
-    """Compute a very simple cash flow statement based on cash account."""
-    # Identify cash account code(s)
-    cash_accounts = chart_df[chart_df['name'].str.contains('Cash', case=False)]['code'].tolist()
-    cash_inflow = 0
-    cash_outflow = 0
-    for entry in JOURNAL_ENTRIES:
-        if entry['debit_account'] in cash_accounts:
-            cash_inflow += entry['amount']
-        if entry['credit_account'] in cash_accounts:
-            cash_outflow += entry['amount']
+def _day_converter(currency=None):
+    """Return ``convert(currency, day)`` for ``CashPosition``, or None if nothing converts."""
+    reporting = currency or BASE_CURRENCY
+    if FX_RATES.currencies == {reporting}:
+        return None
+    return lambda code, day: FX_RATES.factor(code or BASE_CURRENCY, day, reporting)
+
+@timed
+def compute_cash_flow(currency=None):
+    """Compute a very simple cash flow statement based on cash account.
+
+    Totals come from the per-day cash table, so only new postings are scanned.
+    Each day's flows are converted to ``currency`` at that day's rates."""
+    cash_inflow, cash_outflow = _cash_position().totals(_day_converter(currency))
     net_cash = cash_inflow - cash_outflow
     return {
         'cash_inflow': cash_inflow,
@@ -147,6 +548,80 @@ def compute_cash_flow():
         'net_cash': net_cash
     }
 
+_chart_derived = {}
+
+def _from_chart(build):
+    """Return ``build(chart)`` for the current chart, recomputed when the chart changes."""
+    chart = _chart()
+    key = _chart_version
+    cached = _chart_derived.get(build)
+    if cached is None or cached[0] != key:
+        cached = _chart_derived[build] = (key, build(chart))
+    return cached[1]
+
+def _build_account_tree(chart):
+    return AccountTree(chart.to_dict('records'))
+
+def _account_tree():
+    """Return the ``AccountTree`` for the current chart."""
+    return _from_chart(_build_account_tree)
+
+def _build_account_types(chart):
+    return dict(zip(chart['code'], chart['type']))
+
+def _build_account_codes(chart):
+    return {str(code): code for code in chart['code']}
+
+def _build_retained_earnings(chart):
+    rows = chart[chart['name'].str.contains('Retained Earnings', case=False)]
+    return None if rows.empty else rows['code'].tolist()[0]
+
+def _build_account_entities(chart):
+    if 'entity' not in chart.columns:
+        return {}
+    return {str(code): entity.strip() for code, entity in zip(chart['code'], chart['entity'])
+            if isinstance(entity, str) and entity.strip()}
+
+def _build_cash_codes(chart):
+    return frozenset(str(code) for code in chart[chart['name'].str.contains('Cash', case=False)]['code'])
+
+def _cash_position():
+    """Return ``CASH_POSITION`` brought up to date with the journal."""
+    CASH_POSITION.refresh(_from_chart(_build_cash_codes))
+    return CASH_POSITION
+
+@timed
+def compute_account_rollup(types, depth=None, signs=None, currency=None):
+    """Return the accounts of ``types`` as a tree of subtotals, ``depth`` levels deep.
+
+    Balances are debits minus credits in ``currency``, multiplied by
+    ``signs[type]`` if given.
+    """
+    tree = _account_tree()
+    balances = _closed_balances(currency)
+    for account, amount in _converted(currency):
+        balances[account] = balances.get(account, 0.0) + amount
+    return tree.nested(tree.rollup(balances), depth=depth, types=types, signs=signs)
+
+_pages = {}
+
+def _render_page(template):
+    """Serve a page template rendered once, revalidated with its ETag.
+
+    The page templates take no context and inline their CSS and scripts, so
+    one rendering serves every user.  Browsers keep the page but revalidate
+    it each visit (which still runs the login check) and get a 304 when it
+    is unchanged.  Pages are re-rendered per request in debug mode."""
+    cached = _pages.get(template)
+    if cached is None or app.debug:
+        html = render_template(template)
+        cached = _pages[template] = (html, hashlib.sha256(html.encode('utf-8')).hexdigest()[:20])
+    html, etag = cached
+    response = Response(html, mimetype='text/html')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
 def is_authenticated() -> bool:
     """Helper to check whether the current session has an authenticated user."""
     return 'username' in session
@@ -156,7 +631,7 @@ def home():
     """Landing page redirects to dashboard if logged in or login page otherwise."""
     if is_authenticated():
         return redirect(url_for('dashboard_page'))
-    return render_template('login.html')
+    return _render_page('login.html')
 
 @app.route("/login", methods=["POST"])
 def login():
@@ -164,11 +639,27 @@ def login():
     data = request.get_json() or request.form
     username = data.get("username")
     password = data.get("password")
+    allowed, retry_after = LOGIN_IP_THROTTLE.hit(request.remote_addr)
+    if allowed and isinstance(username, str):
+        allowed, retry_after = LOGIN_USER_THROTTLE.hit(username.strip().lower())
+    if not allowed:
+        response = jsonify({'status': 'fail', 'message': 'Too many login attempts'})
+        response.headers['Retry-After'] = str(int(retry_after) + 1)
+        return response, 429
     if username in USERS and USERS[username] == password:
         session['username'] = username
         return jsonify({'status': 'success', 'message': 'Login successful'})
     return jsonify({'status': 'fail', 'message': 'Invalid username or password'}), 401
 
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Expose request and function metrics in Prometheus text format.
+    If METRICS_TOKEN is set, scrapers must send it as a bearer token."""
+    token = os.environ.get("METRICS_TOKEN")
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return jsonify({'status': 'fail', 'message': 'Unauthorized'}), 401
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route("/logout", methods=["POST"])
 def logout():
     """Log out the current user."""
@@ -180,8 +671,9 @@ def accounts():
     """Return the list of accounts as JSON.  Requires authentication."""
     if not is_authenticated():
         return jsonify({'status': 'fail', 'message': 'Unauthorized'}), 401
+    chart = _chart()
     # Convert DataFrame to list of dicts for JSON response
-    accounts_list = chart_df.to_dict(orient='records')
+    accounts_list = chart.to_dict(orient='records')
     return jsonify(accounts_list)
 
 @app.route("/dashboard", methods=["GET"])
@@ -189,11 +681,12 @@ def dashboard_data():
     """Return aggregate dashboard metrics as JSON."""
     if not is_authenticated():
         return jsonify({'status': 'fail', 'message': 'Unauthorized'}), 401
+    chart = _chart()
     # Compute simple aggregates from the chart of accounts
-    total_accounts = len(chart_df)
-    asset_accounts = int((chart_df['type'] == 'Asset').sum())
-    liability_accounts = int((chart_df['type'] == 'Liability').sum())
-    equity_accounts = int((chart_df['type'] == 'Equity').sum())
+    total_accounts = len(chart)
+    asset_accounts = int((chart['type'] == 'Asset').sum())
+    liability_accounts = int((chart['type'] == 'Liability').sum())
+    equity_accounts = int((chart['type'] == 'Equity').sum())
     metrics = {
         'total_accounts': total_accounts,
         'asset_accounts': asset_accounts,
@@ -207,14 +700,14 @@ def dashboard_page():
     """Render the dashboard page.  Requires authentication."""
     if not is_authenticated():
         return redirect(url_for('home'))
-    return render_template('dashboard.html')
+    return _render_page('dashboard.html')
 
 @app.route("/accounts-page")
 def accounts_page():
     """Render the accounts page.  Requires authentication."""
     if not is_authenticated():
         return redirect(url_for('home'))
-    return render_template('accounts.html')
+    return _render_page('accounts.html')
 
 # ------------------- Customer Endpoints -------------------
 @app.route("/customers-page")
@@ -222,13 +715,13 @@ def customers_page():
     """Render the customers page. Requires authentication."""
     if not is_authenticated():
         return redirect(url_for('home'))
-    return render_template('customers.html')
+    return _render_page('customers.html')
 
 @app.route("/customers", methods=["GET", "POST"])
 def customers_api():
     """List or create customers.
     GET returns all customers for admin or the current user's customers.
-    POST creates a new customer."""
+    POST creates a new customer; ``currency`` is the one they are billed in."""
     current = _get_current_user()
     if not current:
         return jsonify({'status': 'fail', 'message': 'Unauthorized'}), 401
@@ -244,13 +737,18 @@ def customers_api():
     contact = data.get('contact')
     if not name:
         return jsonify({'status': 'fail', 'message': 'Name is required'}), 400
-    customer = {
-        'id': _generate_id(CUSTOMERS),
-        'name': name,
-        'contact': contact or '',
-        'owner': current['username']
-    }
-    CUSTOMERS.append(customer)
+    currency = _parse_currency(data.get('currency'))
+    if currency is None:
+        return _unknown_currency()
+    with _writing():
+        customer = Customer(
+            id=_generate_id(CUSTOMERS),
+            name=name,
+            contact=contact or '',
+            owner=current['username'],
+            currency=currency
+        )
+        CUSTOMERS.append(customer)
     return jsonify({'status': 'success', 'customer': customer})
 
 # ------------------- Vendor Endpoints -------------------
@@ -259,7 +757,7 @@ def vendors_page():
     """Render the vendors page. Requires authentication."""
     if not is_authenticated():
         return redirect(url_for('home'))
-    return render_template('vendors.html')
+    return _render_page('vendors.html')
 
 @app.route("/vendors", methods=["GET", "POST"])
 def vendors_api():
@@ -278,26 +776,62 @@ def vendors_api():
     contact = data.get('contact')
     if not name:
         return jsonify({'status': 'fail', 'message': 'Name is required'}), 400
-    vendor = {
-        'id': _generate_id(VENDORS),
-        'name': name,
-        'contact': contact or '',
-        'owner': current['username']
-    }
-    VENDORS.append(vendor)
+    currency = _parse_currency(data.get('currency'))
+    if currency is None:
+        return _unknown_currency()
+    with _writing():
+        vendor = Vendor(
+            id=_generate_id(VENDORS),
+            name=name,
+            contact=contact or '',
+            owner=current['username'],
+            currency=currency
+        )
+        VENDORS.append(vendor)
     return jsonify({'status': 'success', 'vendor': vendor})
 
+def _document_entry(control_account, total, items, sign, entity=None):
+    """Return the journal entry fields for an invoice (``sign=1``) or bill (``sign=-1``).
+
+    The control account (receivables or payables) takes ``sign * total`` and
+    each item's account the opposite, so the document posts as one compound
+    entry, booked by ``entity`` if given.  Returns None when there is no
+    control account or nothing to post; raises ``JournalError`` for an item
+    whose account is not in the chart or belongs to another entity."""
+    if control_account is None:
+        return None
+    signed = [(control_account, sign * total, None)]
+    signed += [(item.get('account'), -sign * float(item.get('amount', 0)), item.get('description'))
+               for item in items]
+    lines = []
+    for account, amount, description in signed:
+        if amount:
+            line = {'account': account, 'debit': max(amount, 0.0), 'credit': max(-amount, 0.0)}
+            if description:
+                line['description'] = description
+            lines.append(line)
+    if len(lines) < 2:
+        return None
+    fields = entry_fields(*balanced_lines(lines, _from_chart(_build_account_codes)))
+    if entity:
+        fields['entity'] = str(entity).strip()
+    _check_entity(fields)
+    return fields
+
 # ------------------- Invoice Endpoints -------------------
 @app.route("/invoices-page")
 def invoices_page():
     """Render the invoices page. Requires authentication."""
     if not is_authenticated():
         return redirect(url_for('home'))
-    return render_template('invoices.html')
+    return _render_page('invoices.html')
 
 @app.route("/invoices", methods=["GET", "POST"])
 def invoices_api():
-    """List or create invoices."""
+    """List or create invoices.
+
+    An invoice is in ``currency`` if given, else in the customer's currency,
+    and its journal entry is booked by ``entity`` if given."""
     current = _get_current_user()
     if not current:
         return jsonify({'status': 'fail', 'message': 'Unauthorized'}), 401
@@ -313,34 +847,41 @@ def invoices_api():
     items = data.get('items')  # expects a list of {description, account, amount}
     if not customer_id or not items:
         return jsonify({'status': 'fail', 'message': 'Customer and items required'}), 400
+    party = _party(CUSTOMERS, customer_id)
+    currency = _parse_currency(data.get('currency'), party.get('currency') if party else None)
+    if currency is None:
+        return _unknown_currency()
     total = 0
     for item in items:
         total += float(item.get('amount', 0))
-    invoice = {
-        'id': _generate_id(INVOICES),
-        'customer_id': int(customer_id),
-        'items': items,
-        'total': total,
-        'date': pd.Timestamp.today().strftime('%Y-%m-%d'),
-        'status': 'draft',
-        'owner': current['username']
-    }
-    INVOICES.append(invoice)
-    # Create a journal entry: debit Accounts Receivable, credit revenue accounts
     # Find AR account. If not present, skip JE.
     ar_account = None
-    ar_row = chart_df[chart_df['name'].str.contains('Accounts Receivable', case=False)]
+    chart = _chart()
+    ar_row = chart[chart['name'].str.contains('Accounts Receivable', case=False)]
     if not ar_row.empty:
         ar_account = ar_row.iloc[0]['code']
-    if ar_account:
-        for item in items:
-            credit_acc = item.get('account')
-            amt = float(item.get('amount', 0))
-            create_journal_entry(debit_account=ar_account,
-                                 credit_account=credit_acc,
-                                 amount=amt,
-                                 description=f"Invoice {invoice['id']} - {item.get('description')}",
-                                 user=current['username'])
+    try:
+        journal = _document_entry(ar_account, total, items, 1, data.get('entity'))
+    except JournalError as e:
+        return jsonify({'status': 'fail', 'message': f'Invalid items: {e}'}), 400
+    with _writing():
+        if journal is not None:
+            check_open(_latest_close(), datetime.now())
+        _check_rate(currency, date.today())
+        invoice = Invoice(
+            id=_generate_id(INVOICES),
+            customer_id=int(customer_id),
+            items=items,
+            total=total,
+            date=date.today().isoformat(),
+            status='draft',
+            owner=current['username'],
+            currency=currency
+        )
+        INVOICES.append(invoice)
+        # One compound journal entry: debit Accounts Receivable, credit revenue accounts
+        if journal is not None:
+            _post_entries([(journal, f"Invoice {invoice['id']}", currency, None)], current['username'])
     return jsonify({'status': 'success', 'invoice': invoice})
 
 # ------------------- Bill Endpoints -------------------
@@ -349,11 +890,14 @@ def bills_page():
     """Render the bills page. Requires authentication."""
     if not is_authenticated():
         return redirect(url_for('home'))
-    return render_template('bills.html')
+    return _render_page('bills.html')
 
 @app.route("/bills", methods=["GET", "POST"])
 def bills_api():
-    """List or create bills."""
+    """List or create bills.
+
+    A bill is in ``currency`` if given, else in the vendor's currency, and
+    its journal entry is booked by ``entity`` if given."""
     current = _get_current_user()
     if not current:
         return jsonify({'status': 'fail', 'message': 'Unauthorized'}), 401
@@ -367,33 +911,40 @@ def bills_api():
     items = data.get('items')
     if not vendor_id or not items:
         return jsonify({'status': 'fail', 'message': 'Vendor and items required'}), 400
+    party = _party(VENDORS, vendor_id)
+    currency = _parse_currency(data.get('currency'), party.get('currency') if party else None)
+    if currency is None:
+        return _unknown_currency()
     total = 0
     for item in items:
         total += float(item.get('amount', 0))
-    bill = {
-        'id': _generate_id(BILLS),
-        'vendor_id': int(vendor_id),
-        'items': items,
-        'total': total,
-        'date': pd.Timestamp.today().strftime('%Y-%m-%d'),
-        'status': 'draft',
-        'owner': current['username']
-    }
-    BILLS.append(bill)
-    # Create journal entry: debit expense accounts, credit Accounts Payable
     ap_account = None
-    ap_row = chart_df[chart_df['name'].str.contains('Accounts Payable', case=False)]
+    chart = _chart()
+    ap_row = chart[chart['name'].str.contains('Accounts Payable', case=False)]
     if not ap_row.empty:
         ap_account = ap_row.iloc[0]['code']
-    if ap_account:
-        for item in items:
-            debit_acc = item.get('account')
-            amt = float(item.get('amount', 0))
-            create_journal_entry(debit_account=debit_acc,
-                                 credit_account=ap_account,
-                                 amount=amt,
-                                 description=f"Bill {bill['id']} - {item.get('description')}",
-                                 user=current['username'])
+    try:
+        journal = _document_entry(ap_account, total, items, -1, data.get('entity'))
+    except JournalError as e:
+        return jsonify({'status': 'fail', 'message': f'Invalid items: {e}'}), 400
+    with _writing():
+        if journal is not None:
+            check_open(_latest_close(), datetime.now())
+        _check_rate(currency, date.today())
+        bill = Bill(
+            id=_generate_id(BILLS),
+            vendor_id=int(vendor_id),
+            items=items,
+            total=total,
+            date=date.today().isoformat(),
+            status='draft',
+            owner=current['username'],
+            currency=currency
+        )
+        BILLS.append(bill)
+        # One compound journal entry: debit expense accounts, credit Accounts Payable
+        if journal is not None:
+            _post_entries([(journal, f"Bill {bill['id']}", currency, None)], current['username'])
     return jsonify({'status': 'success', 'bill': bill})
 
 # ------------------- Statements Endpoints -------------------
@@ -402,31 +953,218 @@ def statements_page():
     """Render the statements page. Requires authentication."""
     if not is_authenticated():
         return redirect(url_for('home'))
-    return render_template('statements.html')
+    return _render_page('statements.html')
+
+def _statement(compute, types, signs=None):
+    """Respond with ``compute(currency)`` plus the nested account rollup when ``?depth=`` is given.
+
+    ``?currency=`` picks the reporting currency, the base currency by default."""
+    currency = _parse_currency(request.args.get('currency'))
+    if currency is None:
+        return _unknown_currency()
+    depth = request.args.get('depth')
+    levels = None
+    if depth is not None:
+        levels = None if depth == 'all' else (int(depth) if depth.isdigit() else 0)
+        if levels == 0:
+            return jsonify({'status': 'fail', 'message': 'depth must be a positive integer or "all"'}), 400
+    totals = compute(currency)
+    totals['currency'] = currency
+    if depth is not None:
+        totals['accounts'] = compute_account_rollup(types, depth=levels, signs=signs, currency=currency)
+    return jsonify(totals)
 
 @app.route("/statements/income", methods=["GET"])
 def income_statement():
-    """Return the income statement as JSON."""
+    """Return the income statement as JSON.
+
+    With ``?depth=N`` (or ``all``) the response also nests revenue and
+    expense accounts with subtotals, revenue shown as credits less debits."""
     current = _get_current_user()
     if not current:
         return jsonify({'status': 'fail', 'message': 'Unauthorized'}), 401
-    return jsonify(compute_income_statement())
+    return _statement(compute_income_statement, ('Revenue', 'Expense'), signs={'Revenue': -1})
 
 @app.route("/statements/balance", methods=["GET"])
 def balance_statement():
-    """Return the balance sheet as JSON."""
+    """Return the balance sheet as JSON.
+
+    With ``?depth=N`` (or ``all``) the response also nests asset, liability
+    and equity accounts with subtotals, signed like the totals."""
     current = _get_current_user()
     if not current:
         return jsonify({'status': 'fail', 'message': 'Unauthorized'}), 401
-    return jsonify(compute_balance_sheet())
+    return _statement(compute_balance_sheet, ('Asset', 'Liability', 'Equity'))
 
 @app.route("/statements/cashflow", methods=["GET"])
 def cashflow_statement():
-    """Return the cash flow statement as JSON."""
+    """Return the cash flow statement as JSON, in ``?currency=`` if given."""
+    current = _get_current_user()
+    if not current:
+        return jsonify({'status': 'fail', 'message': 'Unauthorized'}), 401
+    return _statement(compute_cash_flow, ())
+
+@timed
+def compute_tenant_statements(currency=None, workers=1):
+    """Return income statement, balance sheet and cash flow for every journal owner.
+
+    The journal is folded by owner in-process, or in a pool of ``workers``
+    processes from the command line; see portal/batch.py."""
+    close = _latest_close()
+    return batch.run(JOURNAL_ENTRIES, _from_chart(_build_account_types), _from_chart(_build_cash_codes),
+                     factors=JOURNAL_FX.factors(currency or BASE_CURRENCY),
+                     open_from=close['through_id'] if close else 0,
+                     carry=close['carry'] if close else (),
+                     workers=workers)
+
+@app.route("/statements/batch", methods=["GET"])
+def tenant_statements_batch():
+    """Return every owner's statements as NDJSON, one line per owner. Admin only.
+
+    ``?currency=`` picks the reporting currency.  The statements are folded
+    in this process; ``python -m portal.batch`` runs them on a process pool."""
+    current = _get_current_user()
+    if not current or current['role'] != 'admin':
+        return jsonify({'status': 'fail', 'message': 'Unauthorized'}), 401
+    currency = _parse_currency(request.args.get('currency'))
+    if currency is None:
+        return _unknown_currency()
+    results = compute_tenant_statements(currency)
+    body = ''.join(app.json.dumps({**result, 'currency': currency}) + '\n' for result in results)
+    return Response(body, mimetype='application/x-ndjson')
+
+@timed
+def compute_consolidated(currency=None, eliminations=None):
+    """Return per-entity and consolidated statements in ``currency`` (default base).
+
+    The latest close's entity balances and the open period's postings are
+    grouped by entity and account in one pass; ``eliminations`` (chart code
+    pairs, ``ELIMINATIONS`` by default) are removed from the consolidated
+    figures.  See portal/consolidation.py."""
+    reporting = currency or BASE_CURRENCY
+    if eliminations is None:
+        accounts = _from_chart(_build_account_codes)
+        eliminations = [(accounts.get(first, first), accounts.get(second, second))
+                        for first, second in ELIMINATIONS]
+    balances = {}
+    close = _latest_close()
+    if close is not None:
+        factor = FX_RATES.factor(BASE_CURRENCY, closed_before(close), reporting)
+        rows = close.get('entity_balances')
+        if rows is None:
+            rows = [(DEFAULT_ENTITY, account, value) for account, value in close['balances']]
+        for entity, account, value in rows:
+            balances.setdefault(entity, {})[account] = value * factor
+    group_balances(JOURNAL_ENTRIES, open_positions(JOURNAL_ENTRIES, close), JOURNAL_FX.factors(reporting),
+                   DEFAULT_ENTITY, balances)
+    return consolidate(balances, _from_chart(_build_account_types), eliminations)
+
+@app.route("/statements/consolidated", methods=["GET"])
+def consolidated_statement():
+    """Return each entity's statements and the consolidated statements as JSON.
+
+    ``?eliminations=1310:2310,...`` overrides the configured elimination
+    account pairs and ``?currency=`` picks the reporting currency."""
     current = _get_current_user()
     if not current:
         return jsonify({'status': 'fail', 'message': 'Unauthorized'}), 401
-    return jsonify(compute_cash_flow())
+    currency = _parse_currency(request.args.get('currency'))
+    if currency is None:
+        return _unknown_currency()
+    eliminations = None
+    if request.args.get('eliminations') is not None:
+        accounts = _from_chart(_build_account_codes)
+        try:
+            pairs = parse_pairs(request.args['eliminations'])
+        except ValueError:
+            pairs = None
+        if pairs is None or any(code not in accounts for pair in pairs for code in pair):
+            return jsonify({'status': 'fail',
+                            'message': 'eliminations must be pairs of chart account codes, e.g. 1310:2310'}), 400
+        eliminations = [(accounts[first], accounts[second]) for first, second in pairs]
+    return jsonify({'currency': currency, **compute_consolidated(currency, eliminations)})
+
+# ------------------- Aging Reports -------------------
+def _aging_response(report, parties, party_key):
+    """Build an aging report response from the ``as_of``, ``buckets`` and ``currency`` query parameters.
+
+    Open documents are converted at the ``as_of`` date's rates."""
+    current = _get_current_user()
+    if not current:
+        return jsonify({'status': 'fail', 'message': 'Unauthorized'}), 401
+    try:
+        as_of = date.fromisoformat(request.args['as_of']) if request.args.get('as_of') else date.today()
+        edges = parse_edges(request.args['buckets']) if request.args.get('buckets') else DEFAULT_EDGES
+    except ValueError:
+        return jsonify({'status': 'fail',
+                        'message': 'as_of must be YYYY-MM-DD and buckets increasing day counts, e.g. 30,60,90'}), 400
+    currency = _parse_currency(request.args.get('currency'))
+    if currency is None:
+        return _unknown_currency()
+    owner = None if current['role'] == 'admin' else current['username']
+    labels, party_ids, amounts = report.compute(as_of, edges, owner=owner, currency=currency)
+    rows = []
+    totals = [0.0] * len(labels)
+    for party_id, row in zip(party_ids, amounts):
+        rows.append({party_key: party_id, 'name': _party_name(parties, party_id),
+                     **dict(zip(labels, row)), 'total': sum(row)})
+        totals = [a + b for a, b in zip(totals, row)]
+    return jsonify({
+        'as_of': as_of.isoformat(),
+        'currency': currency,
+        'buckets': labels,
+        'rows': rows,
+        'totals': {**dict(zip(labels, totals)), 'total': sum(totals)},
+    })
+
+@app.route("/reports/ar-aging", methods=["GET"])
+@timed
+def ar_aging():
+    """Aged receivables: open invoices per customer by age in days.
+
+    ``as_of`` defaults to today and ``buckets`` to ``30,60,90``."""
+    return _aging_response(AR_AGING, CUSTOMERS, 'customer_id')
+
+@app.route("/reports/ap-aging", methods=["GET"])
+@timed
+def ap_aging():
+    """Aged payables: open bills per vendor by age in days.
+
+    ``as_of`` defaults to today and ``buckets`` to ``30,60,90``."""
+    return _aging_response(AP_AGING, VENDORS, 'vendor_id')
+
+@app.route("/statements/cash-position", methods=["GET"])
+@timed
+def cash_position():
+    """Return the daily net cash movement and running cash balance.
+
+    ``start`` and ``end`` (YYYY-MM-DD, inclusive) default to the 30 days
+    ending today.  The balance includes every posting before ``start``.
+    Amounts are in ``currency`` (default base), converted at each day's rates."""
+    current = _get_current_user()
+    if not current:
+        return jsonify({'status': 'fail', 'message': 'Unauthorized'}), 401
+    try:
+        end = date.fromisoformat(request.args['end']) if request.args.get('end') else date.today()
+        start = (date.fromisoformat(request.args['start']) if request.args.get('start')
+                 else end - timedelta(days=29))
+    except ValueError:
+        return jsonify({'status': 'fail', 'message': 'start and end must be YYYY-MM-DD'}), 400
+    if start > end or (end - start).days > 3660:
+        return jsonify({'status': 'fail', 'message': 'start must be before end, at most 10 years apart'}), 400
+    currency = _parse_currency(request.args.get('currency'))
+    if currency is None:
+        return _unknown_currency()
+    opening, rows = _cash_position().series(start, end, _day_converter(currency))
+    return jsonify({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'currency': currency,
+        'opening_balance': opening,
+        'days': [{'date': day.isoformat(), 'inflow': inflow, 'outflow': outflow,
+                  'net': inflow - outflow, 'balance': balance}
+                 for day, inflow, outflow, balance in rows],
+    })
 
 # ------------------- Bank Upload and Reconciliation Endpoints -------------------
 @app.route("/bank-page")
@@ -434,42 +1172,96 @@ def bank_page():
     """Render the bank reconciliation page. Requires authentication."""
     if not is_authenticated():
         return redirect(url_for('home'))
-    return render_template('bank.html')
+    return _render_page('bank.html')
+
+def _replayed_upload(owner, key, digest):
+    """Answer a retried bank upload with the response stored for its idempotency key."""
+    stored = BANK_FINGERPRINTS.replay(owner, key)
+    if stored[0] != digest:
+        return jsonify({'status': 'fail',
+                        'message': 'Idempotency-Key was already used for a different upload'}), 422
+    response = jsonify(stored[1])
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
 
 @app.route("/bank/upload", methods=["POST"])
 def upload_bank_statement():
-    """Upload bank transactions. Accepts a JSON list of transactions with date, amount, description."""
+    """Upload bank transactions. Accepts a JSON list of transactions with date, amount,
+    description and optionally currency and the bank's reference.
+
+    Rows already imported for this user are skipped and counted as
+    duplicates.  A retry carrying the same ``Idempotency-Key`` header gets
+    the original response back without being imported again."""
     current = _get_current_user()
     if not current:
         return jsonify({'status': 'fail', 'message': 'Unauthorized'}), 401
     data = request.get_json()
     if not isinstance(data, list):
         return jsonify({'status': 'fail', 'message': 'Expecting a JSON array of transactions'}), 400
-    for tx in data:
-        BANK_TRANSACTIONS.append({
-            'id': _generate_id(BANK_TRANSACTIONS),
-            'date': tx.get('date'),
-            'amount': float(tx.get('amount', 0)),
-            'description': tx.get('description', ''),
-            'owner': current['username']
-        })
-    return jsonify({'status': 'success', 'imported': len(data)})
+    owner = current['username']
+    key = request.headers.get('Idempotency-Key')
+    digest = request_digest(data) if key else None
+    if key and BANK_FINGERPRINTS.replay(owner, key) is not None:
+        return _replayed_upload(owner, key, digest)
+    currencies = [_parse_currency(tx.get('currency')) for tx in data]
+    if None in currencies:
+        return _unknown_currency()
+    for tx, currency in zip(data, currencies):
+        try:
+            _check_rate(currency, tx.get('date'))
+        except ValueError:
+            return jsonify({'status': 'fail', 'message': 'Foreign-currency rows need a YYYY-MM-DD date'}), 400
+    rows = [{'date': tx.get('date'),
+             'amount': float(tx.get('amount', 0)),
+             'description': tx.get('description', ''),
+             'reference': tx.get('reference') or '',
+             'currency': currency}
+            for tx, currency in zip(data, currencies)]
+    with _writing() as shared, _bank_lock:
+        if key and BANK_FINGERPRINTS.replay(owner, key) is not None:
+            # Another worker finished the same upload first.
+            return _replayed_upload(owner, key, digest)
+        new, duplicates = BANK_FINGERPRINTS.split(owner, rows)
+        for row in new:
+            BANK_TRANSACTIONS.append(BankTransaction(id=_generate_id(BANK_TRANSACTIONS), **row, owner=owner))
+        body = {'status': 'success', 'imported': len(new), 'duplicates': duplicates}
+        if key:
+            BANK_FINGERPRINTS.remember(owner, key, digest, body)
+            if shared is not None:
+                shared.publish('bank_idempotency', {'owner': owner, 'key': key, 'digest': digest,
+                                                    'response': body})
+    return jsonify(body)
+
+def _cash_movement(entry, cash_codes):
+    """Return what ``entry`` debits to ``cash_codes`` less what it credits them, or its amount if neither."""
+    movement = None
+    for account, amount in postings(entry):
+        if str(account) in cash_codes:
+            movement = (movement or 0.0) + amount
+    return entry['amount'] if movement is None else movement
 
 @app.route("/bank/reconcile", methods=["GET"])
+@timed
 def reconcile_bank():
-    """Return unmatched bank transactions and unmatched journal entries for reconciliation."""
+    """Return unmatched bank transactions and unmatched journal entries for reconciliation.
+
+    Bank amounts are signed: deposits positive, payments negative.  An entry
+    is compared by its cash movement (debits to cash accounts less credits),
+    or by its amount if it does not touch cash."""
     current = _get_current_user()
     if not current:
         return jsonify({'status': 'fail', 'message': 'Unauthorized'}), 401
     # Gather user-specific bank transactions and journal entries
     user_bank = [tx for tx in BANK_TRANSACTIONS if tx.get('owner') == current['username']]
     user_entries = [je for je in JOURNAL_ENTRIES if je.get('user') == current['username']]
+    cash_codes = _from_chart(_build_cash_codes)
+    movements = [_cash_movement(je, cash_codes) for je in user_entries]
     # Match by amount and description: simple matching
     matched_bank_ids = set()
     matched_entry_ids = set()
     for tx in user_bank:
-        for je in user_entries:
-            if je['amount'] == tx['amount'] and je['description'][:50] == tx['description'][:50]:
+        for je, movement in zip(user_entries, movements):
+            if movement == tx['amount'] and je['description'][:50] == tx['description'][:50]:
                 matched_bank_ids.add(tx['id'])
                 matched_entry_ids.add(je['id'])
     unmatched_bank = [tx for tx in user_bank if tx['id'] not in matched_bank_ids]
@@ -479,59 +1271,213 @@ def reconcile_bank():
         'unmatched_journal_entries': unmatched_entries
     })
 
+# ------------------- Search Endpoint -------------------
+@app.route("/search", methods=["GET"])
+@timed
+def search():
+    """Search customers, vendors, invoices, bills and journal descriptions.
+
+    ``q`` holds one or more words, each matched as a word prefix.  ``type``
+    optionally limits results to a comma separated list of kinds and
+    ``limit`` caps the number of results (default 20, at most 200).  Clients
+    only see their own records."""
+    current = _get_current_user()
+    if not current:
+        return jsonify({'status': 'fail', 'message': 'Unauthorized'}), 401
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'status': 'fail', 'message': 'Query is required'}), 400
+    kinds = None
+    if request.args.get('type'):
+        kinds = set(request.args['type'].split(','))
+        if not kinds <= SEARCH_STORES.keys():
+            return jsonify({'status': 'fail', 'message': 'Unknown type'}), 400
+    try:
+        limit = min(int(request.args.get('limit', 20)), 200)
+    except ValueError:
+        return jsonify({'status': 'fail', 'message': 'limit must be an integer'}), 400
+    owner = None if current['role'] == 'admin' else current['username']
+    matches = SEARCH.search(query, owner=owner, kinds=kinds, limit=limit)
+    return jsonify({'results': [
+        {'type': kind, 'id': record_id, 'record': SEARCH_STORES[kind][record_id - 1]}
+        for kind, record_id in matches
+    ]})
+
 # ------------------- Account Management and Journal Entry Endpoints -------------------
 @app.route("/accounts/add", methods=["POST"])
 def add_account():
-    """Add a new account to the chart of accounts. Admin only."""
+    """Add a new account to the chart of accounts. Admin only.
+
+    An optional ``entity`` reserves the account to that entity."""
     current = _get_current_user()
     if not current or current['role'] != 'admin':
         return jsonify({'status': 'fail', 'message': 'Unauthorized'}), 401
+    chart = _chart()
     data = request.get_json() or request.form
     code = data.get('code')
     name = data.get('name')
     acc_type = data.get('type')
     description = data.get('description', '')
+    entity = str(data.get('entity') or '').strip()
     if not code or not name or not acc_type:
         return jsonify({'status': 'fail', 'message': 'Code, name and type are required'}), 400
-    # Ensure code is unique
-    if code in chart_df['code'].values:
-        return jsonify({'status': 'fail', 'message': 'Account code already exists'}), 400
-    # Append the new account to chart_df in place. Because pandas DataFrame
-    # objects are mutable, we can assign to a new row without reassigning
-    # the global variable. This avoids the need for a global declaration.
-    chart_df.loc[len(chart_df)] = {
-        'code': code,
-        'name': name,
-        'type': acc_type,
-        'description': description
-    }
-    return jsonify({'status': 'success', 'account': {
-        'code': code,
-        'name': name,
-        'type': acc_type,
-        'description': description
-    }})
+    with _writing() as shared:
+        # Ensure code is unique
+        if code in chart['code'].values:
+            return jsonify({'status': 'fail', 'message': 'Account code already exists'}), 400
+        # Append the new account to chart_df in place. Because pandas DataFrame
+        # objects are mutable, we can assign to a new row without reassigning
+        # the global variable. This avoids the need for a global declaration.
+        account = {
+            'code': code,
+            'name': name,
+            'type': acc_type,
+            'description': description
+        }
+        if entity or 'entity' in chart.columns:
+            account['entity'] = entity
+        _apply_account(account)
+        if shared is not None:
+            shared.publish('accounts', account)
+    return jsonify({'status': 'success', 'account': account})
 
 @app.route("/journal/new", methods=["POST"])
 def new_journal_entry():
-    """Create a new journal entry. Admin only."""
+    """Create a new journal entry. Admin only.
+
+    Either ``debit_account``, ``credit_account`` and ``amount``, or
+    ``lines`` of ``{account, debit, credit}`` for a compound entry.  An
+    optional ``entity`` names the entity booking it.  Accounts must be in
+    the chart; see ``portal.ledger.build_entry``."""
     current = _get_current_user()
     if not current or current['role'] != 'admin':
         return jsonify({'status': 'fail', 'message': 'Unauthorized'}), 401
     data = request.get_json() or request.form
-    debit = data.get('debit_account')
-    credit = data.get('credit_account')
-    amount = data.get('amount')
-    description = data.get('description', '')
-    if not debit or not credit or not amount:
-        return jsonify({'status': 'fail', 'message': 'Debit, credit and amount required'}), 400
-    create_journal_entry(debit_account=debit,
-                         credit_account=credit,
-                         amount=float(amount),
-                         description=description,
-                         user=current['username'])
+    currency = _parse_currency(data.get('currency'))
+    if currency is None:
+        return _unknown_currency()
+    try:
+        _, fields, description, _ = build_entry(data, _from_chart(_build_account_codes))
+    except JournalError as e:
+        return jsonify({'status': 'fail', 'message': str(e)}), 400
+    _post_entries([(fields, description, currency, None)], current['username'])
     return jsonify({'status': 'success'})
 
+# Stop collecting problems in a rejected import after this many.
+MAX_IMPORT_ERRORS = 20
+
+@app.route("/journal/import", methods=["POST"])
+def import_journal():
+    """Append a batch of journal entries from CSV or NDJSON. Admin only.
+
+    The body is CSV when the Content-Type is ``text/csv`` and NDJSON
+    otherwise; see portal/ledger.py for both formats.  The whole batch is
+    validated first.  Any bad entry rejects it, listing the line numbers of
+    the problems, and nothing is appended."""
+    current = _get_current_user()
+    if not current or current['role'] != 'admin':
+        return jsonify({'status': 'fail', 'message': 'Unauthorized'}), 401
+    text = request.get_data(as_text=True)
+    try:
+        rows = parse_csv(text) if request.mimetype == 'text/csv' else parse_ndjson(text)
+    except JournalError as e:
+        return jsonify({'status': 'fail', 'message': str(e)}), 400
+    if not rows:
+        return jsonify({'status': 'fail', 'message': 'No journal entries in the request'}), 400
+    accounts = _from_chart(_build_account_codes)
+    close = _latest_close()
+    batch = []
+    errors = []
+    for number, raw in rows:
+        try:
+            day, fields, description, code = build_entry(raw, accounts)
+            if day is not None:
+                check_open(close, day)
+            _check_entity(fields)
+            currency = _parse_currency(code)
+            if currency is None:
+                raise JournalError(f'unknown currency {code}')
+            _check_rate(currency, day or datetime.now())
+        except (JournalError, MissingRate) as e:
+            errors.append({'line': number, 'message': str(e)})
+            if len(errors) >= MAX_IMPORT_ERRORS:
+                break
+            continue
+        batch.append((fields, description, currency, day))
+    if errors:
+        return jsonify({'status': 'fail', 'message': 'Import rejected; nothing was posted', 'errors': errors}), 400
+    ids = _post_entries(batch, current['username'])
+    return jsonify({'status': 'success', 'imported': len(ids), 'first_id': ids[0], 'last_id': ids[-1]})
+
+# ------------------- Period Close -------------------
+def _close_summary(close):
+    return {key: close[key] for key in ('id', 'before', 'through_id', 'net_income', 'retained_earnings',
+                                        'user', 'closed_at')}
+
+@app.route("/periods", methods=["GET"])
+def list_period_closes():
+    """List the period closes, oldest first. Admin only."""
+    current = _get_current_user()
+    if not current or current['role'] != 'admin':
+        return jsonify({'status': 'fail', 'message': 'Unauthorized'}), 401
+    return jsonify([_close_summary(close) for close in PERIOD_CLOSES])
+
+@app.route("/periods/close", methods=["POST"])
+def close_period_api():
+    """Close the books before ``before`` (YYYY-MM-DD). Admin only.
+
+    Entries dated earlier are folded into frozen per-account balances, their
+    net income moves to the ``retained_earnings`` account (by default the
+    chart's Retained Earnings account) and postings dated before ``before``
+    are refused from then on.  ``before`` must be later than the previous
+    close and no later than today."""
+    current = _get_current_user()
+    if not current or current['role'] != 'admin':
+        return jsonify({'status': 'fail', 'message': 'Unauthorized'}), 401
+    data = request.get_json(silent=True) or {}
+    try:
+        before = date.fromisoformat(str(data.get('before', '')))
+    except ValueError:
+        return jsonify({'status': 'fail', 'message': 'before must be YYYY-MM-DD'}), 400
+    if before > date.today():
+        return jsonify({'status': 'fail', 'message': 'Cannot close a period that has not ended'}), 400
+    types = _from_chart(_build_account_types)
+    retained = data.get('retained_earnings')
+    if retained is None:
+        retained = _from_chart(_build_retained_earnings)
+    else:
+        retained = _from_chart(_build_account_codes).get(str(retained))
+    if retained is None or types.get(retained) != 'Equity':
+        return jsonify({'status': 'fail', 'message': 'retained_earnings must be an Equity account'}), 400
+    with _writing(), _journal_lock:
+        previous = _latest_close()
+        if previous is not None and before <= closed_before(previous):
+            return jsonify({'status': 'fail',
+                            'message': f"The books are already closed before {previous['before']}"}), 409
+        balances, entity_balances, carry, net_income = close_period(
+            JOURNAL_ENTRIES, previous, before, types, retained, JOURNAL_FX.factors(BASE_CURRENCY),
+            default_entity=DEFAULT_ENTITY)
+        close = {
+            'id': _generate_id(PERIOD_CLOSES),
+            'before': before.isoformat(),
+            'through_id': len(JOURNAL_ENTRIES),
+            'carry': carry,
+            'balances': balances,
+            'entity_balances': entity_balances,
+            'net_income': net_income,
+            'retained_earnings': retained,
+            'user': current['username'],
+            'closed_at': datetime.now().isoformat(timespec='seconds')
+        }
+        if JOURNAL_LOG is not None:
+            JOURNAL_LOG.wait(JOURNAL_LOG.last_seq)
+            with open(os.path.join(JOURNAL_LOG.directory, 'closes.ndjson'), 'a', encoding='utf-8') as handle:
+                handle.write(json.dumps(close, default=str) + '\n')
+                handle.flush()
+                os.fsync(handle.fileno())
+        PERIOD_CLOSES.append(close)
+    return jsonify({'status': 'success', 'close': _close_summary(close)})
+
 
 if __name__ == '__main__':
     # When run directly, start the Flask development server.
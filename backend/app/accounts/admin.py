@@ -11,7 +11,8 @@ class CustomUserAdmin(BaseUserAdmin):
 
 @admin.register(Account)
 class AccountAdmin(admin.ModelAdmin):
-    list_display = ('code', 'name', 'type', 'description')
+    list_display = ('code', 'name', 'type', 'parent', 'description')
+    raw_id_fields = ('parent',)
     search_fields = ('code', 'name', 'type')
     list_filter = ('type',)
 
@@ -0,0 +1,42 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from app.accounts.provisioning import DEFAULT_WORKERS, parse_rows, provision_users
+
+
+class Command(BaseCommand):
+    help = 'Create users in bulk from a CSV or JSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with a header row, or a JSON list of users')
+        parser.add_argument('--format', choices=['csv', 'json'],
+                            help='File format (defaults to the file extension)')
+        parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                            help='Threads used to hash passwords')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.lower().endswith('.csv') else 'json')
+        if not os.path.exists(path):
+            raise CommandError(f"File not found: {path}")
+
+        with open(path, encoding='utf-8-sig', newline='') as handle:
+            try:
+                rows = parse_rows(handle.read(), fmt)
+            except ValueError as e:
+                raise CommandError(f"Could not parse {path}: {e}")
+
+        try:
+            result = provision_users(rows, workers=options['workers'])
+        except IntegrityError as e:
+            raise CommandError(f"Batch rolled back, a user was created concurrently: {e}")
+
+        for error in result.errors:
+            self.stdout.write(self.style.WARNING(
+                f"Row {error['row']} ({error.get('username') or '-'}): {error['error']}"
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(result.created)} users, {len(result.errors)} rows rejected."
+        ))
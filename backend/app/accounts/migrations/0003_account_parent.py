@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_account_alter_user_role_alter_user_two_factor_secret'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='children', to='accounts.account'),
+        ),
+    ]
@@ -23,6 +23,11 @@ class Account(models.Model):
     name = models.CharField(max_length=100)
     type = models.CharField(max_length=20, choices=ACCOUNT_TYPES)
     description = models.TextField(blank=True, null=True)
+    # Explicit parent in the chart hierarchy. When unset, reports nest the
+    # account by code prefix (1110 under 1100 under 1000).
+    parent = models.ForeignKey(
+        'self', on_delete=models.SET_NULL, blank=True, null=True, related_name='children'
+    )
 
     def __str__(self):
         return f"{self.code} - {self.name}"
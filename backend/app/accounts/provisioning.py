@@ -0,0 +1,134 @@
+"""Bulk user provisioning shared by the API and the management command.
+
+A batch is validated up front: required fields and roles per row, duplicates
+within the batch, and clashes with existing users using one query for all
+usernames and one for all emails. Passwords for the surviving rows are hashed
+on a thread pool (PBKDF2 releases the GIL) and the users are inserted with a
+single ``bulk_create`` inside one transaction.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Mapping
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.base_user import BaseUserManager
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+User = get_user_model()
+
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+
+
+@dataclass
+class ProvisioningResult:
+    """Outcome of a bulk provisioning run."""
+
+    created: List[Any] = field(default_factory=list)
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "created": len(self.created),
+            "usernames": [user.username for user in self.created],
+            "errors": self.errors,
+        }
+
+
+def parse_rows(content: str, fmt: str) -> List[Mapping[str, Any]]:
+    """Parse ``content`` as ``"csv"`` (with a header row) or ``"json"``.
+
+    JSON may be a list of objects or an object with a ``users`` list.
+    Raises ``ValueError`` if the payload has the wrong shape.
+    """
+
+    if fmt == "csv":
+        return list(csv.DictReader(io.StringIO(content)))
+    if fmt == "json":
+        data = json.loads(content)
+        if isinstance(data, dict):
+            data = data.get("users")
+        if not isinstance(data, list):
+            raise ValueError("Expected a JSON list of users or an object with a 'users' list.")
+        return data
+    raise ValueError(f"Unsupported format: {fmt}")
+
+
+def _clean(value: Any) -> str:
+    return value.strip() if isinstance(value, str) else ""
+
+
+def provision_users(rows: Iterable[Mapping[str, Any]], workers: int = DEFAULT_WORKERS) -> ProvisioningResult:
+    """Validate ``rows`` and create a user for every valid one.
+
+    Row numbers in ``errors`` are 1-based positions in ``rows``.
+    """
+
+    result = ProvisioningResult()
+    valid_roles = {choice[0] for choice in User.ROLE_CHOICES}
+    candidates = []
+    seen_usernames = set()
+    seen_emails = set()
+
+    for number, row in enumerate(rows, start=1):
+        if not isinstance(row, Mapping):
+            result.errors.append({"row": number, "error": "Row must be an object."})
+            continue
+        username = User.normalize_username(_clean(row.get("username")))
+        email = BaseUserManager.normalize_email(_clean(row.get("email")))
+        password = row.get("password") if isinstance(row.get("password"), str) else ""
+        role = (_clean(row.get("role")) or "owner").lower()
+
+        if not username or not email or not password:
+            error = "Username, email, and password are required."
+        elif role not in valid_roles:
+            error = "Role must be one of: owner, accountant."
+        elif username in seen_usernames:
+            error = "Duplicate username in batch."
+        elif email in seen_emails:
+            error = "Duplicate email in batch."
+        else:
+            error = None
+
+        if error:
+            result.errors.append({"row": number, "username": username, "error": error})
+            continue
+        seen_usernames.add(username)
+        seen_emails.add(email)
+        candidates.append((number, username, email, password, role))
+
+    taken_usernames = set(
+        User.objects.filter(username__in=seen_usernames).values_list("username", flat=True)
+    )
+    taken_emails = set(User.objects.filter(email__in=seen_emails).values_list("email", flat=True))
+
+    accepted = []
+    for number, username, email, password, role in candidates:
+        if username in taken_usernames:
+            result.errors.append({"row": number, "username": username, "error": "Username already exists."})
+        elif email in taken_emails:
+            result.errors.append({"row": number, "username": username, "error": "Email already exists."})
+        else:
+            accepted.append((username, email, password, role))
+    result.errors.sort(key=lambda error: error["row"])
+
+    if not accepted:
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        hashes = list(pool.map(make_password, [row[2] for row in accepted]))
+
+    users = [
+        User(username=username, email=email, role=role, password=hashed)
+        for (username, email, _password, role), hashed in zip(accepted, hashes)
+    ]
+    with transaction.atomic():
+        result.created = User.objects.bulk_create(users)
+    return result
@@ -0,0 +1,219 @@
+"""Per-request database cost accounting.
+
+``QueryStatsMiddleware`` counts the queries each request runs and their
+time, grouped by SQL shape (the statement with literals and ``IN`` lists
+collapsed). A shape executed at least ``QUERY_STATS_REPEAT_THRESHOLD`` times
+in one request is flagged as a likely N+1 pattern. Requests slower than
+``QUERY_STATS_SLOW_MS`` are logged with their most expensive shapes.
+
+Queries are captured by an execute wrapper installed once on each database
+connection. The wrapper reports to the request found in a context variable,
+so ORM calls made from ``sync_to_async`` threads under async views are
+attributed to the right request.
+
+Aggregates per view are kept in process memory and served to staff users by
+``views.query_stats``.
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+_IN_LIST = re.compile(r"\bIN \((?:%s, )*%s\)", re.IGNORECASE)
+_VALUES_LIST = re.compile(r"VALUES (?:\((?:%s, )*%s\), )*\((?:%s, )*%s\)", re.IGNORECASE)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+
+
+def sql_shape(sql: str) -> str:
+    """Return ``sql`` with parameters, literals and list lengths normalised."""
+
+    sql = _IN_LIST.sub("IN (...)", sql)
+    sql = _VALUES_LIST.sub("VALUES (...)", sql)
+    sql = _STRING.sub("?", sql)
+    return _NUMBER.sub("?", sql)
+
+
+@dataclass
+class RequestQueries:
+    """Queries captured while serving one request."""
+
+    count: int = 0
+    duration: float = 0.0
+    shapes: Dict[str, List[float]] = field(default_factory=lambda: defaultdict(lambda: [0, 0.0]))
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            shape = self.shapes[sql_shape(sql)]
+            shape[0] += 1
+            shape[1] += elapsed
+
+    def repeated(self, threshold: int) -> Dict[str, int]:
+        return {sql: int(count) for sql, (count, _) in self.shapes.items() if count >= threshold}
+
+    def top(self, limit: int = 5) -> List[Dict[str, Any]]:
+        ranked = sorted(self.shapes.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+        return [
+            {"sql": sql, "count": int(count), "ms": round(seconds * 1000, 3)}
+            for sql, (count, seconds) in ranked
+        ]
+
+
+class QueryStats:
+    """Thread-safe aggregates of ``RequestQueries`` keyed by view name."""
+
+    def __init__(self, max_shapes: int = 20) -> None:
+        self.max_shapes = max_shapes
+        self._views: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, view: str, queries: RequestQueries, elapsed: float, repeated: Dict[str, int], slow: bool) -> None:
+        with self._lock:
+            stats = self._views.setdefault(
+                view,
+                {
+                    "requests": 0,
+                    "queries": 0,
+                    "db_ms": 0.0,
+                    "total_ms": 0.0,
+                    "max_queries": 0,
+                    "slow_requests": 0,
+                    "n_plus_one_requests": 0,
+                    "repeated_shapes": {},
+                },
+            )
+            stats["requests"] += 1
+            stats["queries"] += queries.count
+            stats["db_ms"] += queries.duration * 1000
+            stats["total_ms"] += elapsed * 1000
+            stats["max_queries"] = max(stats["max_queries"], queries.count)
+            stats["slow_requests"] += int(slow)
+            if repeated:
+                stats["n_plus_one_requests"] += 1
+                shapes = stats["repeated_shapes"]
+                for sql, count in repeated.items():
+                    if sql in shapes or len(shapes) < self.max_shapes:
+                        shapes[sql] = max(shapes.get(sql, 0), count)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            result = {}
+            for view, stats in self._views.items():
+                requests = stats["requests"]
+                result[view] = {
+                    **stats,
+                    "db_ms": round(stats["db_ms"], 3),
+                    "total_ms": round(stats["total_ms"], 3),
+                    "avg_queries": round(stats["queries"] / requests, 2),
+                    "avg_db_ms": round(stats["db_ms"] / requests, 3),
+                    "repeated_shapes": dict(stats["repeated_shapes"]),
+                }
+            return result
+
+    def reset(self) -> None:
+        with self._lock:
+            self._views.clear()
+
+
+query_stats = QueryStats()
+
+_current_queries: ContextVar[Optional[RequestQueries]] = ContextVar("current_queries", default=None)
+
+
+def _dispatch(execute, sql, params, many, context):
+    queries = _current_queries.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    return queries(execute, sql, params, many, context)
+
+
+def install_wrapper(connection, **kwargs) -> None:
+    """Add the request dispatcher to ``connection`` unless it is already there."""
+
+    if _dispatch not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_dispatch)
+
+
+connection_created.connect(install_wrapper)
+
+
+class QueryStatsMiddleware:
+    """Count database queries per request; see the module docstring."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        for connection in connections.all(initialized_only=True):
+            install_wrapper(connection)
+        queries = RequestQueries()
+        token = _current_queries.set(queries)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_queries.reset(token)
+        self._finish(request, queries, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        queries = RequestQueries()
+        token = _current_queries.set(queries)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_queries.reset(token)
+        self._finish(request, queries, time.perf_counter() - started)
+        return response
+
+    def _finish(self, request, queries: RequestQueries, elapsed: float) -> None:
+        match = getattr(request, "resolver_match", None)
+        view = (match.view_name or match.route) if match else "<unresolved>"
+        threshold = getattr(settings, "QUERY_STATS_REPEAT_THRESHOLD", 5)
+        slow_ms: Optional[float] = getattr(settings, "QUERY_STATS_SLOW_MS", 500)
+        repeated = queries.repeated(threshold)
+        slow = slow_ms is not None and elapsed * 1000 >= slow_ms
+        query_stats.record(view, queries, elapsed, repeated, slow)
+
+        if slow:
+            logger.warning(
+                "Slow request %s %s (%s): %.1f ms, %d queries, %.1f ms in DB; top queries: %s",
+                request.method,
+                request.path,
+                view,
+                elapsed * 1000,
+                queries.count,
+                queries.duration * 1000,
+                queries.top(),
+            )
+        if repeated:
+            logger.info("Possible N+1 in %s: %s", view, repeated)
@@ -0,0 +1,39 @@
+"""Test helpers for the accounts app."""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+from typing import Iterator
+
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+from .querystats import sql_shape
+
+
+class QueryBudgetMixin:
+    """Mixin for ``TestCase`` classes that assert per-endpoint query budgets."""
+
+    @contextmanager
+    def assertQueryBudget(self, budget: int, using: str = "default", repeat_threshold: int = 5) -> Iterator[None]:
+        """Fail if the block runs more than ``budget`` queries or an N+1 pattern.
+
+        A statement shape repeated ``repeat_threshold`` times or more counts
+        as an N+1 pattern.
+        """
+
+        with CaptureQueriesContext(connections[using]) as captured:
+            yield
+        queries = [query["sql"] for query in captured.captured_queries]
+        if len(queries) > budget:
+            self.fail(
+                f"{len(queries)} queries executed, budget is {budget}:\n"
+                + "\n".join(f"{i}. {sql}" for i, sql in enumerate(queries, start=1))
+            )
+        shapes = {}
+        for sql in queries:
+            shape = sql_shape(sql)
+            shapes[shape] = shapes.get(shape, 0) + 1
+        repeated = {shape: count for shape, count in shapes.items() if count >= repeat_threshold}
+        if repeated:
+            self.fail(f"Repeated query shapes (possible N+1): {repeated}")
@@ -3,12 +3,31 @@
 from __future__ import annotations
 
 import base64
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
 
 import pyotp
+from asgiref.sync import async_to_sync
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from config.asgi import application as asgi_application
+
+from . import views
+from .querystats import QueryStatsMiddleware, query_stats, sql_shape
+from .testing import QueryBudgetMixin
 
 
 class AuthenticationTests(APITestCase):
@@ -18,6 +37,7 @@ class AuthenticationTests(APITestCase):
         self.profile_url = reverse("profile")
         self.generate_2fa_url = reverse("generate-2fa")
         self.password = "StrongPass123!"
+        cache.clear()
 
     def test_user_can_register_and_login_without_2fa(self) -> None:
         payload = {
@@ -90,3 +110,232 @@ class AuthenticationTests(APITestCase):
         self.assertIn("qr_code_base64", response.data)
         # Ensure the QR code is a valid base64 string.
         base64.b64decode(response.data["qr_code_base64"], validate=True)
+
+
+class LoginThrottleTests(APITestCase):
+    def setUp(self) -> None:
+        self.login_url = reverse("login")
+        self.password = "StrongPass123!"
+        cache.clear()
+
+    def _rates(self, **rates):
+        rest_framework = dict(settings.REST_FRAMEWORK)
+        rest_framework["DEFAULT_THROTTLE_RATES"] = {
+            "login_ip": "100/min",
+            "login_username": "100/min",
+            **rates,
+        }
+        return override_settings(REST_FRAMEWORK=rest_framework)
+
+    def test_username_bucket_rejects_before_password_check(self) -> None:
+        with self._rates(login_username="3/min"):
+            for _ in range(3):
+                response = self.client.post(
+                    self.login_url,
+                    {"username": "dave", "password": "wrong"},
+                    format="json",
+                )
+                self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+            with mock.patch("app.accounts.views.authenticate") as authenticate:
+                throttled = self.client.post(
+                    self.login_url,
+                    {"username": "DAVE", "password": "wrong"},
+                    format="json",
+                )
+            self.assertEqual(throttled.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            self.assertIn("Retry-After", throttled)
+            authenticate.assert_not_called()
+
+            other_user = self.client.post(
+                self.login_url,
+                {"username": "erin", "password": "wrong"},
+                format="json",
+            )
+            self.assertEqual(other_user.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_ip_bucket_covers_all_usernames(self) -> None:
+        with self._rates(login_ip="2/min"):
+            for name in ("frank", "grace"):
+                response = self.client.post(
+                    self.login_url,
+                    {"username": name, "password": "wrong"},
+                    format="json",
+                )
+                self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+            throttled = self.client.post(
+                self.login_url,
+                {"username": "heidi", "password": "wrong"},
+                format="json",
+            )
+            self.assertEqual(throttled.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_two_factor_token_cannot_be_replayed(self) -> None:
+        user = get_user_model().objects.create_user(
+            username="ivan",
+            email="ivan@example.com",
+            password=self.password,
+        )
+        user.two_factor_secret = pyotp.random_base32()
+        user.save(update_fields=["two_factor_secret"])
+        payload = {
+            "username": "ivan",
+            "password": self.password,
+            "token": pyotp.TOTP(user.two_factor_secret).now(),
+        }
+
+        first = self.client.post(self.login_url, payload, format="json")
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+
+        replay = self.client.post(self.login_url, payload, format="json")
+        self.assertEqual(replay.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(replay.data["error"], "2FA token already used.")
+
+
+class BulkProvisioningTests(APITestCase):
+    def setUp(self) -> None:
+        self.url = reverse("bulk-register")
+        admin = get_user_model().objects.create_user(
+            username="admin", email="admin@example.com", password="StrongPass123!", is_staff=True
+        )
+        get_user_model().objects.create_user(
+            username="existing", email="existing@example.com", password="StrongPass123!"
+        )
+        self.client.force_authenticate(admin)
+
+    def test_bulk_register_creates_valid_rows_and_reports_errors(self) -> None:
+        rows = [
+            {"username": "u1", "email": "u1@example.com", "password": "Secret123!"},
+            {"username": "u2", "email": "u2@example.com", "password": "Secret123!", "role": "accountant"},
+            {"username": "u1", "email": "other@example.com", "password": "Secret123!"},
+            {"username": "existing", "email": "new@example.com", "password": "Secret123!"},
+            {"username": "u3", "email": "existing@example.com", "password": "Secret123!"},
+            {"username": "u4", "email": "u4@example.com", "password": "Secret123!", "role": "boss"},
+            {"username": "u5", "email": "u5@example.com"},
+        ]
+        response = self.client.post(self.url, {"users": rows}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual([error["row"] for error in response.data["errors"]], [3, 4, 5, 6, 7])
+        u2 = get_user_model().objects.get(username="u2")
+        self.assertEqual(u2.role, "accountant")
+        self.assertTrue(u2.check_password("Secret123!"))
+
+    def test_bulk_register_accepts_csv_upload(self) -> None:
+        content = b"username,email,password\ncsv1,csv1@example.com,Secret123!\n"
+        upload = SimpleUploadedFile("users.csv", content, content_type="text/csv")
+        response = self.client.post(self.url, {"file": upload}, format="multipart")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["usernames"], ["csv1"])
+
+    def test_bulk_register_requires_staff(self) -> None:
+        self.client.force_authenticate(get_user_model().objects.get(username="existing"))
+        response = self.client.post(self.url, [], format="json")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_provision_users_command_reads_json(self) -> None:
+        rows = [
+            {"username": "cmd1", "email": "cmd1@example.com", "password": "Secret123!"},
+            {"username": "cmd2", "email": "", "password": "Secret123!"},
+        ]
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as handle:
+            json.dump(rows, handle)
+        self.addCleanup(os.unlink, handle.name)
+
+        out = StringIO()
+        call_command("provision_users", handle.name, stdout=out)
+
+        self.assertIn("Created 1 users, 1 rows rejected.", out.getvalue())
+        self.assertTrue(get_user_model().objects.filter(username="cmd1").exists())
+
+
+class AsyncReadPathTests(APITestCase):
+    def setUp(self) -> None:
+        self.factory = RequestFactory()
+        self.user = get_user_model().objects.create_user(
+            username="judy", email="judy@example.com", password="StrongPass123!"
+        )
+
+    def test_async_profile_matches_sync_profile(self) -> None:
+        access = str(RefreshToken.for_user(self.user).access_token)
+        request = self.factory.get("/api/profile/", HTTP_AUTHORIZATION=f"Bearer {access}")
+        response = async_to_sync(views.profile_async)(request)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = json.loads(response.content)
+        self.assertEqual(body["username"], "judy")
+        self.assertNotIn("two_factor_secret", body)
+
+    def test_async_profile_rejects_missing_and_bad_tokens(self) -> None:
+        for header in ({}, {"HTTP_AUTHORIZATION": "Bearer not-a-token"}):
+            response = async_to_sync(views.profile_async)(self.factory.get("/api/profile/", **header))
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+            self.assertIn("WWW-Authenticate", response)
+
+    def test_asgi_health_probe_skips_django(self) -> None:
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": b""}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {"type": "http", "path": "/healthz/", "query_string": b"", "method": "GET", "headers": []}
+        with mock.patch("config.asgi.django_application") as django_app:
+            async_to_sync(asgi_application)(scope, receive, send)
+        django_app.assert_not_called()
+        self.assertEqual(messages[0]["status"], 200)
+        self.assertEqual(json.loads(messages[1]["body"]), {"status": "ok"})
+
+
+class QueryStatsTests(QueryBudgetMixin, APITestCase):
+    def setUp(self) -> None:
+        query_stats.reset()
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            username="kim", email="kim@example.com", password="StrongPass123!"
+        )
+
+    def test_sql_shape_collapses_literals_and_in_lists(self) -> None:
+        self.assertEqual(
+            sql_shape("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'x' LIMIT 21"),
+            "SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?",
+        )
+
+    def test_middleware_flags_repeated_queries(self) -> None:
+        def n_plus_one(_request):
+            for pk in range(6):
+                list(get_user_model().objects.filter(pk=pk))
+            return HttpResponse()
+
+        QueryStatsMiddleware(n_plus_one)(RequestFactory().get("/"))
+        stats = query_stats.snapshot()["<unresolved>"]
+        self.assertEqual(stats["queries"], 6)
+        self.assertEqual(stats["n_plus_one_requests"], 1)
+        self.assertEqual(list(stats["repeated_shapes"].values()), [6])
+
+    def test_query_stats_endpoint_is_staff_only_and_aggregates_views(self) -> None:
+        self.client.post(reverse("login"), {"username": "kim", "password": "StrongPass123!"}, format="json")
+        url = reverse("query-stats")
+
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.user.is_staff = True
+        self.user.save(update_fields=["is_staff"])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["login"]["requests"], 1)
+        self.assertGreaterEqual(response.data["login"]["queries"], 1)
+
+    def test_endpoint_query_budgets(self) -> None:
+        with self.assertQueryBudget(2):
+            login = self.client.post(
+                reverse("login"), {"username": "kim", "password": "StrongPass123!"}, format="json"
+            )
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {login.data['access']}")
+        with self.assertQueryBudget(1):
+            self.client.get(reverse("profile"))
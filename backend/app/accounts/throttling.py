@@ -0,0 +1,122 @@
+"""Login throttles and one-time-password replay protection.
+
+The throttles run from DRF's ``initial()`` hook, before the view body, so a
+rejected request never reaches ``authenticate()`` and never pays for a
+password hash. Each throttle is a token bucket: ``"10/min"`` means a burst of
+ten requests that refills at ten tokens per minute.
+
+Bucket state lives in the Django cache named by ``settings.THROTTLE_CACHE``.
+The default local-memory cache keeps buckets per process; pointing the alias
+at a shared backend such as Redis makes the limits global across workers.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+import pyotp
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+_local_lock = threading.Lock()
+
+
+def _get_cache():
+    return caches[getattr(settings, "THROTTLE_CACHE", "default")]
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """Token bucket variant of DRF's ``SimpleRateThrottle``.
+
+    Subclasses set ``scope`` and implement ``get_cache_key``. Rates are read
+    from ``REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"]`` on every instantiation
+    so ``override_settings`` works in tests.
+    """
+
+    def get_rate(self) -> Optional[str]:
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+    def allow_request(self, request, view) -> bool:
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.cache = _get_cache()
+        capacity = float(self.num_requests)
+        refill_per_second = capacity / self.duration
+        now = self.timer()
+
+        # The lock makes the read-modify-write atomic within a process. With
+        # a shared cache two workers can still race on the same key, which at
+        # worst lets one extra request through.
+        with _local_lock:
+            tokens, updated_at = self.cache.get(self.key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * refill_per_second)
+            allowed = tokens >= 1.0
+            if allowed:
+                tokens -= 1.0
+            self.cache.set(self.key, (tokens, now), self.duration)
+
+        self._wait = 0.0 if allowed else (1.0 - tokens) / refill_per_second
+        return allowed
+
+    def wait(self) -> Optional[float]:
+        return self._wait or None
+
+
+class LoginIPThrottle(TokenBucketThrottle):
+    """Limit login attempts per client address."""
+
+    scope = "login_ip"
+
+    def get_cache_key(self, request, view) -> Optional[str]:
+        return self.cache_format % {"scope": self.scope, "ident": self.get_ident(request)}
+
+
+class LoginUsernameThrottle(TokenBucketThrottle):
+    """Limit login attempts per target username, whatever address they come from."""
+
+    scope = "login_username"
+
+    def get_cache_key(self, request, view) -> Optional[str]:
+        username = request.data.get("username")
+        if not username or not isinstance(username, str):
+            return None
+        return self.cache_format % {"scope": self.scope, "ident": username.strip().lower()}
+
+
+def _matched_timecode(totp: pyotp.TOTP, token: str, valid_window: int) -> Optional[int]:
+    """Return the TOTP time step ``token`` is valid for, or ``None``."""
+
+    now = datetime.now(timezone.utc)
+    for offset in range(-valid_window, valid_window + 1):
+        if pyotp.utils.strings_equal(token, totp.at(now, offset)):
+            return totp.timecode(now) + offset
+    return None
+
+
+def verify_totp_once(user, token: str, valid_window: int = 1) -> Tuple[bool, str]:
+    """Verify ``token`` for ``user`` and burn it so it cannot be replayed.
+
+    Returns ``(ok, reason)`` where ``reason`` is ``"invalid"`` or
+    ``"replayed"`` on failure. A code is remembered until it can no longer
+    fall inside the verification window.
+    """
+
+    totp = pyotp.TOTP(user.two_factor_secret)
+    timecode = _matched_timecode(totp, token, valid_window)
+    if timecode is None:
+        return False, "invalid"
+
+    ttl = totp.interval * (2 * valid_window + 1)
+    if not _get_cache().add(f"totp-used:{user.pk}:{timecode}", time.time(), ttl):
+        return False, "replayed"
+    return True, ""
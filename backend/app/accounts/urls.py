@@ -2,6 +2,7 @@
 
 from __future__ import annotations
 
+from django.conf import settings
 from django.urls import path
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
@@ -9,9 +10,15 @@ from . import views
 
 urlpatterns = [
     path("register/", views.register, name="register"),
+    path("register/bulk/", views.bulk_register, name="bulk-register"),
     path("login/", views.login_view, name="login"),
-    path("profile/", views.profile, name="profile"),
+    path(
+        "profile/",
+        views.profile_async if settings.ASYNC_READ_VIEWS else views.profile,
+        name="profile",
+    ),
     path("generate-2fa/", views.generate_2fa, name="generate-2fa"),
+    path("query-stats/", views.query_stats_view, name="query-stats"),
     path("token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
     path("token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
 ]
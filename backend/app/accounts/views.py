@@ -9,13 +9,23 @@ from typing import Dict
 import pyotp
 import qrcode
 from django.contrib.auth import authenticate, get_user_model
+from django.db import IntegrityError
+from django.http import JsonResponse
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.decorators import api_view, parser_classes, permission_classes, throttle_classes
+from rest_framework.parsers import JSONParser, MultiPartParser
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.response import Response
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
 
+from .provisioning import parse_rows, provision_users
+from .querystats import query_stats
 from .serializers import UserSerializer
+from .throttling import LoginIPThrottle, LoginUsernameThrottle, verify_totp_once
 
 User = get_user_model()
 
@@ -72,10 +82,49 @@ def register(request):
     return Response(serialized.data, status=status.HTTP_201_CREATED)
 
 
+@api_view(["POST"])
+@permission_classes([IsAdminUser])
+@parser_classes([JSONParser, MultiPartParser])
+def bulk_register(request):
+    """Create many users at once from a JSON body or an uploaded CSV/JSON file.
+
+    Valid rows are created and invalid rows are reported individually.
+    """
+
+    upload = request.FILES.get("file")
+    try:
+        if upload is not None:
+            fmt = "csv" if upload.name.lower().endswith(".csv") else "json"
+            rows = parse_rows(upload.read().decode("utf-8-sig"), fmt)
+        else:
+            data = request.data
+            rows = data.get("users") if isinstance(data, dict) else data
+            if not isinstance(rows, list):
+                raise ValueError("Expected a JSON list of users or an object with a 'users' list.")
+    except (UnicodeDecodeError, ValueError) as exc:
+        return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        result = provision_users(rows)
+    except IntegrityError:
+        return Response(
+            {"error": "A user in this batch was created concurrently; retry the batch."},
+            status=status.HTTP_409_CONFLICT,
+        )
+
+    code = status.HTTP_201_CREATED if result.created else status.HTTP_400_BAD_REQUEST
+    return Response(result.as_dict(), status=code)
+
+
 @api_view(["POST"])
 @permission_classes([AllowAny])
+@throttle_classes([LoginIPThrottle, LoginUsernameThrottle])
 def login_view(request):
-    """Authenticate a user and return JWT tokens."""
+    """Authenticate a user and return JWT tokens.
+
+    Throttled per client address and per username before the password is
+    checked; a 2FA code is accepted at most once.
+    """
 
     username = request.data.get("username")
     password = request.data.get("password")
@@ -99,9 +148,10 @@ def login_view(request):
                 status=status.HTTP_401_UNAUTHORIZED,
             )
 
-        totp = pyotp.TOTP(user.two_factor_secret)
-        if not totp.verify(token, valid_window=1):
-            return Response({"error": "Invalid 2FA token."}, status=status.HTTP_401_UNAUTHORIZED)
+        verified, reason = verify_totp_once(user, token, valid_window=1)
+        if not verified:
+            message = "2FA token already used." if reason == "replayed" else "Invalid 2FA token."
+            return Response({"error": message}, status=status.HTTP_401_UNAUTHORIZED)
 
     return Response(_issue_tokens(user), status=status.HTTP_200_OK)
 
@@ -117,6 +167,62 @@ def profile(request):
     return Response(data)
 
 
+async def _authenticate_jwt(request) -> User:
+    """Resolve the bearer token on ``request`` to a user using the async ORM.
+
+    Mirrors ``JWTAuthentication.authenticate`` without leaving the event loop;
+    raises ``AuthenticationFailed`` (or its ``InvalidToken`` subclass).
+    """
+
+    auth = JWTAuthentication()
+    header = auth.get_header(request)
+    raw_token = auth.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        raise AuthenticationFailed("Authentication credentials were not provided.")
+
+    validated_token = auth.get_validated_token(raw_token)
+    try:
+        user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+    except KeyError as exc:
+        raise AuthenticationFailed("Token contained no recognizable user identification") from exc
+
+    try:
+        user = await User.objects.aget(**{jwt_settings.USER_ID_FIELD: user_id})
+    except User.DoesNotExist as exc:
+        raise AuthenticationFailed("User not found") from exc
+
+    if jwt_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+        raise AuthenticationFailed("User is inactive")
+    if jwt_settings.CHECK_REVOKE_TOKEN and validated_token.get(
+        jwt_settings.REVOKE_TOKEN_CLAIM
+    ) != get_md5_hash_password(user.password):
+        raise AuthenticationFailed("The user's password has been changed.")
+    return user
+
+
+async def profile_async(request):
+    """Async twin of ``profile`` for ASGI deployments.
+
+    Served as ``profile/`` when ``settings.ASYNC_READ_VIEWS`` is enabled so
+    the request never leaves the event loop.
+    """
+
+    if request.method != "GET":
+        return JsonResponse({"detail": f'Method "{request.method}" not allowed.'}, status=405)
+
+    try:
+        user = await _authenticate_jwt(request)
+    except AuthenticationFailed as exc:
+        detail = exc.detail.get("detail", exc.detail) if isinstance(exc.detail, dict) else exc.detail
+        response = JsonResponse({"detail": str(detail)}, status=status.HTTP_401_UNAUTHORIZED)
+        response["WWW-Authenticate"] = JWTAuthentication().authenticate_header(request)
+        return response
+
+    data = UserSerializer(user).data
+    data.pop("two_factor_secret", None)
+    return JsonResponse(data)
+
+
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def generate_2fa(request):
@@ -146,3 +252,14 @@ def generate_2fa(request):
             "qr_code_base64": img_base64,
         }
     )
+
+
+@api_view(["GET", "DELETE"])
+@permission_classes([IsAdminUser])
+def query_stats_view(request):
+    """Return per-view database cost aggregates; ``DELETE`` resets them."""
+
+    if request.method == "DELETE":
+        query_stats.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    return Response(query_stats.snapshot())
@@ -0,0 +1,163 @@
+"""Compare in-process WSGI and ASGI throughput for the backend's read paths.
+
+The Django handlers are driven directly, without a network server, so the
+numbers isolate request handling (middleware, views, ORM) from socket and
+worker overhead. WSGI requests run on a thread pool; ASGI requests run as
+concurrent tasks on one event loop, which is how uvicorn workers serve them.
+
+    python benchmarks/wsgi_vs_asgi.py --requests 2000 --concurrency 32
+    python benchmarks/wsgi_vs_asgi.py --async-views   # serve profile/ async
+
+A throwaway SQLite database is used unless ``DATABASE_URL`` is set.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+from wsgiref.util import setup_testing_defaults
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+PATHS = ["/healthz/", "/healthz/?deep=1", "/api/profile/"]
+
+
+def _summarise(server: str, path: str, latencies: List[float], elapsed: float) -> Dict[str, object]:
+    ordered = sorted(latencies)
+    return {
+        "server": server,
+        "path": path,
+        "requests": len(ordered),
+        "rps": round(len(ordered) / elapsed, 1),
+        "p50_ms": round(statistics.median(ordered) * 1000, 3),
+        "p95_ms": round(ordered[int(len(ordered) * 0.95) - 1] * 1000, 3),
+    }
+
+
+def bench_wsgi(path: str, headers: Dict[str, str], total: int, concurrency: int) -> Dict[str, object]:
+    from config.wsgi import application
+
+    route, _, query = path.partition("?")
+
+    def one(_):
+        environ = {"PATH_INFO": route, "QUERY_STRING": query, "HTTP_HOST": "localhost", "wsgi.input": io.BytesIO()}
+        environ.update({f"HTTP_{name.upper()}": value for name, value in headers.items()})
+        setup_testing_defaults(environ)
+        started = time.perf_counter()
+        status_line: List[str] = []
+        body = application(environ, lambda status, _headers: status_line.append(status))
+        b"".join(body)
+        assert status_line[0].startswith("200"), status_line[0]
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(one, range(total)))
+    return _summarise("wsgi", path, latencies, time.perf_counter() - started)
+
+
+def bench_asgi(path: str, headers: Dict[str, str], total: int, concurrency: int) -> Dict[str, object]:
+    from config.asgi import application
+
+    route, _, query = path.partition("?")
+    raw_headers = [(b"host", b"localhost")] + [
+        (name.lower().encode(), value.encode()) for name, value in headers.items()
+    ]
+
+    async def one() -> float:
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": route, "raw_path": route.encode(), "query_string": query.encode(),
+            "headers": raw_headers, "server": ("localhost", 80), "client": ("127.0.0.1", 5000),
+        }
+        statuses: List[int] = []
+        body_sent = asyncio.Event()
+
+        async def receive():
+            if body_sent.is_set():
+                # Django listens for a disconnect until the response is done.
+                await asyncio.Future()
+            body_sent.set()
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                statuses.append(message["status"])
+
+        started = time.perf_counter()
+        await application(scope, receive, send)
+        assert statuses[0] == 200, statuses[0]
+        return time.perf_counter() - started
+
+    async def run() -> List[float]:
+        remaining = iter(range(total))
+        latencies: List[float] = []
+
+        async def worker():
+            for _ in remaining:
+                latencies.append(await one())
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return latencies
+
+    started = time.perf_counter()
+    latencies = asyncio.run(run())
+    return _summarise("asgi", path, latencies, time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1000, help="requests per path and server")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--async-views", action="store_true", help="set ASYNC_READ_VIEWS=1")
+    parser.add_argument("--json", dest="json_path", help="also write results to this file")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.TemporaryDirectory()
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{tmpdir.name}/bench.sqlite3")
+    os.environ["DEBUG"] = "False"
+    os.environ["ALLOWED_HOSTS"] = "localhost"
+    os.environ["ASYNC_READ_VIEWS"] = "1" if args.async_views else "0"
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+
+    import django
+    from django.core.management import call_command
+
+    django.setup()
+    call_command("migrate", verbosity=0)
+
+    from django.contrib.auth import get_user_model
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    user, _ = get_user_model().objects.get_or_create(username="bench", defaults={"email": "bench@example.com"})
+    headers = {"authorization": f"Bearer {RefreshToken.for_user(user).access_token}"}
+
+    results = []
+    for path in PATHS:
+        for bench in (bench_wsgi, bench_asgi):
+            bench(path, headers, min(50, args.requests), args.concurrency)  # warm up
+            results.append(bench(path, headers, args.requests, args.concurrency))
+
+    print(f"{'server':<6} {'path':<20} {'req/s':>10} {'p50 ms':>9} {'p95 ms':>9}")
+    for row in results:
+        print(f"{row['server']:<6} {row['path']:<20} {row['rps']:>10} {row['p50_ms']:>9} {row['p95_ms']:>9}")
+    if args.json_path:
+        meta = {"async_views": args.async_views, "concurrency": args.concurrency}
+        Path(args.json_path).write_text(json.dumps({"meta": meta, "results": results}, indent=2))
+    tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
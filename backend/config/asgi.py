@@ -1,5 +1,33 @@
+"""ASGI entrypoint for the Pretium Investment backend.
+
+Health probes are answered here, ahead of Django's middleware stack, so
+platform checks stay cheap under load. Append ``?deep=1`` to route a probe
+through Django instead.
+"""
+
 import os
+
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
-application = get_asgi_application()
\ No newline at end of file
+django_application = get_asgi_application()
+
+HEALTH_PATHS = frozenset({'/healthz', '/healthz/'})
+_HEALTH_BODY = b'{"status": "ok"}'
+_HEALTH_HEADERS = [
+    (b'content-type', b'application/json'),
+    (b'content-length', str(len(_HEALTH_BODY)).encode()),
+    (b'cache-control', b'no-store'),
+]
+
+
+async def application(scope, receive, send):
+    if (
+        scope['type'] == 'http'
+        and scope['path'] in HEALTH_PATHS
+        and b'deep=1' not in scope.get('query_string', b'')
+    ):
+        await send({'type': 'http.response.start', 'status': 200, 'headers': _HEALTH_HEADERS})
+        await send({'type': 'http.response.body', 'body': _HEALTH_BODY})
+        return
+    await django_application(scope, receive, send)
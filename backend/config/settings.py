@@ -48,6 +48,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "app.accounts.querystats.QueryStatsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -57,6 +58,12 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# Query accounting (see app/accounts/querystats.py): requests slower than
+# QUERY_STATS_SLOW_MS are logged, and an SQL shape repeated this many times in
+# one request is reported as a possible N+1.
+QUERY_STATS_SLOW_MS = float(os.getenv("QUERY_STATS_SLOW_MS", "500"))
+QUERY_STATS_REPEAT_THRESHOLD = int(os.getenv("QUERY_STATS_REPEAT_THRESHOLD", "5"))
+
 ROOT_URLCONF = "config.urls"
 
 TEMPLATES = [
@@ -78,12 +85,36 @@ TEMPLATES = [
 WSGI_APPLICATION = "config.wsgi.application"
 ASGI_APPLICATION = "config.asgi.application"
 
+# Serve read-only endpoints (currently ``/api/profile/``) from native async
+# views. Enable for ASGI deployments; under WSGI the sync views are cheaper.
+ASYNC_READ_VIEWS = os.getenv("ASYNC_READ_VIEWS", "False").lower() in {"1", "true", "yes", "on"}
+
 # Database
+# DB_CONN_MAX_AGE keeps connections open between requests. Under ASGI each
+# request may run its ORM calls on a different thread, so persistent
+# connections are not reused; set DB_POOL=1 instead to use Django's built-in
+# PostgreSQL pool (requires ``psycopg[pool]``, i.e. psycopg 3).
 _db_url = os.getenv("DATABASE_URL")
+_db_conn_max_age = int(os.getenv("DB_CONN_MAX_AGE", "600"))
+_db_pool = os.getenv("DB_POOL", "False").lower() in {"1", "true", "yes", "on"}
 if _db_url:
     DATABASES = {
-        "default": dj_database_url.parse(_db_url, conn_max_age=600, ssl_require=False)
+        "default": dj_database_url.parse(
+            _db_url,
+            conn_max_age=_db_conn_max_age,
+            conn_health_checks=_db_conn_max_age > 0,
+            ssl_require=False,
+        )
     }
+    if _db_pool and DATABASES["default"]["ENGINE"] == "django.db.backends.postgresql":
+        # Pooling and persistent connections are mutually exclusive.
+        DATABASES["default"]["CONN_MAX_AGE"] = 0
+        DATABASES["default"]["CONN_HEALTH_CHECKS"] = False
+        DATABASES["default"].setdefault("OPTIONS", {})["pool"] = {
+            "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+            "max_size": int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+            "timeout": int(os.getenv("DB_POOL_TIMEOUT", "10")),
+        }
 else:
     DATABASES = {
         "default": {
@@ -92,6 +123,21 @@ else:
         }
     }
 
+# Caches. Login throttles and the 2FA replay cache use the alias named by
+# THROTTLE_CACHE; set THROTTLE_REDIS_URL to share them across workers.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+_throttle_redis_url = os.getenv("THROTTLE_REDIS_URL")
+if _throttle_redis_url:
+    CACHES["throttle"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": _throttle_redis_url,
+    }
+THROTTLE_CACHE = "throttle" if _throttle_redis_url else "default"
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -132,6 +178,11 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticated",
     ),
+    # Token bucket rates for the login throttles: burst size / refill period.
+    "DEFAULT_THROTTLE_RATES": {
+        "login_ip": os.getenv("LOGIN_THROTTLE_IP_RATE", "30/min"),
+        "login_username": os.getenv("LOGIN_THROTTLE_USERNAME_RATE", "10/min"),
+    },
 }
 
 # JWT Authentication settings
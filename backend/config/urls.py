@@ -7,8 +7,13 @@ from django.http import JsonResponse
 from django.urls import include, path
 
 
-def healthcheck(_request):
-    """Simple health endpoint used by deployment platforms."""
+async def healthcheck(_request):
+    """Simple health endpoint used by deployment platforms.
+
+    Under ASGI, ``config.asgi`` answers ``/healthz`` before Django is
+    entered; this view serves WSGI deployments and ``?deep=1`` probes that
+    should exercise the full stack.
+    """
     return JsonResponse({"status": "ok"})
 
 
@@ -4,7 +4,6 @@ from __future__ import annotations
 
 import os
 
-from django.core.asgi import get_asgi_application
-
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
-app = get_asgi_application()
+
+from config.asgi import application as app
@@ -0,0 +1,345 @@
+"""Microbenchmarks for the portal's ledger and reporting functions.
+
+Each case runs against a synthetic chart of accounts and journal installed
+into the ``app`` module's in-memory stores, and records wall time (best of
+``--repeat`` runs) plus peak Python memory (one extra run under
+``tracemalloc``).  Results can be saved as a JSON baseline and compared with
+a later run to spot regressions:
+
+    python benchmarks/ledger_bench.py --save benchmarks/baselines/main.json
+    python benchmarks/ledger_bench.py --compare benchmarks/baselines/main.json
+
+Sizes grow until a case exceeds ``--budget`` seconds; larger sizes of that
+case are then reported as skipped rather than left to run for hours.
+"""
+
+import argparse
+import atexit
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import pandas as pd
+
+import app as portal
+from portal.journal_log import JournalLog
+from portal.search import SearchIndex
+from portal.synthetic import make_chart
+
+BENCH_USER = 'bench'
+
+
+def make_entries(n_entries, codes, seed=0):
+    """Return ``n_entries`` journal entries between random accounts in ``codes``."""
+    rng = random.Random(seed)
+    today = pd.Timestamp.today()
+    return [{
+        'id': i + 1,
+        'date': today,
+        'debit_account': rng.choice(codes),
+        'credit_account': rng.choice(codes),
+        'amount': round(rng.uniform(1, 5000), 2),
+        'description': f'Entry {i + 1}',
+        'user': BENCH_USER,
+    } for i in range(n_entries)]
+
+
+def make_bank(entries, seed=0):
+    """Return bank lines matching roughly half of ``entries``."""
+    rng = random.Random(seed)
+    bank = []
+    for entry in entries:
+        matched = rng.random() < 0.5
+        bank.append({
+            'id': len(bank) + 1,
+            'date': None,
+            'amount': entry['amount'] if matched else round(rng.uniform(1, 5000), 2),
+            'description': entry['description'] if matched else f'Deposit {len(bank) + 1}',
+            'owner': BENCH_USER,
+        })
+    return bank
+
+
+def install(chart, entries, bank=()):
+    """Point the portal's module-level stores at the synthetic data."""
+    portal._set_chart(chart)
+    portal.JOURNAL_ENTRIES[:] = entries
+    portal.BANK_TRANSACTIONS[:] = bank
+
+
+def _client():
+    client = portal.app.test_client()
+    with client.session_transaction() as sess:
+        sess['username'] = BENCH_USER
+    return client
+
+
+def case_create_journal_entry(chart, entries):
+    install(chart, [])
+    pairs = [(e['debit_account'], e['credit_account'], e['amount']) for e in entries]
+
+    def run():
+        portal.JOURNAL_ENTRIES.clear()
+        for debit, credit, amount in pairs:
+            portal.create_journal_entry(debit, credit, amount, 'bench', BENCH_USER)
+    return run
+
+
+def _log_directory():
+    directory = tempfile.mkdtemp(prefix='ledger-bench-')
+    atexit.register(shutil.rmtree, directory, True)
+    return directory
+
+
+def case_logged_posting(chart, entries, writers=8):
+    """Post ``entries`` from ``writers`` threads through the journal log."""
+    install(chart, [])
+    pairs = [(e['debit_account'], e['credit_account'], e['amount']) for e in entries]
+    chunks = [pairs[i::writers] for i in range(writers)]
+
+    def post(chunk):
+        for debit, credit, amount in chunk:
+            portal.create_journal_entry(debit, credit, amount, 'bench', BENCH_USER)
+
+    def run():
+        portal.JOURNAL_ENTRIES.clear()
+        log = portal.JOURNAL_LOG = JournalLog(_log_directory())
+        log.recover()
+        try:
+            threads = [threading.Thread(target=post, args=(chunk,)) for chunk in chunks]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            log.wait(log.last_seq)
+        finally:
+            log.close()
+            portal.JOURNAL_LOG = None
+    return run
+
+
+def case_journal_recover(chart, entries):
+    """Restart from a snapshot taken at the last 1000 postings."""
+    directory = _log_directory()
+    log = JournalLog(directory)
+    log.recover()
+    head = max(len(entries) - 1000, 0)
+    for entry in entries[:head]:
+        log.append(entry)
+    log.begin_checkpoint(entries)()
+    for entry in entries[head:]:
+        log.append(entry)
+    log.close()
+
+    def run():
+        restarted = JournalLog(directory)
+        assert len(restarted.recover()) == len(entries)
+        restarted.close()
+    return run
+
+
+def case_income_statement(chart, entries):
+    install(chart, entries)
+    return portal.compute_income_statement
+
+
+def case_balance_sheet(chart, entries):
+    install(chart, entries)
+    return portal.compute_balance_sheet
+
+
+def case_cash_flow(chart, entries):
+    install(chart, entries)
+    return portal.compute_cash_flow
+
+
+def case_reconcile_bank(chart, entries):
+    install(chart, entries, make_bank(entries))
+    client = _client()
+
+    def run():
+        response = client.get('/bank/reconcile')
+        assert response.status_code == 200
+    return run
+
+
+def case_search(chart, entries):
+    """Prefix query against a warm index over the journal."""
+    install(chart, entries)
+    portal.SEARCH = SearchIndex(portal.SEARCH.sources)
+    portal.SEARCH.refresh()
+    needle = entries[len(entries) // 2]['description'].lower()[:-1]
+
+    def run():
+        assert portal.SEARCH.search(needle, owner=BENCH_USER, limit=20)
+    return run
+
+
+def case_accounts_json(chart, entries):
+    install(chart, [])
+    client = _client()
+
+    def run():
+        response = client.get('/accounts')
+        assert response.status_code == 200
+    return run
+
+
+# name -> (setup, whether the case scales with entries, accounts, or both)
+CASES = {
+    'create_journal_entry': (case_create_journal_entry, 'entries'),
+    'logged_posting': (case_logged_posting, 'entries'),
+    'journal_recover': (case_journal_recover, 'entries'),
+    'compute_income_statement': (case_income_statement, 'both'),
+    'compute_balance_sheet': (case_balance_sheet, 'both'),
+    'compute_cash_flow': (case_cash_flow, 'both'),
+    'reconcile_bank': (case_reconcile_bank, 'entries'),
+    'search': (case_search, 'entries'),
+    'accounts_json': (case_accounts_json, 'accounts'),
+}
+
+
+def measure(run, repeat):
+    """Return ``(best_seconds, peak_bytes)`` for ``run``."""
+    best = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - started)
+    gc.collect()
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def grid(scales, entry_sizes, account_sizes):
+    if scales == 'entries':
+        return [(n, account_sizes[0]) for n in entry_sizes]
+    if scales == 'accounts':
+        return [(entry_sizes[0], a) for a in account_sizes]
+    return [(n, a) for a in account_sizes for n in entry_sizes]
+
+
+def run_suite(cases, entry_sizes, account_sizes, repeat, budget, seed):
+    results = []
+    charts = {}
+    ledgers = {}
+    for name in cases:
+        setup, scales = CASES[name]
+        over_budget = []
+        for n_entries, n_accounts in grid(scales, entry_sizes, account_sizes):
+            row = {'case': name, 'entries': n_entries, 'accounts': n_accounts}
+            if any(n_entries >= e and n_accounts >= a for e, a in over_budget):
+                results.append({**row, 'skipped': True})
+                print(f'{name:<26} {n_entries:>9} {n_accounts:>6}   skipped (over budget)')
+                continue
+            if n_accounts not in charts:
+                charts[n_accounts] = make_chart(n_accounts)
+            key = (n_entries, n_accounts)
+            if key not in ledgers:
+                ledgers[key] = make_entries(n_entries, charts[n_accounts]['code'].tolist(), seed)
+            run = setup(charts[n_accounts], ledgers[key])
+            seconds, peak = measure(run, repeat)
+            results.append({**row, 'seconds': seconds, 'peak_bytes': peak})
+            print(f'{name:<26} {n_entries:>9} {n_accounts:>6} {seconds * 1000:>12.2f} ms {peak / 1e6:>9.2f} MB')
+            if seconds > budget:
+                over_budget.append((n_entries, n_accounts))
+        ledgers.clear()
+    return results
+
+
+def compare(results, baseline_path, threshold):
+    """Print the ratio of each case to the baseline.  Returns the regressions."""
+    with open(baseline_path) as handle:
+        baseline = json.load(handle)
+    previous = {(r['case'], r['entries'], r['accounts']): r
+                for r in baseline['results'] if not r.get('skipped')}
+    regressions = []
+    print(f"\n{'case':<26} {'entries':>9} {'accounts':>8} {'time x':>8} {'memory x':>9}")
+    for row in results:
+        old = previous.get((row['case'], row['entries'], row['accounts']))
+        if row.get('skipped') or old is None:
+            continue
+        time_ratio = row['seconds'] / old['seconds'] if old['seconds'] else float('inf')
+        mem_ratio = row['peak_bytes'] / old['peak_bytes'] if old['peak_bytes'] else float('inf')
+        flag = ''
+        if time_ratio > 1 + threshold or mem_ratio > 1 + threshold:
+            regressions.append(row)
+            flag = '  REGRESSION'
+        print(f"{row['case']:<26} {row['entries']:>9} {row['accounts']:>8} "
+              f"{time_ratio:>8.2f} {mem_ratio:>9.2f}{flag}")
+    return regressions
+
+
+def _sizes(text):
+    return [int(float(part)) for part in text.split(',')]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the portal ledger functions.')
+    parser.add_argument('--cases', default=','.join(CASES),
+                        help='comma separated subset of: ' + ', '.join(CASES))
+    parser.add_argument('--entries', type=_sizes, default=[1000, 10000, 100000, 1000000],
+                        help='journal sizes, e.g. 1e3,1e4,1e5,1e6')
+    parser.add_argument('--accounts', type=_sizes, default=[50, 500, 5000],
+                        help='chart sizes, e.g. 50,500,5000')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--budget', type=float, default=30.0,
+                        help='skip larger sizes of a case once a run takes longer than this')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help='write results to this JSON file')
+    parser.add_argument('--compare', help='compare against a saved JSON baseline')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative slowdown reported as a regression')
+    args = parser.parse_args(argv)
+
+    cases = [name.strip() for name in args.cases.split(',') if name.strip()]
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(sorted(unknown))}")
+
+    print(f"{'case':<26} {'entries':>9} {'accounts':>6} {'time':>15} {'peak':>12}")
+    results = run_suite(cases, sorted(args.entries), sorted(args.accounts),
+                        args.repeat, args.budget, args.seed)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w') as handle:
+            json.dump({
+                'meta': {
+                    'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                    'python': platform.python_version(),
+                    'machine': platform.machine(),
+                    'repeat': args.repeat,
+                    'seed': args.seed,
+                },
+                'results': results,
+            }, handle, indent=2)
+        print(f'\nSaved {len(results)} results to {args.save}')
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            print(f'\n{len(regressions)} case(s) regressed by more than {args.threshold:.0%}')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,508 @@
+"""Concurrent load driver for the Flask portal and the Django API.
+
+Virtual users, one per thread, log in and then issue a weighted mix of
+requests until ``--duration`` seconds have passed or ``--requests`` requests
+have been sent.  Per endpoint the driver reports throughput and
+p50/p95/p99 latency, and it can save the results as JSON and compare a run
+with a saved baseline, exiting 1 when an endpoint regressed:
+
+    python benchmarks/load_test.py flask --concurrency 16 --duration 20
+    python benchmarks/load_test.py django --concurrency 8 --save benchmarks/baselines/load-django.json
+    python benchmarks/load_test.py flask --launch --workers 4 --compare benchmarks/baselines/load-flask.json
+
+Requests go to one of three places:
+
+* in process (the default): the Flask test client or Django's test client,
+  which measures request handling without sockets;
+* ``--launch``: a gunicorn server started on a free local port for the run;
+* ``--url``: a server you started yourself.
+
+The Flask portal is loaded with a synthetic dataset (``portal.synthetic``)
+whose owners are the virtual users; start your own server with the same
+``PORTAL_DATA_DIR`` when using ``--url``.  Django users, including the 2FA
+users, are created through the ORM in the database named by
+``DATABASE_URL`` (a throwaway SQLite file unless it is set), so with
+``--url`` point ``DATABASE_URL`` at the server's database.
+
+Login throttles are raised for the run so they do not dominate the numbers.
+"""
+
+import argparse
+import http.cookiejar
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(ROOT, 'backend')
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+UNTHROTTLED = {'LOGIN_THROTTLE_IP_RATE': '1000000/s', 'LOGIN_THROTTLE_USERNAME_RATE': '1000000/s'}
+PASSWORD = 'LoadTest123!'
+
+
+# ------------------- Clients -------------------
+class Client:
+    """``call`` returns ``(status, body)`` and leaves its duration in ``elapsed``.
+
+    Only the request itself is timed, not the work an operation does around it.
+    """
+
+    elapsed = 0.0
+
+    def call(self, method, path, body=None, headers=None):
+        started = time.perf_counter()
+        try:
+            return self.send(method, path, body, headers)
+        finally:
+            self.elapsed = time.perf_counter() - started
+
+
+class HttpClient(Client):
+    """Minimal JSON client over urllib that keeps cookies per virtual user."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def send(self, method, path, body, headers):
+        data = None if body is None else json.dumps(body).encode()
+        request = urllib.request.Request(self.base_url + path, data=data, method=method, headers=headers or {})
+        if data is not None:
+            request.add_header('Content-Type', 'application/json')
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as error:
+            return error.code, error.read()
+
+
+class FlaskClient(Client):
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def send(self, method, path, body, headers):
+        response = self.client.open(path, method=method, json=body, headers=headers)
+        return response.status_code, response.get_data()
+
+
+class DjangoClient(Client):
+    def __init__(self):
+        from django.test import Client as TestClient
+
+        self.client = TestClient()
+
+    def send(self, method, path, body, headers):
+        response = self.client.generic(method, path, data=json.dumps(body) if body is not None else '',
+                                       content_type='application/json', headers=headers)
+        return response.status_code, response.content
+
+
+# ------------------- Workloads -------------------
+class FlaskWorkload:
+    """Portal users: login, invoice creation, statements and reconciliation."""
+
+    def __init__(self, args):
+        self.args = args
+        self.data_dir = tempfile.mkdtemp(prefix='load-flask-')
+        from portal import synthetic
+
+        self.password = synthetic.SYNTHETIC_PASSWORD
+        synthetic.generate(self.data_dir, owners=args.concurrency, invoices=args.invoices,
+                           bills=args.invoices // 2, seed=args.seed)
+        self.env = {**UNTHROTTLED, 'PORTAL_DATA_DIR': self.data_dir}
+        # Launched workers share state the way a multi-worker deployment does.
+        self.launch_env = {'PORTAL_SHARED_LOG': os.path.join(self.data_dir, 'shared.log')}
+        self.health_path = '/'
+
+    def in_process_client_factory(self):
+        os.environ.update(self.env)
+        import app as portal
+
+        return lambda: FlaskClient(portal.app)
+
+    def launch_command(self, port):
+        return [sys.executable, '-m', 'gunicorn', '-w', str(self.args.workers), '-k', 'gthread',
+                '--threads', '4', '-b', f'127.0.0.1:{port}', 'app:app'], ROOT
+
+    def setup(self, client, index):
+        username = f'owner{index % self.args.concurrency + 1:05d}'
+        state = {'username': username}
+        self.login(client, state)
+        status, body = client.call('GET', '/customers')
+        customers = json.loads(body) if status == 200 else []
+        if not customers:
+            status, body = client.call('POST', '/customers', {'name': f'Load customer {index}'})
+            customers = [json.loads(body)['customer']]
+        state['customer_id'] = customers[0]['id']
+        status, body = client.call('GET', '/accounts')
+        accounts = json.loads(body) if status == 200 else []
+        revenue = [account['code'] for account in accounts if account.get('type') == 'Revenue']
+        state['revenue_code'] = revenue[-1] if revenue else 4000
+        return state
+
+    def login(self, client, state):
+        return client.call('POST', '/login', {'username': state['username'], 'password': self.password})[0]
+
+    def create_invoice(self, client, state):
+        return client.call('POST', '/invoices', {
+            'customer_id': state['customer_id'],
+            'items': [{'description': 'Load test service', 'account': state['revenue_code'], 'amount': 125.0}],
+        })[0]
+
+    def operations(self):
+        get = lambda path: lambda client, state: client.call('GET', path)[0]  # noqa: E731
+        return [
+            ('POST /login', 1, self.login),
+            ('POST /invoices', 2, self.create_invoice),
+            ('GET /statements/income', 2, get('/statements/income')),
+            ('GET /statements/balance', 2, get('/statements/balance')),
+            ('GET /statements/cashflow', 2, get('/statements/cashflow')),
+            ('GET /bank/reconcile', 1, get('/bank/reconcile')),
+        ]
+
+
+class TotpPool:
+    """Hands out 2FA users and codes that have not been used yet.
+
+    The API rejects a code it has already accepted, so each user can log in
+    at most three times per 30 second step (the previous, current and next
+    codes are valid).  When every pair is used up the caller waits for the
+    next step, outside the measured request.
+    """
+
+    def __init__(self, secrets):
+        import pyotp
+
+        self.totps = [(username, pyotp.TOTP(secret)) for username, secret in secrets]
+        self.used = set()
+        self.position = 0
+        self.lock = threading.Lock()
+
+    def take(self):
+        while True:
+            with self.lock:
+                now = time.time()
+                pairs = len(self.totps) * 3
+                for _ in range(pairs):
+                    user_index, offset = divmod(self.position % pairs, 3)
+                    self.position += 1
+                    username, totp = self.totps[user_index]
+                    timecode = totp.timecode(datetime.fromtimestamp(now)) + offset - 1
+                    if (username, timecode) not in self.used:
+                        self.used.add((username, timecode))
+                        return username, totp.at(now, offset - 1)
+                wait = 30 - now % 30
+            time.sleep(wait)
+
+
+class DjangoWorkload:
+    """API users: password login, login with 2FA, and the profile read path."""
+
+    def __init__(self, args):
+        self.args = args
+        self.tmpdir = tempfile.mkdtemp(prefix='load-django-')
+        self.env = {
+            **UNTHROTTLED,
+            'DATABASE_URL': os.environ.get('DATABASE_URL', f'sqlite:///{self.tmpdir}/load.sqlite3'),
+            'DEBUG': 'False',
+            'ALLOWED_HOSTS': 'testserver,localhost,127.0.0.1',
+            # Password hashing makes every login "slow"; keep the log quiet.
+            'QUERY_STATS_SLOW_MS': '10000',
+        }
+        os.environ.update(self.env)
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+        if BACKEND_DIR not in sys.path:
+            sys.path.insert(0, BACKEND_DIR)
+        import django
+        import pyotp
+        from django.contrib.auth import get_user_model
+        from django.contrib.auth.hashers import make_password
+        from django.core.management import call_command
+
+        django.setup()
+        call_command('migrate', verbosity=0)
+        User = get_user_model()
+        hashed = make_password(PASSWORD)
+        users = [User(username=f'load{i:05d}', password=hashed) for i in range(args.concurrency)]
+        secrets = [(f'load2fa{i:05d}', pyotp.random_base32()) for i in range(args.twofa_users)]
+        users += [User(username=username, password=hashed, two_factor_secret=secret) for username, secret in secrets]
+        User.objects.filter(username__in=[user.username for user in users]).delete()
+        User.objects.bulk_create(users)
+        self.totp_pool = TotpPool(secrets)
+        self.launch_env = {}
+        self.health_path = '/healthz/'
+
+    def in_process_client_factory(self):
+        return DjangoClient
+
+    def launch_command(self, port):
+        return [sys.executable, '-m', 'gunicorn', '-w', str(self.args.workers), '-k', 'gthread',
+                '--threads', '4', '-b', f'127.0.0.1:{port}', 'config.wsgi'], BACKEND_DIR
+
+    def setup(self, client, index):
+        state = {'username': f'load{index:05d}'}
+        status, body = client.call('POST', '/api/login/', {'username': state['username'], 'password': PASSWORD})
+        if status != 200:
+            raise RuntimeError(f'login failed with {status}: {body[:200]!r}')
+        state['headers'] = {'Authorization': f"Bearer {json.loads(body)['access']}"}
+        return state
+
+    def login(self, client, state):
+        return client.call('POST', '/api/login/', {'username': state['username'], 'password': PASSWORD})[0]
+
+    def login_2fa(self, client, state):
+        username, token = self.totp_pool.take()
+        return client.call('POST', '/api/login/', {'username': username, 'password': PASSWORD, 'token': token})[0]
+
+    def profile(self, client, state):
+        return client.call('GET', '/api/profile/', headers=state['headers'])[0]
+
+    def operations(self):
+        return [
+            ('POST /api/login/', 2, self.login),
+            ('POST /api/login/ (2FA)', 1, self.login_2fa),
+            ('GET /api/profile/', 6, self.profile),
+        ]
+
+
+WORKLOADS = {'flask': FlaskWorkload, 'django': DjangoWorkload}
+
+
+# ------------------- Driver -------------------
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def launch(workload):
+    """Start a gunicorn server for ``workload``; returns ``(process, base_url)``."""
+    port = _free_port()
+    command, cwd = workload.launch_command(port)
+    process = subprocess.Popen(command, cwd=cwd, env={**os.environ, **workload.env, **workload.launch_env},
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(process.stderr.read().decode()[-2000:])
+        try:
+            urllib.request.urlopen(base_url + workload.health_path, timeout=1).close()
+            return process, base_url
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('server did not start within 60 seconds')
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of a sorted list."""
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def run(workload, make_client, concurrency, duration, total_requests, seed):
+    """Drive the workload and return ``(samples, elapsed)``; samples are (name, seconds, status)."""
+    operations = workload.operations()
+    names = [name for name, _, _ in operations]
+    weights = [weight for _, weight, _ in operations]
+    functions = {name: function for name, _, function in operations}
+    samples = []
+    errors = []
+    lock = threading.Lock()
+    remaining = [total_requests]
+    clock = {}
+
+    def start():
+        # Runs once, before the barrier releases anyone, so every user sees the deadline.
+        clock['started'] = time.perf_counter()
+        clock['deadline'] = time.monotonic() + duration
+
+    ready = threading.Barrier(concurrency + 1, action=start)
+
+    def virtual_user(index):
+        rng = random.Random(seed + index)
+        local = []
+        try:
+            client = make_client()
+            state = workload.setup(client, index)
+        except Exception as error:  # reported after the run
+            errors.append(error)
+            ready.abort()
+            return
+        try:
+            ready.wait()
+        except threading.BrokenBarrierError:
+            return
+        deadline = clock['deadline']
+        try:
+            while time.monotonic() < deadline:
+                if total_requests:
+                    with lock:
+                        if remaining[0] <= 0:
+                            break
+                        remaining[0] -= 1
+                name = rng.choices(names, weights)[0]
+                status = functions[name](client, state)
+                local.append((name, client.elapsed, status))
+        except Exception as error:  # reported after the run
+            errors.append(error)
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=virtual_user, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    try:
+        ready.wait()
+    except threading.BrokenBarrierError:
+        for thread in threads:
+            thread.join()
+        raise RuntimeError(f'virtual user setup failed: {errors[0]!r}')
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise RuntimeError(f'{len(errors)} virtual user(s) failed during the run: {errors[0]!r}')
+    return samples, time.perf_counter() - clock['started']
+
+
+def summarise(samples, elapsed):
+    by_name = {}
+    for name, seconds, status in samples:
+        by_name.setdefault(name, []).append((seconds, status))
+    results = []
+    for name in sorted(by_name):
+        rows = by_name[name]
+        ordered = sorted(seconds for seconds, _ in rows)
+        results.append({
+            'endpoint': name,
+            'requests': len(rows),
+            'errors': sum(1 for _, status in rows if status >= 400),
+            'rps': round(len(rows) / elapsed, 1),
+            'p50_ms': round(percentile(ordered, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(ordered, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(ordered, 0.99) * 1000, 2),
+        })
+    ordered = sorted(seconds for _, seconds, _ in samples)
+    if ordered:
+        results.append({
+            'endpoint': 'TOTAL',
+            'requests': len(samples),
+            'errors': sum(1 for _, _, status in samples if status >= 400),
+            'rps': round(len(samples) / elapsed, 1),
+            'p50_ms': round(percentile(ordered, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(ordered, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(ordered, 0.99) * 1000, 2),
+        })
+    return results
+
+
+def print_results(results):
+    print(f"{'endpoint':<30} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for row in results:
+        print(f"{row['endpoint']:<30} {row['requests']:>9} {row['errors']:>7} {row['rps']:>9} "
+              f"{row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9}")
+
+
+def compare(results, baseline_path, threshold):
+    """Print p95 and throughput ratios against the baseline.  Returns the regressions."""
+    with open(baseline_path) as handle:
+        previous = {row['endpoint']: row for row in json.load(handle)['results']}
+    regressions = []
+    print(f"\n{'endpoint':<30} {'p95 x':>8} {'req/s x':>8}")
+    for row in results:
+        old = previous.get(row['endpoint'])
+        if old is None:
+            continue
+        p95_ratio = row['p95_ms'] / old['p95_ms'] if old['p95_ms'] else float('inf')
+        rps_ratio = row['rps'] / old['rps'] if old['rps'] else float('inf')
+        flag = ''
+        if p95_ratio > 1 + threshold or rps_ratio < 1 - threshold or row['errors'] > old['errors']:
+            regressions.append(row)
+            flag = '  REGRESSION'
+        print(f"{row['endpoint']:<30} {p95_ratio:>8.2f} {rps_ratio:>8.2f}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test the Flask portal or the Django API.')
+    parser.add_argument('target', choices=sorted(WORKLOADS))
+    parser.add_argument('--concurrency', type=int, default=8, help='virtual users, one thread each')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds to run')
+    parser.add_argument('--requests', type=int, default=0, help='stop after this many requests (0: no limit)')
+    where = parser.add_mutually_exclusive_group()
+    where.add_argument('--launch', action='store_true', help='start a local gunicorn server for the run')
+    where.add_argument('--url', help='send requests to an already running server')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers with --launch')
+    parser.add_argument('--invoices', type=int, default=2000, help='synthetic invoices for the portal')
+    parser.add_argument('--twofa-users', type=int, default=200, help='Django users with 2FA enabled')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help='write results to this JSON file')
+    parser.add_argument('--compare', help='compare against a saved JSON baseline')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative p95 or throughput change reported as a regression')
+    args = parser.parse_args(argv)
+
+    workload = WORKLOADS[args.target](args)
+    server = None
+    if args.launch:
+        server, base_url = launch(workload)
+        make_client = lambda: HttpClient(base_url)  # noqa: E731
+        mode = f'gunicorn x{args.workers}'
+    elif args.url:
+        make_client = lambda: HttpClient(args.url)  # noqa: E731
+        mode = args.url
+    else:
+        make_client = workload.in_process_client_factory()
+        mode = 'in-process'
+    try:
+        samples, elapsed = run(workload, make_client, args.concurrency, args.duration, args.requests, args.seed)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    results = summarise(samples, elapsed)
+    print(f'{args.target} ({mode}), {args.concurrency} virtual users, {elapsed:.1f} s\n')
+    print_results(results)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w') as handle:
+            json.dump({
+                'meta': {
+                    'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                    'python': platform.python_version(),
+                    'machine': platform.machine(),
+                    'target': args.target,
+                    'mode': mode,
+                    'concurrency': args.concurrency,
+                    'duration': args.duration,
+                    'seed': args.seed,
+                },
+                'results': results,
+            }, handle, indent=2)
+        print(f'\nSaved {len(results)} results to {args.save}')
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            print(f'\n{len(regressions)} endpoint(s) regressed by more than {args.threshold:.0%}')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""Measure the portal's cold-start cost with ``python -X importtime``.
+
+Each scenario runs in a fresh interpreter several times.  For every run the
+``-X importtime`` report is parsed, and the script prints the median wall
+time, the median total import time and the heaviest top-level imports of
+the last run:
+
+    python benchmarks/startup_bench.py
+    python benchmarks/startup_bench.py --runs 10 --json startup.json
+
+The ``first chart use`` scenario shows the cost that lazy loading moves from
+startup to the first request that needs the chart of accounts.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = [
+    ('import app', 'import app', {}),
+    ('first chart use', 'import app; app._chart()', {}),
+    ('preload chart', 'import app', {'PORTAL_PRELOAD_CHART': '1'}),
+]
+
+
+def parse_importtime(stderr):
+    """Return ``[(module, self_us, cumulative_us, depth)]`` from an importtime report."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        depth = (len(name) - len(name.lstrip(' '))) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def run_scenario(code, extra_env, runs):
+    env = {**os.environ, **extra_env}
+    walls, totals, report = [], [], []
+    for _ in range(runs):
+        started = time.perf_counter()
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                              cwd=ROOT, env=env, capture_output=True, text=True)
+        walls.append(time.perf_counter() - started)
+        if proc.returncode != 0:
+            raise RuntimeError(proc.stderr[-2000:])
+        report = parse_importtime(proc.stderr)
+        totals.append(sum(cumulative for _, _, cumulative, depth in report if depth == 0))
+    top = sorted((row for row in report if row[3] == 0), key=lambda row: row[2], reverse=True)
+    return {
+        'wall_ms': round(statistics.median(walls) * 1000, 1),
+        'import_ms': round(statistics.median(totals) / 1000, 1),
+        'top_imports': [{'module': name, 'cumulative_ms': round(cumulative / 1000, 1)}
+                        for name, _, cumulative, _ in top[:10]],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure portal startup time.')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--json', dest='json_path', help='also write results to this file')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for label, code, extra_env in SCENARIOS:
+        result = results[label] = run_scenario(code, extra_env, args.runs)
+        print(f"{label:<16} wall {result['wall_ms']:>8.1f} ms   imports {result['import_ms']:>8.1f} ms")
+        for row in result['top_imports'][:5]:
+            print(f"    {row['module']:<30} {row['cumulative_ms']:>8.1f} ms")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as handle:
+            json.dump({'python': sys.version.split()[0], 'runs': args.runs, 'results': results},
+                      handle, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
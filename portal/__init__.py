@@ -0,0 +1 @@
+"""Support modules for the Flask portal in ``app.py``."""
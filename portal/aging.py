@@ -0,0 +1,126 @@
+"""Aged receivables and payables.
+
+``AgingReport`` wraps an invoice or bill store.  It keeps the store in
+columnar NumPy arrays (document date, total, party, owner, open flag),
+rebuilt only when the store has grown, and computes a report with a few
+array operations: mask the open documents dated on or before the as-of
+date, bucket their ages with ``searchsorted`` and sum the totals per party
+and bucket with a single ``bincount``.  Results are cached per as-of date,
+bucket edges and owner until the store changes.
+
+With a ``RateTable`` (see ``portal.fx``) documents keep their own currency
+and ``compute`` converts totals into the reporting currency at the as-of
+date's rates: one factor per currency, applied to the whole column.
+
+Bucket edges are ages in days.  The default ``(30, 60, 90)`` gives
+``current`` (0-30 days), ``31-60``, ``61-90`` and ``91+``; each bucket
+includes its upper edge.
+"""
+
+import threading
+from collections import OrderedDict
+
+DEFAULT_EDGES = (30, 60, 90)
+
+
+def parse_edges(text):
+    """Parse ``"30,60,90"`` into increasing positive day counts.  Raises ValueError."""
+    edges = tuple(int(part) for part in text.split(',') if part.strip())
+    if not edges or edges[0] <= 0 or any(a >= b for a, b in zip(edges, edges[1:])):
+        raise ValueError(text)
+    return edges
+
+
+def bucket_labels(edges):
+    return (['current'] + [f'{low + 1}-{high}' for low, high in zip(edges, edges[1:])]
+            + [f'{edges[-1] + 1}+'])
+
+
+class AgingReport:
+    """Aging of the open documents in ``store``, grouped by ``party_field``.
+
+    Documents whose ``status`` is ``paid`` are settled and left out.
+    Documents without a ``currency`` are in the base currency of ``rates``.
+    """
+
+    def __init__(self, store, party_field, rates=None, cache_size=64):
+        self.store = store
+        self.party_field = party_field
+        self.rates = rates
+        self.cache_size = cache_size
+        self._size = None
+        self._columns = None
+        self._owners = {}
+        self._currencies = []
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load(self):
+        import numpy as np
+
+        if self._size == len(self.store):
+            return self._columns
+        records = self.store[:]
+        owners = {}
+        currencies = {}
+        self._columns = {
+            'date': np.array([record['date'] for record in records], dtype='datetime64[D]'),
+            'total': np.array([record['total'] for record in records], dtype=float),
+            'party': np.array([record[self.party_field] for record in records], dtype=np.int64),
+            'owner': np.array([owners.setdefault(record.get('owner'), len(owners)) for record in records],
+                              dtype=np.int64),
+            'open': np.array([record.get('status') != 'paid' for record in records], dtype=bool),
+            'currency': np.array([currencies.setdefault(record.get('currency'), len(currencies))
+                                  for record in records], dtype=np.int64),
+        }
+        self._owners = owners
+        self._currencies = list(currencies)
+        self._size = len(records)
+        self._cache.clear()
+        return self._columns
+
+    def compute(self, as_of, edges=DEFAULT_EDGES, owner=None, currency=None):
+        """Return ``(labels, parties, amounts)`` for documents open at ``as_of``.
+
+        ``parties`` is a list of party ids and ``amounts`` a matching list of
+        per-bucket totals.  ``owner=None`` covers every owner.  Amounts are in
+        ``currency``, by default the base currency of ``rates``.  Raises
+        ``portal.fx.MissingRate`` when a rate is not known at ``as_of``.
+        """
+        import numpy as np
+
+        with self._lock:
+            columns = self._load()
+            if self.rates is not None:
+                currency = currency or self.rates.base
+            key = (as_of, tuple(edges), owner, currency)
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+
+            as_of_day = np.datetime64(as_of, 'D')
+            mask = columns['open'] & (columns['date'] <= as_of_day)
+            if owner is not None:
+                mask &= columns['owner'] == self._owners.get(owner, -1)
+            ages = (as_of_day - columns['date'][mask]).astype(np.int64)
+            buckets = np.searchsorted(np.asarray(edges), ages, side='left')
+            weights = columns['total'][mask]
+            if self.rates is not None:
+                codes = columns['currency'][mask]
+                factors = np.ones(len(self._currencies))
+                for index in np.unique(codes):
+                    code = self._currencies[index] or self.rates.base
+                    factors[index] = self.rates.factor(code, as_of, currency)
+                if (factors != 1.0).any():
+                    weights = weights * factors[codes]
+            parties, slots = np.unique(columns['party'][mask], return_inverse=True)
+            width = len(edges) + 1
+            amounts = np.bincount(slots * width + buckets, weights=weights,
+                                  minlength=len(parties) * width).reshape(len(parties), width)
+
+            result = (bucket_labels(edges), parties.tolist(), amounts.tolist())
+            self._cache[key] = result
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return result
@@ -0,0 +1,159 @@
+"""Statements for every tenant in one batch run.
+
+A tenant is the owner of journal entries (their ``user``).  ``run`` splits
+the journal into position ranges and hands them to a process pool; each
+worker folds its range into per-owner partials (account balances, revenue,
+expenses, cash in and out) and the parent merges them and derives every
+owner's income statement, balance sheet and cash flow.  The journal is
+passed to the workers through the pool initializer, which costs nothing
+under the ``fork`` start method; only the small partials travel back, so
+the run time falls with the number of cores.
+
+The pool is for the command line below, a single-threaded process that is
+safe to fork.  Inside the threaded web server ``run`` is called with one
+worker and folds in-process: forking there could copy locks held by other
+threads.
+
+Figures follow the portal's company-wide statements: the income statement
+covers the open period (entries after the latest period close), while the
+balance sheet and cash flow cover each owner's whole history, because
+period closes keep company-wide balances only.
+
+    python -m portal.batch --out statements.ndjson --workers 8
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+from portal.ledger import postings
+
+log = logging.getLogger(__name__)
+
+_job = None
+
+
+def _init_worker(job):
+    global _job
+    _job = job
+
+
+def _fold(bounds):
+    """Return ``{owner: [balances, revenue, expenses, cash_in, cash_out]}`` for a range of the journal."""
+    entries, factors, types, cash_codes, open_from, carry = _job
+    partials = {}
+    for position in range(*bounds):
+        entry = entries[position]
+        owner = entry.get('user')
+        partial = partials.get(owner)
+        if partial is None:
+            partial = partials[owner] = [{}, 0.0, 0.0, 0.0, 0.0]
+        balances = partial[0]
+        is_open = position >= open_from or entry['id'] in carry
+        factor = 1.0 if factors is None else factors[position]
+        for account, amount in postings(entry):
+            amount *= factor
+            balances[account] = balances.get(account, 0.0) + amount
+            if is_open:
+                acc_type = types.get(account)
+                if acc_type == 'Revenue' and amount < 0:
+                    partial[1] -= amount
+                elif acc_type == 'Expense' and amount > 0:
+                    partial[2] += amount
+            if str(account) in cash_codes:
+                if amount >= 0:
+                    partial[3] += amount
+                else:
+                    partial[4] -= amount
+    return partials
+
+
+def _merge(into, partials):
+    for owner, (balances, revenue, expenses, cash_in, cash_out) in partials.items():
+        total = into.get(owner)
+        if total is None:
+            into[owner] = [dict(balances), revenue, expenses, cash_in, cash_out]
+            continue
+        merged = total[0]
+        for account, value in balances.items():
+            merged[account] = merged.get(account, 0.0) + value
+        total[1] += revenue
+        total[2] += expenses
+        total[3] += cash_in
+        total[4] += cash_out
+
+
+def _statements(owner, balances, revenue, expenses, cash_in, cash_out, types):
+    sections = {'Asset': 0.0, 'Liability': 0.0, 'Equity': 0.0}
+    for account, balance in balances.items():
+        acc_type = types.get(account)
+        if acc_type in sections:
+            sections[acc_type] += balance
+    return {
+        'owner': owner,
+        'income': {'revenue': revenue, 'expenses': expenses, 'net_income': revenue - expenses},
+        'balance': {'assets': sections['Asset'], 'liabilities': sections['Liability'],
+                    'equity': sections['Equity']},
+        'cashflow': {'cash_inflow': cash_in, 'cash_outflow': cash_out, 'net_cash': cash_in - cash_out},
+    }
+
+
+def run(entries, types, cash_codes, factors=None, open_from=0, carry=(), workers=None):
+    """Return every owner's statements, sorted by owner.
+
+    ``types`` maps account codes to chart types and ``cash_codes`` is a set
+    of cash account codes as strings.  ``factors`` (one per entry) converts
+    into the reporting currency.  Entries at positions from ``open_from``,
+    or whose ids are in ``carry``, are in the open period.  ``workers``
+    defaults to the number of CPUs; with one worker nothing is forked.
+    """
+    workers = workers or os.cpu_count() or 1
+    job = (entries, factors, types, cash_codes, open_from, frozenset(carry))
+    count = len(entries)
+    totals = {}
+    if workers == 1 or count < 2 * workers:
+        _init_worker(job)
+        try:
+            _merge(totals, _fold((0, count)))
+        finally:
+            _init_worker(None)
+    else:
+        chunks = workers * 4
+        step = -(-count // chunks)
+        bounds = [(start, min(start + step, count)) for start in range(0, count, step)]
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        with context.Pool(workers, initializer=_init_worker, initargs=(job,)) as pool:
+            for partials in pool.imap_unordered(_fold, bounds):
+                _merge(totals, partials)
+    return [_statements(owner, *totals[owner], types) for owner in sorted(totals, key=str)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--out', default='-', help='NDJSON output file, - for stdout')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--currency', default=None, help='reporting currency, the base currency by default')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    import app as portal
+
+    started = time.perf_counter()
+    results = portal.compute_tenant_statements(currency=args.currency, workers=args.workers)
+    handle = sys.stdout if args.out == '-' else open(args.out, 'w', encoding='utf-8')
+    try:
+        for result in results:
+            handle.write(json.dumps(result, default=str) + '\n')
+    finally:
+        if handle is not sys.stdout:
+            handle.close()
+    log.info('%d tenants in %.2fs', len(results), time.perf_counter() - started)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Negotiated response compression, JSON revalidation and an optional orjson encoder.
+
+``init_app(app)`` adds an ``after_request`` hook that compresses response
+bodies of at least ``PORTAL_COMPRESS_MIN_BYTES`` bytes (default 1024) with
+brotli or gzip, whichever the client accepts with the higher quality value
+(brotli wins ties).  Levels are set with ``PORTAL_GZIP_LEVEL`` (1-9,
+default 6) and ``PORTAL_BROTLI_LEVEL`` (0-11, default 5); brotli needs the
+optional ``brotli`` package.  ``PORTAL_COMPRESS=0`` turns compression off.
+
+Successful JSON responses to GET requests get an ETag computed from the
+body and ``Cache-Control: private, no-cache``, so clients that send
+``If-None-Match`` receive an empty 304 when the data has not changed.
+
+Setting ``PORTAL_JSON=orjson`` makes ``jsonify`` encode with ``orjson``
+when it is installed.  The output matches the default provider (sorted
+keys, HTTP dates) except that non-ASCII text is written as UTF-8 instead of
+``\\u`` escapes.
+"""
+
+import gzip
+import os
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+COMPRESSIBLE_TYPES = {
+    'application/json', 'application/javascript', 'application/xml', 'application/x-ndjson',
+    'image/svg+xml', 'text/css', 'text/csv', 'text/html', 'text/javascript', 'text/plain', 'text/xml',
+}
+
+
+def choose_encoding(accept_encoding, available):
+    """Pick the best of ``available`` for an ``Accept-Encoding`` header value, or None."""
+    best, best_q = None, 0.0
+    for encoding in available:
+        q = accept_encoding.quality(encoding)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class Compressor:
+    """Compresses eligible responses; see the module docstring."""
+
+    def __init__(self, min_bytes=1024, gzip_level=6, brotli_level=5):
+        self.min_bytes = min_bytes
+        self.gzip_level = gzip_level
+        self.brotli_level = brotli_level
+        self.encodings = (['br'] if brotli is not None else []) + ['gzip']
+
+    def compress(self, data, encoding):
+        if encoding == 'br':
+            return brotli.compress(data, quality=self.brotli_level)
+        return gzip.compress(data, compresslevel=self.gzip_level, mtime=0)
+
+    def __call__(self, response):
+        if (response.direct_passthrough or response.is_streamed
+                or not 200 <= response.status_code < 300 or response.status_code in (204, 206)
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_TYPES):
+            return response
+        response.vary.add('Accept-Encoding')
+        data = response.get_data()
+        if len(data) < self.min_bytes:
+            return response
+        encoding = choose_encoding(request.accept_encodings, self.encodings)
+        if encoding is None:
+            return response
+        response.set_data(self.compress(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+        # The compressed body differs byte for byte, so a strong validator
+        # would be wrong; a weak one still lets If-None-Match revalidate.
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+
+def revalidate_json(response):
+    """Tag GET JSON responses with an ETag and answer 304 when it matches."""
+    if (request.method != 'GET' or response.status_code != 200 or response.is_streamed
+            or response.mimetype != 'application/json'):
+        return response
+    response.headers.setdefault('Cache-Control', 'private, no-cache')
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """``DefaultJSONProvider`` with ``orjson`` doing the encoding."""
+
+    options = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME if orjson else 0
+
+    def dumps(self, obj, **kwargs):
+        if kwargs.keys() - {'separators'}:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self.options).decode()
+
+    def response(self, *args, **kwargs):
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=self.options | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def init_app(app):
+    """Configure JSON encoding and response compression for ``app`` from the environment."""
+    if os.environ.get('PORTAL_JSON') == 'orjson':
+        if orjson is None:
+            raise RuntimeError('PORTAL_JSON=orjson requires the orjson package')
+        app.json = OrjsonProvider(app)
+    if os.environ.get('PORTAL_COMPRESS', '1') == '0':
+        app.after_request(revalidate_json)
+        return None
+    compressor = Compressor(
+        min_bytes=int(os.environ.get('PORTAL_COMPRESS_MIN_BYTES', '1024')),
+        gzip_level=int(os.environ.get('PORTAL_GZIP_LEVEL', '6')),
+        brotli_level=int(os.environ.get('PORTAL_BROTLI_LEVEL', '5')),
+    )
+    app.after_request(compressor)
+    # Hooks run in reverse order: revalidate before compressing.
+    app.after_request(revalidate_json)
+    return compressor
@@ -0,0 +1,96 @@
+"""Per-entity and consolidated statements with intercompany eliminations.
+
+Journal entries carry an ``entity`` (the legal entity that booked them).
+``group_balances`` aggregates the postings once, by entity and account;
+``consolidate`` then derives each entity's income statement and balance
+sheet from that table, sums the entities and removes intercompany
+balances.  No statement function is run per entity, so the cost is one
+pass over the postings plus work proportional to the number of (entity,
+account) pairs.
+
+An elimination pair names two accounts whose balances offset each other
+across entities, e.g. an intercompany receivable and the matching payable,
+or intercompany revenue and expense.  In the consolidated figures the
+matched part (the smaller of the two balances when they have opposite
+signs) is removed from both; any mismatch stays in and is reported as the
+pair's ``difference`` so it can be investigated.
+
+Income figures here are net balances (credits minus debits on revenue
+accounts, debits minus credits on expense accounts) so that eliminations
+apply to them cleanly.
+"""
+
+from portal.ledger import postings
+
+
+def parse_pairs(text):
+    """Parse ``"1310:2310,4910:5910"`` into account code pairs (strings).  Raises ValueError."""
+    pairs = []
+    for part in text.split(','):
+        if not part.strip():
+            continue
+        first, second = (code.strip() for code in part.split(':'))
+        if not first or not second or first == second:
+            raise ValueError(text)
+        pairs.append((first, second))
+    return pairs
+
+
+def group_balances(entries, positions, factors=None, default_entity=None, into=None):
+    """Fold the postings of ``entries[positions]`` into ``{entity: {account: balance}}``.
+
+    ``factors``, when given, converts each entry (by position); entries
+    without an entity count towards ``default_entity``.  Adds to ``into``
+    if given.
+    """
+    balances = {} if into is None else into
+    for position in positions:
+        entry = entries[position]
+        entity = entry.get('entity') or default_entity
+        accounts = balances.get(entity)
+        if accounts is None:
+            accounts = balances[entity] = {}
+        factor = 1.0 if factors is None else factors[position]
+        for account, amount in postings(entry):
+            accounts[account] = accounts.get(account, 0.0) + amount * factor
+    return balances
+
+
+def _statements(balances, types):
+    sections = {'Asset': 0.0, 'Liability': 0.0, 'Equity': 0.0, 'Revenue': 0.0, 'Expense': 0.0}
+    for account, balance in balances.items():
+        acc_type = types.get(account)
+        if acc_type in sections:
+            sections[acc_type] += balance
+    revenue, expenses = -sections['Revenue'], sections['Expense']
+    return {
+        'income': {'revenue': revenue, 'expenses': expenses, 'net_income': revenue - expenses},
+        'balance': {'assets': sections['Asset'], 'liabilities': sections['Liability'],
+                    'equity': sections['Equity']},
+    }
+
+
+def consolidate(balances, types, pairs=()):
+    """Return per-entity statements, the eliminations and the consolidated statements.
+
+    ``balances`` is a ``group_balances`` table, ``types`` maps account codes
+    to chart types and ``pairs`` holds elimination account pairs (chart codes).
+    """
+    combined = {}
+    for accounts in balances.values():
+        for account, balance in accounts.items():
+            combined[account] = combined.get(account, 0.0) + balance
+    eliminations = []
+    for first, second in pairs:
+        a, b = combined.get(first, 0.0), combined.get(second, 0.0)
+        matched = min(abs(a), abs(b)) if a * b < 0 else 0.0
+        if matched:
+            combined[first] = a - matched if a > 0 else a + matched
+            combined[second] = b - matched if b > 0 else b + matched
+        eliminations.append({'accounts': [first, second], 'eliminated': matched, 'difference': a + b})
+    return {
+        'entities': {entity: _statements(accounts, types)
+                     for entity, accounts in sorted(balances.items(), key=lambda item: str(item[0]))},
+        'eliminations': eliminations,
+        'consolidated': _statements(combined, types),
+    }
@@ -0,0 +1,156 @@
+"""Foreign exchange rates and reporting-currency conversion.
+
+``RateTable`` holds, per currency, the dates on which a rate was published
+and the rate itself: the value of one unit of that currency in the base
+currency.  The rate for a day is the latest one published on or before it.
+Per currency the dates are a sorted NumPy array, so ``rates`` resolves a
+whole column of ``(currency, day)`` pairs with one ``searchsorted`` per
+currency; ``rate`` resolves a single pair and memoises the answer.  NumPy
+is imported, and the arrays built, on the first lookup of a foreign
+currency, so creating a table at import costs nothing.
+
+``LedgerConversion`` turns that into conversion factors for an append-only
+list of records (the journal).  It keeps the records' currencies and day
+ordinals as columns and a factor column per reporting currency, all
+extended as records are appended, so only new records are ever resolved.
+A statement then multiplies amounts by a precomputed factor instead of
+looking up a rate per entry.
+
+Rates are loaded from CSV files with ``date,currency,rate`` columns.
+"""
+
+import csv
+import threading
+from datetime import date, datetime
+
+DEFAULT_CURRENCY = 'USD'
+
+
+class MissingRate(LookupError):
+    """No rate is known for a currency on or before a date."""
+
+
+def _ordinal(day):
+    if isinstance(day, datetime):
+        return day.date().toordinal()
+    if isinstance(day, date):
+        return day.toordinal()
+    return date.fromisoformat(str(day)[:10]).toordinal()
+
+
+class RateTable:
+    """Dated FX rates against ``base``; see the module docstring."""
+
+    def __init__(self, base=DEFAULT_CURRENCY, rows=()):
+        self.base = base
+        self._points = {}
+        for day, currency, rate in rows:
+            self._points.setdefault(currency.upper(), []).append((_ordinal(day), float(rate)))
+        for points in self._points.values():
+            points.sort()
+        self._series = {}
+        self._memo = {}
+
+    @classmethod
+    def from_csv(cls, path, base=DEFAULT_CURRENCY):
+        with open(path, newline='', encoding='utf-8') as handle:
+            rows = [(row['date'], row['currency'], row['rate']) for row in csv.DictReader(handle)]
+        return cls(base, rows)
+
+    @property
+    def currencies(self):
+        return {self.base, *self._points}
+
+    def rate(self, currency, day):
+        """Value of one unit of ``currency`` in the base currency on ``day``."""
+        if currency == self.base:
+            return 1.0
+        key = (currency, _ordinal(day))
+        rate = self._memo.get(key)
+        if rate is None:
+            rate = self._memo[key] = float(self._resolve(currency, [key[1]])[0])
+        return rate
+
+    def rates(self, currencies, ordinals):
+        """Vectorised ``rate`` over parallel arrays of currency codes and day ordinals."""
+        import numpy as np
+
+        currencies = np.asarray(currencies)
+        ordinals = np.asarray(ordinals, dtype=np.int64)
+        result = np.ones(len(ordinals), dtype=float)
+        for currency in np.unique(currencies):
+            if currency == self.base:
+                continue
+            mask = currencies == currency
+            result[mask] = self._resolve(str(currency), ordinals[mask])
+        return result
+
+    def _resolve(self, currency, ordinals):
+        import numpy as np
+
+        series = self._series.get(currency)
+        if series is None:
+            points = self._points.get(currency)
+            if points is None:
+                raise MissingRate(f'no {currency} rates loaded')
+            series = self._series[currency] = (np.array([day for day, _ in points], dtype=np.int64),
+                                               np.array([rate for _, rate in points], dtype=float))
+        days, values = series
+        positions = np.searchsorted(days, ordinals, side='right') - 1
+        if (positions < 0).any():
+            first = date.fromordinal(int(np.min(ordinals))).isoformat()
+            raise MissingRate(f'no {currency} rate on or before {first}')
+        return values[positions]
+
+    def factor(self, currency, day, reporting):
+        """Multiplier converting an amount in ``currency`` on ``day`` to ``reporting``."""
+        if currency == reporting:
+            return 1.0
+        return self.rate(currency, day) / self.rate(reporting, day)
+
+
+class LedgerConversion:
+    """Conversion factors for the records in ``entries``; see the module docstring.
+
+    ``date_field`` and ``currency_field`` name the record fields; records
+    without a currency are in the table's base currency.
+    """
+
+    def __init__(self, entries, table, date_field='date', currency_field='currency'):
+        self.entries = entries
+        self.table = table
+        self.date_field = date_field
+        self.currency_field = currency_field
+        self._currencies = []
+        self._ordinals = []
+        self._foreign = False
+        self._factors = {}
+        self._lock = threading.Lock()
+
+    def factors(self, reporting):
+        """Return the factor for every record, or None when all of them are 1."""
+        import numpy as np
+
+        with self._lock:
+            if len(self.entries) < len(self._ordinals):
+                self._currencies, self._ordinals, self._foreign = [], [], False
+                self._factors.clear()
+            pending = self.entries[len(self._ordinals):]
+            if pending:
+                base = self.table.base
+                currencies = [entry.get(self.currency_field) or base for entry in pending]
+                self._currencies.extend(currencies)
+                self._ordinals.extend(_ordinal(entry[self.date_field]) for entry in pending)
+                self._foreign = self._foreign or any(currency != base for currency in currencies)
+            if not self._foreign and reporting == self.table.base:
+                return None
+            factors = self._factors.setdefault(reporting, [])
+            start = len(factors)
+            if start < len(self._ordinals):
+                currencies = np.array(self._currencies[start:])
+                ordinals = np.array(self._ordinals[start:], dtype=np.int64)
+                new = self.table.rates(currencies, ordinals)
+                if reporting != self.table.base:
+                    new /= self.table.rates(np.full(len(ordinals), reporting), ordinals)
+                factors.extend(new.tolist())
+            return factors
@@ -0,0 +1,122 @@
+"""Account hierarchy derived from chart-of-accounts codes.
+
+Codes nest by prefix once trailing zeros are dropped: ``1110`` (Cash) sits
+under ``1100`` (Current Assets), which sits under ``1000`` (Assets).  An
+account's parent is the account whose stem is the longest proper prefix of
+its own stem, so gaps in the chart are skipped (``1123`` rolls into
+``1100`` when there is no ``1120``).  An explicit parent, when the chart
+has one, wins over the prefix rule.
+
+``AccountTree`` resolves every parent with a prefix-tree lookup, orders the
+accounts deepest first and then computes subtotals for all levels in one
+bottom-up pass over the balances.
+"""
+
+
+def _stem(code):
+    return str(code).rstrip('0') or '0'
+
+
+def parent_codes(codes, explicit=None):
+    """Return ``{code: parent_code or None}`` for ``codes``.
+
+    ``explicit`` optionally maps codes to a parent code; empty values fall
+    back to the prefix rule.  Codes are compared as strings.
+    """
+    keys = [str(code) for code in codes]
+    # Prefix tree of stems: nested dicts, with the account code stored under
+    # the None key of the node where its stem ends.
+    trie = {}
+    for key in keys:
+        node = trie
+        for digit in _stem(key):
+            node = node.setdefault(digit, {})
+        node.setdefault(None, key)
+    explicit = {str(code): str(parent) for code, parent in (explicit or {}).items() if parent not in (None, '')}
+
+    parents = {}
+    for key in keys:
+        if key in explicit:
+            parents[key] = explicit[key]
+            continue
+        parent = None
+        node = trie
+        stem = _stem(key)
+        for digit in stem[:-1]:
+            node = node[digit]
+            parent = node.get(None, parent)
+        parents[key] = parent
+    return parents
+
+
+class AccountTree:
+    """Parent/child index over a chart of accounts.
+
+    ``accounts`` is an iterable of dicts with ``code``, ``name``, ``type``
+    and optionally ``parent``.
+    """
+
+    def __init__(self, accounts):
+        self.accounts = {}
+        explicit = {}
+        for account in accounts:
+            key = str(account['code'])
+            self.accounts[key] = account
+            explicit[key] = account.get('parent')
+        self.parent = parent_codes(self.accounts, explicit)
+        self.children = {key: [] for key in self.accounts}
+        self.roots = []
+        for key, parent in self.parent.items():
+            if parent in self.children and parent != key:
+                self.children[parent].append(key)
+            else:
+                self.parent[key] = None
+                self.roots.append(key)
+        order = []
+        level = [(key, 1) for key in self.roots]
+        while level:
+            order.extend(level)
+            level = [(child, depth + 1) for key, depth in level for child in self.children[key]]
+        if len(order) != len(self.accounts):
+            raise ValueError('explicit account parents form a cycle')
+        self.depth = dict(order)
+        self.bottom_up = [key for key, _ in reversed(order)]
+
+    def rollup(self, balances):
+        """Return ``{code: subtotal}`` for every account, its own balance included.
+
+        ``balances`` maps codes (any type) to the account's own balance.
+        """
+        totals = dict.fromkeys(self.accounts, 0.0)
+        for code, balance in balances.items():
+            key = str(code)
+            if key in totals:
+                totals[key] += balance
+        for key in self.bottom_up:
+            parent = self.parent[key]
+            if parent is not None:
+                totals[parent] += totals[key]
+        return totals
+
+    def nested(self, totals, depth=None, types=None, signs=None):
+        """Return the root accounts as nested dicts, ``depth`` levels deep.
+
+        ``types`` limits the roots to those account types and ``signs`` maps
+        a type to the multiplier applied to its balances.
+        """
+        signs = signs or {}
+
+        def node(key, level):
+            account = self.accounts[key]
+            result = {
+                'code': account['code'],
+                'name': account['name'],
+                'type': account['type'],
+                'balance': totals[key] * signs.get(account['type'], 1),
+            }
+            if self.children[key] and (depth is None or level < depth):
+                result['children'] = [node(child, level + 1) for child in self.children[key]]
+            return result
+
+        return [node(key, 1) for key in self.roots
+                if types is None or self.accounts[key]['type'] in types]
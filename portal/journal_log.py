@@ -0,0 +1,334 @@
+"""Append-only, group-committed journal log with snapshot checkpoints.
+
+Every posting is written as one compact JSON array per line to the current
+segment file.  Writers never call ``fsync`` themselves: ``append`` queues
+the line and returns its sequence number, and a background thread writes
+whatever has queued up, fsyncs once for the whole batch and wakes everyone
+blocked in ``wait(seq)``.  Under load many postings share one fsync.
+
+``begin_checkpoint`` captures the journal rows posted since the previous
+checkpoint and switches new records to a fresh segment; the returned
+callable writes them (atomically, via rename) and can run on a background
+thread.  The rows go to a columnar chunk file written once, so a
+checkpoint costs the interval rather than the whole ledger, both under the
+journal lock and on disk.  The snapshot itself records only the last id it
+covers and the list of chunks.  Once it is published, the segments and the
+older snapshots it covers are deleted, so every row is stored once.
+
+``recover`` loads the newest snapshot's chunks and replays only the
+segments written after it.  Columnar chunks load much faster than log
+lines, but the portal keeps the whole journal in memory, so recovery
+still reads every row and its time grows with the ledger.
+
+Layout of the log directory after checkpoints at records M and N::
+
+    rows-000000000001.json      records 1..M, as columns
+    rows-00000000000M+1.json    records M+1..N
+    snapshot-00000000000N.json  last id N and the chunk list
+    journal-00000000000N+1.log  records N+1..
+
+Sequence numbers are journal entry ids, which the portal assigns as
+position + 1.
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+FIELDS = ('id', 'date', 'debit_account', 'credit_account', 'amount', 'description', 'user', 'currency',
+          'lines', 'entity')
+# Fields left out of an entry while they are None.
+OPTIONAL = ('lines', 'entity')
+
+
+def encode(entry):
+    """Return the compact log line for a journal entry dict."""
+    values = [entry.get(field) for field in FIELDS]
+    values[1] = values[1].isoformat()
+    return json.dumps(values, separators=(',', ':'), default=str) + '\n'
+
+
+def decode(line, dates):
+    """Return the journal entry dict for a log line.
+
+    ``dates`` memoises parsed timestamps across calls.
+    """
+    entry = dict(zip(FIELDS, json.loads(line)))
+    for field in OPTIONAL:
+        if entry.get(field) is None:
+            entry.pop(field, None)
+    stamp = entry['date']
+    parsed = dates.get(stamp)
+    if parsed is None:
+        parsed = dates[stamp] = datetime.fromisoformat(stamp)
+    entry['date'] = parsed
+    return entry
+
+
+def _segment_name(first_seq):
+    return f'journal-{first_seq:012d}.log'
+
+
+def _snapshot_name(last_seq):
+    return f'snapshot-{last_seq:012d}.json'
+
+
+def _chunk_name(first_seq):
+    return f'rows-{first_seq:012d}.json'
+
+
+def _write_json(path, value):
+    """Write ``value`` to ``path`` atomically and durably."""
+    with open(path + '.tmp', 'w', encoding='utf-8') as handle:
+        json.dump(value, handle, separators=(',', ':'), default=str)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def _rows(columns, dates):
+    """Return the journal entry dicts of a columnar chunk."""
+    for stamp in columns['date']:
+        if stamp not in dates:
+            dates[stamp] = datetime.fromisoformat(stamp)
+    columns['date'] = [dates[stamp] for stamp in columns['date']]
+    # Chunks written before a field existed lack its column.
+    for field in FIELDS:
+        columns.setdefault(field, [None] * len(columns['id']))
+    entries = [dict(zip(FIELDS, row)) for row in zip(*(columns[field] for field in FIELDS))]
+    # Only compound entries have lines, and only some an entity.
+    for entry in entries:
+        for field in OPTIONAL:
+            if entry[field] is None:
+                del entry[field]
+    return entries
+
+
+def _seq(name):
+    return int(name.split('-', 1)[1].split('.', 1)[0])
+
+
+class _Rotate:
+    """Queue marker telling the writer to start a new segment."""
+
+    def __init__(self, first_seq):
+        self.first_seq = first_seq
+
+
+class JournalLog:
+    """Durable log of journal postings; see the module docstring."""
+
+    def __init__(self, directory, commit_interval=0.002, checkpoint_every=100000):
+        self.directory = directory
+        self.commit_interval = commit_interval
+        self.checkpoint_every = checkpoint_every
+        os.makedirs(directory, exist_ok=True)
+
+        self.last_seq = 0
+        self._snapshot_seq = 0
+        # Rows up to _chunked_seq are in the chunk files listed in _chunks.
+        self._chunks = []
+        self._chunked_seq = 0
+        # Checkpoints are written in the order they were begun.
+        self._turn = threading.Condition()
+        self._checkpoints_begun = 0
+        self._checkpoints_written = 0
+        self._checkpoint_error = None
+        self._durable_seq = 0
+        self._queue = []
+        self._segment = None
+        self._cond = threading.Condition()
+        self._closed = False
+        self._error = None
+        self._writer = None
+
+    def recover(self):
+        """Rebuild and return the journal rows from the snapshot plus the log tail."""
+        names = sorted(os.listdir(self.directory))
+        snapshots = [name for name in names if name.startswith('snapshot-') and name.endswith('.json')]
+        entries = []
+        dates = {}
+        if snapshots:
+            with open(os.path.join(self.directory, snapshots[-1]), encoding='utf-8') as handle:
+                state = json.load(handle)
+            for name in state['chunks']:
+                with open(os.path.join(self.directory, name), encoding='utf-8') as handle:
+                    entries.extend(_rows(json.load(handle), dates))
+            self._chunks = list(state['chunks'])
+            self.last_seq = self._snapshot_seq = self._chunked_seq = state['last_seq']
+
+        tail = [name for name in names if name.startswith('journal-') and _seq(name) > self.last_seq]
+        for number, name in enumerate(tail):
+            with open(os.path.join(self.directory, name), 'rb+') as handle:
+                lines = handle.read().splitlines(keepends=True)
+                offset = 0
+                for raw in lines:
+                    try:
+                        if not raw.endswith(b'\n'):
+                            raise ValueError('unterminated record')
+                        entry = decode(raw, dates)
+                    except ValueError:
+                        if number != len(tail) - 1:
+                            raise
+                        # A torn final write from a crash; drop it.
+                        handle.truncate(offset)
+                        break
+                    offset += len(raw)
+                    entries.append(entry)
+                    self.last_seq = entry['id']
+        self._durable_seq = self.last_seq
+        self._open_segment(_seq(tail[-1]) if tail else self.last_seq + 1)
+        return entries
+
+    def adopt(self, entries):
+        """Make ``entries``, loaded from elsewhere, the base snapshot of an empty log."""
+        self.last_seq = self._durable_seq = len(entries)
+        self.begin_checkpoint(entries)()
+
+    def _open_segment(self, first_seq):
+        if self._segment is not None:
+            self._segment.close()
+        self._segment = open(os.path.join(self.directory, _segment_name(first_seq)), 'a', encoding='utf-8')
+
+    def append(self, entry):
+        """Queue ``entry`` for writing and return its sequence number.
+
+        Callers must append entries in id order.
+        """
+        line = encode(entry)
+        with self._cond:
+            if self._error is not None:
+                raise self._error
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name='journal-log', daemon=True)
+                self._writer.start()
+            self._queue.append(line)
+            self.last_seq = entry['id']
+            self._cond.notify_all()
+            return self.last_seq
+
+    def wait(self, seq, timeout=None):
+        """Block until every record up to ``seq`` is on disk.  False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._durable_seq < seq:
+                if self._error is not None:
+                    raise self._error
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def needs_checkpoint(self):
+        return self.last_seq - self._snapshot_seq >= self.checkpoint_every
+
+    def begin_checkpoint(self, entries):
+        """Capture state for a snapshot and return a callable that writes it.
+
+        Must be called while no postings are being appended (the portal holds
+        its journal lock), so ``entries`` and the log agree.  The capture is
+        a shallow copy of the rows since the last checkpoint; the returned
+        callable does the slow part.
+        """
+        with self._cond:
+            seq = self.last_seq
+            self._snapshot_seq = seq
+            first = self._chunked_seq + 1
+            rows = entries[first - 1:seq]
+            chunk = None
+            if rows:
+                chunk = _chunk_name(first)
+                self._chunks.append(chunk)
+            self._chunked_seq = seq
+            chunks = list(self._chunks)
+            self._queue.append(_Rotate(seq + 1))
+            self._cond.notify_all()
+        with self._turn:
+            ticket = self._checkpoints_begun
+            self._checkpoints_begun += 1
+
+        def write():
+            with self._turn:
+                while self._checkpoints_written < ticket:
+                    self._turn.wait()
+                try:
+                    if self._checkpoint_error is not None:
+                        raise self._checkpoint_error
+                    return self._write_checkpoint(seq, chunk, rows, chunks)
+                except Exception as e:
+                    # A later snapshot would list a chunk that was never written.
+                    self._checkpoint_error = e
+                    raise
+                finally:
+                    self._checkpoints_written += 1
+                    self._turn.notify_all()
+        return write
+
+    def _write_checkpoint(self, seq, chunk, rows, chunks):
+        if chunk is not None:
+            columns = {field: [row.get(field) for row in rows] for field in FIELDS}
+            columns['date'] = [stamp.isoformat() for stamp in columns['date']]
+            _write_json(os.path.join(self.directory, chunk), columns)
+        # Only publish the snapshot once the records it covers are durable.
+        self.wait(seq)
+        path = os.path.join(self.directory, _snapshot_name(seq))
+        _write_json(path, {'last_seq': seq, 'chunks': chunks})
+        for name in os.listdir(self.directory):
+            covered = (name.startswith('snapshot-') and name.endswith('.json') and _seq(name) < seq
+                       or name.startswith('journal-') and name.endswith('.log') and _seq(name) <= seq)
+            if covered:
+                os.remove(os.path.join(self.directory, name))
+        return path
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._queue:
+                    return
+            # Let concurrent writers join this batch before paying for fsync.
+            time.sleep(self.commit_interval)
+            with self._cond:
+                batch, self._queue = self._queue, []
+                seq = self.last_seq
+            try:
+                lines = []
+                for item in batch:
+                    if isinstance(item, _Rotate):
+                        self._flush(lines)
+                        lines = []
+                        self._open_segment(item.first_seq)
+                    else:
+                        lines.append(item)
+                self._flush(lines)
+            except Exception as e:
+                # Fail every waiter and later append rather than leave them blocked.
+                with self._cond:
+                    self._error = e
+                    self._cond.notify_all()
+                return
+            with self._cond:
+                self._durable_seq = seq
+                self._cond.notify_all()
+
+    def _flush(self, lines):
+        if lines:
+            self._segment.write(''.join(lines))
+        self._segment.flush()
+        os.fsync(self._segment.fileno())
+
+    def close(self):
+        """Write outstanding records and stop the background writer."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            writer = self._writer
+        if writer is not None:
+            writer.join()
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
@@ -0,0 +1,157 @@
+"""Journal entry shapes and bulk journal imports.
+
+A journal entry is either simple, moving ``amount`` from ``credit_account``
+to ``debit_account``, or compound: a header (date, description, user,
+currency) with ``lines``, each ``{'account', 'debit', 'credit'}`` and an
+optional ``description``.  A compound entry's ``amount`` is its total
+debits and its ``debit_account``/``credit_account`` are None.  Balance is
+checked once, when the lines are built, so readers can take any entry
+apart with ``postings`` without checking it again.
+
+``parse_ndjson`` and ``parse_csv`` read import batches into
+``(line_number, entry)`` pairs; ``build_entry`` validates one of them.
+In NDJSON each line is an entry object with either ``lines`` or the simple
+``debit_account``/``credit_account``/``amount`` fields.  In CSV each row is
+one line, with columns ``entry,date,description,currency,account,debit,credit``
+and optionally ``entity``; consecutive rows with the same ``entry`` value form
+one entry and the header fields are read from its first row.  An entry may
+name the ``entity`` (legal entity) that books it.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+
+
+class JournalError(ValueError):
+    """A journal entry or import batch is malformed or unbalanced."""
+
+
+def postings(entry):
+    """Return ``(account, debit minus credit)`` pairs for ``entry``."""
+    lines = entry.get('lines')
+    if lines is None:
+        amount = entry['amount']
+        return ((entry['debit_account'], amount), (entry['credit_account'], -amount))
+    return [(line['account'], line['debit'] - line['credit']) for line in lines]
+
+
+def _amount(value, field):
+    if value in (None, ''):
+        return 0.0
+    try:
+        amount = float(value)
+    except (TypeError, ValueError):
+        raise JournalError(f'{field} must be a number') from None
+    if amount < 0 or amount != amount or amount == float('inf'):
+        raise JournalError(f'{field} must be a non-negative number')
+    return amount
+
+
+def balanced_lines(lines, accounts=None):
+    """Validate ``lines`` and return them normalised, with their total debits.
+
+    ``accounts`` maps account codes, as strings, to the chart's own codes;
+    when given, every line's account must be in it.  Raises JournalError.
+    """
+    if not isinstance(lines, list) or len(lines) < 2:
+        raise JournalError('an entry needs at least two lines')
+    result = []
+    debits = credits = 0.0
+    for number, line in enumerate(lines, 1):
+        if not isinstance(line, dict):
+            raise JournalError(f'line {number} must be an object')
+        account = line.get('account')
+        if account in (None, ''):
+            raise JournalError(f'line {number} has no account')
+        if accounts is not None:
+            if str(account) not in accounts:
+                raise JournalError(f'line {number}: unknown account {account}')
+            account = accounts[str(account)]
+        debit = _amount(line.get('debit'), f'line {number} debit')
+        credit = _amount(line.get('credit'), f'line {number} credit')
+        if (debit == 0) == (credit == 0):
+            raise JournalError(f'line {number} needs exactly one of debit and credit')
+        normalised = {'account': account, 'debit': debit, 'credit': credit}
+        if line.get('description'):
+            normalised['description'] = str(line['description'])
+        result.append(normalised)
+        debits += debit
+        credits += credit
+    if round(debits * 100) != round(credits * 100):
+        raise JournalError(f'debits {debits:.2f} do not equal credits {credits:.2f}')
+    return result, debits
+
+
+def entry_fields(lines, total):
+    """Return the account fields of an entry with balanced ``lines``.
+
+    A single debit against a single credit is stored as a simple entry.
+    """
+    if len(lines) == 2 and 'description' not in lines[0] and 'description' not in lines[1]:
+        debit, credit = lines if lines[0]['debit'] else lines[::-1]
+        return {'debit_account': debit['account'], 'credit_account': credit['account'], 'amount': total}
+    return {'debit_account': None, 'credit_account': None, 'amount': total, 'lines': lines}
+
+
+def build_entry(raw, accounts=None):
+    """Validate an imported or posted entry and return ``(date, fields, description, currency)``.
+
+    ``date`` is a datetime or None; ``fields`` comes from ``entry_fields``,
+    plus ``entity`` when the entry names one.  The currency is returned as
+    given, for the caller to check.
+    """
+    if not isinstance(raw, dict):
+        raise JournalError('an entry must be an object')
+    lines = raw.get('lines')
+    if lines is None:
+        amount = _amount(raw.get('amount'), 'amount')
+        if not raw.get('debit_account') or not raw.get('credit_account') or not amount:
+            raise JournalError('debit_account, credit_account and amount, or lines, are required')
+        lines = [{'account': raw['debit_account'], 'debit': amount},
+                 {'account': raw['credit_account'], 'credit': amount}]
+    lines, total = balanced_lines(lines, accounts)
+    day = raw.get('date')
+    if day:
+        try:
+            day = datetime.fromisoformat(str(day))
+        except ValueError:
+            raise JournalError('date must be YYYY-MM-DD or an ISO timestamp') from None
+    fields = entry_fields(lines, total)
+    if raw.get('entity'):
+        fields['entity'] = str(raw['entity']).strip()
+    return day or None, fields, str(raw.get('description') or ''), raw.get('currency')
+
+
+def parse_ndjson(text):
+    """Return ``(line_number, entry)`` pairs from NDJSON, skipping blank lines."""
+    entries = []
+    for number, line in enumerate(text.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            entries.append((number, json.loads(line)))
+        except ValueError:
+            raise JournalError(f'line {number}: not valid JSON') from None
+    return entries
+
+
+def parse_csv(text):
+    """Return ``(line_number, entry)`` pairs from CSV lines grouped by ``entry``."""
+    reader = csv.DictReader(io.StringIO(text))
+    columns = reader.fieldnames or ()
+    missing = [column for column in ('entry', 'account', 'debit', 'credit') if column not in columns]
+    if missing:
+        raise JournalError(f'missing CSV columns: {", ".join(missing)}')
+    entries = []
+    key = None
+    for row in reader:
+        if row['entry'] != key or not entries:
+            key = row['entry']
+            entries.append((reader.line_num, {'date': row.get('date'), 'description': row.get('description'),
+                                              'currency': row.get('currency'), 'entity': row.get('entity'),
+                                              'lines': []}))
+        entries[-1][1]['lines'].append({'account': row['account'], 'debit': row['debit'],
+                                        'credit': row['credit']})
+    return entries
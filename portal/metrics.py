@@ -0,0 +1,240 @@
+"""Request metrics, function timing and slow-request profiling for the portal.
+
+``init_app(app)`` installs ``before_request``/``after_request`` hooks that
+record, per route and method, a latency histogram, request and response
+size histograms, a status-coded request counter and an in-flight gauge.
+``timed`` wraps internal functions so their durations land in a histogram
+of their own.  ``render`` returns everything in the Prometheus text format
+served on ``/metrics``.
+
+Setting ``PORTAL_PROFILE_SLOW_MS`` turns on a sampling profiler: while a
+request runs, a background thread samples its stack every
+``PORTAL_PROFILE_INTERVAL_MS`` milliseconds, and if the request ends up
+slower than the threshold the samples are written to
+``PORTAL_PROFILE_DIR`` as folded stacks, the input format of
+``flamegraph.pl`` and speedscope.
+"""
+
+import bisect
+import functools
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+from flask import g, request
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values."""
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            snapshot = [(labels, list(counts), total, count)
+                        for labels, (counts, total, count) in sorted(self._series.items())]
+        for labels, counts, total, count in snapshot:
+            base = _labels(self.label_names, labels)
+            running = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                running += bucket_count
+                lines.append(f'{self.name}_bucket{{{base}le="{bound}"}} {running}')
+            lines.append(f'{self.name}_bucket{{{base}le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{base.rstrip(",")}}} {total}')
+            lines.append(f'{self.name}_count{{{base.rstrip(",")}}} {count}')
+        return lines
+
+
+class Counters:
+    """Counter or gauge family keyed by a tuple of label values."""
+
+    def __init__(self, name, help_text, label_names, kind='counter'):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.kind = kind
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def add(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        for labels, value in snapshot:
+            lines.append(f'{self.name}{{{_labels(self.label_names, labels).rstrip(",")}}} {value:g}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values):
+    return ''.join(f'{name}="{_escape(value)}",' for name, value in zip(names, values))
+
+
+REQUEST_LATENCY = Histogram('portal_http_request_duration_seconds', 'Request latency by route.',
+                            ('route', 'method'), LATENCY_BUCKETS)
+REQUEST_SIZE = Histogram('portal_http_request_size_bytes', 'Request body size by route.',
+                         ('route', 'method'), SIZE_BUCKETS)
+RESPONSE_SIZE = Histogram('portal_http_response_size_bytes', 'Response body size by route.',
+                          ('route', 'method'), SIZE_BUCKETS)
+REQUESTS = Counters('portal_http_requests_total', 'Completed requests by route and status.',
+                    ('route', 'method', 'status'))
+IN_FLIGHT = Counters('portal_http_requests_in_flight', 'Requests currently being served.',
+                     ('route', 'method'), kind='gauge')
+FUNCTION_LATENCY = Histogram('portal_function_duration_seconds', 'Duration of instrumented functions.',
+                             ('function',), LATENCY_BUCKETS)
+
+FAMILIES = [REQUEST_LATENCY, REQUEST_SIZE, RESPONSE_SIZE, REQUESTS, IN_FLIGHT, FUNCTION_LATENCY]
+
+
+def timed(func):
+    """Record each call of ``func`` in ``portal_function_duration_seconds``."""
+    labels = (func.__name__,)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            FUNCTION_LATENCY.observe(labels, time.perf_counter() - started)
+    return wrapper
+
+
+def render():
+    """Return all metric families in the Prometheus text exposition format."""
+    lines = []
+    for family in FAMILIES:
+        lines.extend(family.render())
+    return '\n'.join(lines) + '\n'
+
+
+class SlowRequestProfiler:
+    """Samples the stacks of in-flight requests and keeps the slow ones."""
+
+    def __init__(self, threshold_seconds, interval_seconds, output_dir):
+        self.threshold = threshold_seconds
+        self.interval = interval_seconds
+        self.output_dir = output_dir
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, thread_id):
+        with self._lock:
+            self._active[thread_id] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='portal-profiler', daemon=True)
+                self._thread.start()
+
+    def finish(self, thread_id, route, duration):
+        with self._lock:
+            samples = self._active.pop(thread_id, None)
+        if not samples or duration < self.threshold:
+            return None
+        os.makedirs(self.output_dir, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+        path = os.path.join(self.output_dir, f'{time.strftime("%Y%m%d-%H%M%S")}-{int(duration * 1000)}ms-{slug}.folded')
+        with open(path, 'w', encoding='utf-8') as handle:
+            for stack, count in samples.most_common():
+                handle.write(f'{stack} {count}\n')
+        return path
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, samples in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        samples[_fold(frame)] += 1
+
+
+def _fold(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(stack))
+
+
+def _route():
+    rule = request.url_rule
+    return rule.rule if rule is not None else '<unmatched>'
+
+
+def init_app(app):
+    """Install the request hooks on ``app`` and configure optional profiling."""
+    slow_ms = os.environ.get('PORTAL_PROFILE_SLOW_MS')
+    profiler = None
+    if slow_ms:
+        profiler = SlowRequestProfiler(
+            float(slow_ms) / 1000,
+            float(os.environ.get('PORTAL_PROFILE_INTERVAL_MS', '5')) / 1000,
+            os.environ.get('PORTAL_PROFILE_DIR', 'profiles'),
+        )
+    app.extensions['portal_metrics'] = profiler
+
+    @app.before_request
+    def _start_request_timer():
+        g.metrics_started = time.perf_counter()
+        g.metrics_labels = (_route(), request.method)
+        IN_FLIGHT.add(g.metrics_labels, 1)
+        if profiler is not None:
+            profiler.start(threading.get_ident())
+
+    @app.after_request
+    def _record_request(response):
+        labels = g.get('metrics_labels')
+        if labels is None:
+            return response
+        duration = time.perf_counter() - g.metrics_started
+        REQUEST_LATENCY.observe(labels, duration)
+        REQUEST_SIZE.observe(labels, request.content_length or 0)
+        if not response.is_streamed:
+            RESPONSE_SIZE.observe(labels, response.calculate_content_length() or 0)
+        REQUESTS.add(labels + (str(response.status_code),))
+        if profiler is not None:
+            profiler.finish(threading.get_ident(), labels[0], duration)
+        return response
+
+    @app.teardown_request
+    def _end_request(_exc):
+        labels = g.pop('metrics_labels', None)
+        if labels is not None:
+            IN_FLIGHT.add(labels, -1)
+        if profiler is not None:
+            profiler.finish(threading.get_ident(), '', 0)
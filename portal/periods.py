@@ -0,0 +1,100 @@
+"""Period close: frozen closing balances over the journal.
+
+Closing the books before a date folds every journal entry dated earlier
+into per-account balances, moves the revenue and expense balances into a
+retained earnings account and locks the period against further postings.
+The result is a close record:
+
+    {'id', 'before', 'through_id', 'carry', 'balances', 'entity_balances',
+     'net_income', 'retained_earnings', 'user', 'closed_at'}
+
+``through_id`` is the last journal id that existed at the close and
+``carry`` lists the ids among those dated on or after ``before``; together
+with everything posted later they are the open period.  ``balances`` is a
+list of ``[account, debits minus credits]`` pairs in the base currency, a
+list rather than a dict so account codes survive a JSON round trip.
+``entity_balances`` holds the same figures split by entity as
+``[entity, account, value]`` triples, each entity closing into its own
+retained earnings; closes recorded before entities existed read as the
+default entity's.
+
+``open_positions`` yields the journal positions of the open period, so a
+statement costs the frozen balances plus the open entries, however old the
+ledger is.  A later close starts from the previous one and walks only the
+open period.  All dates are ``date`` objects or ISO strings.
+"""
+
+from datetime import date, datetime
+from itertools import chain
+
+from portal.ledger import JournalError, postings
+
+CLOSED_TYPES = ('Revenue', 'Expense')
+
+
+class PeriodClosed(JournalError):
+    """A posting is dated inside a closed period."""
+
+
+def closed_before(close):
+    """Return the first open ``date`` of ``close``, or None for no close."""
+    return date.fromisoformat(close['before']) if close else None
+
+
+def check_open(close, day):
+    """Raise ``PeriodClosed`` if ``day`` (a date or datetime) falls in a closed period."""
+    before = closed_before(close)
+    if before is None:
+        return
+    if isinstance(day, datetime):
+        day = day.date()
+    if day < before:
+        raise PeriodClosed(f'the books are closed before {before.isoformat()}')
+
+
+def open_positions(entries, close):
+    """Return the journal positions of the entries ``close`` left open."""
+    if close is None:
+        return range(len(entries))
+    return chain((entry_id - 1 for entry_id in close['carry']), range(close['through_id'], len(entries)))
+
+
+def close_period(entries, previous, before, account_types, retained_earnings, factors=None,
+                 default_entity=None):
+    """Return the balances, entity balances, carried ids and net income of closing before ``before``.
+
+    ``previous`` is the latest close record or None.  ``account_types`` maps
+    account codes to chart types; balances of ``CLOSED_TYPES`` accounts move
+    to ``retained_earnings``.  ``factors``, when given, converts each entry
+    (by position) into the base currency.  Entries without an entity belong
+    to ``default_entity``.
+    """
+    by_entity = {}
+    if previous:
+        rows = previous.get('entity_balances')
+        if rows is None:
+            rows = [[default_entity, account, value] for account, value in previous['balances']]
+        by_entity = {(entity, account): value for entity, account, value in rows}
+    carry = []
+    for position in open_positions(entries, previous):
+        entry = entries[position]
+        if entry['date'].date() >= before:
+            carry.append(entry['id'])
+            continue
+        entity = entry.get('entity') or default_entity
+        factor = 1.0 if factors is None else factors[position]
+        for account, amount in postings(entry):
+            key = (entity, account)
+            by_entity[key] = by_entity.get(key, 0.0) + amount * factor
+    closed = {}
+    for key in [key for key in by_entity if account_types.get(key[1]) in CLOSED_TYPES]:
+        closed[key[0]] = closed.get(key[0], 0.0) + by_entity.pop(key)
+    for entity, value in closed.items():
+        key = (entity, retained_earnings)
+        by_entity[key] = by_entity.get(key, 0.0) + value
+    balances = {retained_earnings: 0.0}
+    for (_, account), value in by_entity.items():
+        balances[account] = balances.get(account, 0.0) + value
+    entity_balances = [[entity, account, value] for (entity, account), value in by_entity.items()]
+    return ([[account, value] for account, value in balances.items()], entity_balances, carry,
+            -sum(closed.values()))
@@ -0,0 +1,134 @@
+"""Owner-scoped prefix search over the portal's in-memory stores.
+
+``SearchIndex`` keeps an inverted index from lower-cased word tokens to
+posting lists of ``(kind, id)`` references, one list per owner plus one
+covering every owner for admins.  The vocabulary is kept sorted, so a
+prefix maps to a contiguous range of terms found with ``bisect``.
+
+The index is maintained incrementally: each source store is a list that
+only grows, and before answering a query the index tokenises just the
+records appended since the last query.  Records added by any code path,
+including datasets and other workers' writes, are therefore picked up.
+
+A query is answered by choosing the query term whose matching postings are
+smallest, walking those postings from their newest end and checking the remaining
+terms against each candidate's own short token list, stopping once
+``limit`` results are found.  Query cost therefore depends on the rarest
+term and the result limit, not on the number of documents.
+"""
+
+import bisect
+import re
+import threading
+
+_TOKEN = re.compile(r'\w+')
+
+# Prefixes matching more terms than this are not used to drive a query.
+MAX_EXPANSION = 2000
+
+
+def tokenize(text):
+    return _TOKEN.findall(text.lower()) if text else []
+
+
+class SearchIndex:
+    """Inverted index over ``sources``; see the module docstring.
+
+    ``sources`` maps a kind to ``(store, owner_field, text)`` where
+    ``store`` is an append-only list of dicts with an ``id`` and
+    ``text(record)`` returns the searchable strings.
+    """
+
+    def __init__(self, sources):
+        self.sources = sources
+        self._indexed = dict.fromkeys(sources, 0)
+        self._postings = {}
+        self._terms = []
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Index records appended to the sources since the last call."""
+        with self._lock:
+            for kind, (store, owner_field, text) in self.sources.items():
+                pending = store[self._indexed[kind]:]
+                for record in pending:
+                    self._add(kind, record, record.get(owner_field), text(record))
+                self._indexed[kind] += len(pending)
+
+    def _add(self, kind, record, owner, texts):
+        ref = (kind, record['id'])
+        tokens = []
+        for text in texts:
+            tokens.extend(tokenize(text))
+        tokens = tuple(dict.fromkeys(tokens))
+        self._tokens[ref] = tokens
+        for token in tokens:
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {None: []}
+                bisect.insort(self._terms, token)
+            postings[None].append(ref)
+            if owner is not None:
+                postings.setdefault(owner, []).append(ref)
+
+    def _expand(self, prefix):
+        low = bisect.bisect_left(self._terms, prefix)
+        high = bisect.bisect_left(self._terms, prefix + '\U0010ffff', low)
+        return self._terms[low:high]
+
+    def search(self, query, owner=None, kinds=None, limit=20):
+        """Return up to ``limit`` ``(kind, id)`` matches for ``query``, recent first.
+
+        Every query word matches as a prefix of some word in the document.
+        ``owner=None`` searches every owner's documents.
+        """
+        words = list(dict.fromkeys(tokenize(query)))
+        if not words or limit <= 0:
+            return []
+        self.refresh()
+        with self._lock:
+            plans = []
+            for word in words:
+                terms = self._expand(word)
+                if not terms:
+                    return []
+                if len(terms) > MAX_EXPANSION:
+                    cost = float('inf')
+                else:
+                    cost = sum(len(self._postings[term].get(owner, ())) for term in terms)
+                plans.append((cost, len(terms), word, terms))
+            plans.sort()
+            terms = plans[0][3]
+            rest = [word for _, _, word, _ in plans[1:]]
+            postings = [self._postings[term].get(owner, ()) for term in terms]
+            results = []
+            seen = set()
+            for ref in _newest_first(postings):
+                if ref in seen:
+                    continue
+                seen.add(ref)
+                if kinds is not None and ref[0] not in kinds:
+                    continue
+                tokens = self._tokens[ref]
+                if all(any(token.startswith(word) for token in tokens) for word in rest):
+                    results.append(ref)
+                    if len(results) >= limit:
+                        break
+            return results
+
+
+def _newest_first(postings):
+    """Yield references from several posting lists, each walked from its end."""
+    if len(postings) == 1:
+        yield from reversed(postings[0])
+        return
+    iterators = [reversed(posting) for posting in postings if posting]
+    while iterators:
+        alive = []
+        for iterator in iterators:
+            ref = next(iterator, None)
+            if ref is not None:
+                yield ref
+                alive.append(iterator)
+        iterators = alive
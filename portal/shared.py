@@ -0,0 +1,275 @@
+"""Shared state for running the portal under several worker processes.
+
+Every worker keeps its own in-memory copy of the stores, so reads never
+leave the process.  Writes go through one append-only change log on local
+disk that all workers share:
+
+* ``write()`` takes an exclusive ``flock`` on the log (one writer at a
+  time across every worker), applies whatever other workers appended since
+  this worker last looked, runs the caller's block, and then appends one
+  line per record the block added to the stores.
+* ``sync()`` is called before each request.  When the log has not grown it
+  costs one ``fstat``; otherwise it reads just the new bytes and applies
+  them.
+
+Because the lock holder is always up to date before it runs, ids handed out
+as ``len(store) + 1`` agree across workers.  Records are appended whole
+with a single ``write`` on an ``O_APPEND`` descriptor; readers only consume
+complete lines, so they never see half a record.
+
+The log is also the persistent record of every change: a restarted worker
+replays it from the start.  ``compact()`` keeps that replay proportional to
+the live state: it rewrites the log as the records needed to rebuild the
+stores, replacing superseded records (such as idempotency responses that
+have aged out) with a snapshot of their current state, and swaps the new
+file in.  It then appends a marker to the old file; a worker that reads the
+marker, or a forked worker whose inherited log was replaced, reopens the
+log and re-reads it, skipping the records it already holds.
+
+Locking uses ``fcntl.flock`` and is POSIX only.
+"""
+
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+_FLAGS = os.O_RDWR | os.O_CREAT | os.O_APPEND
+# Appended to a log once compact() has replaced it.
+_COMPACTED = 'compacted'
+
+
+class SharedStore:
+    """Keeps ``stores`` in step with a change log shared between processes.
+
+    ``stores`` maps a record kind to the list holding those records; any
+    record a ``write()`` block appends to one of them is published
+    automatically.  ``appliers`` maps further kinds to a callable that
+    applies one record; records of those kinds are published explicitly
+    with ``publish``.  ``datetime_fields`` names, per kind, fields holding
+    ``datetime`` values.  ``record_types`` maps a kind to a callable turning
+    a decoded dict into the row kept in its store; records of any mapping
+    type are published.  ``snapshots`` maps an ``appliers`` kind to a
+    callable returning records that rebuild its current state, which
+    ``compact()`` writes in place of the logged ones; applying them again
+    must be harmless.
+    """
+
+    def __init__(self, path, stores, appliers=None, datetime_fields=None, fsync=False, record_types=None,
+                 snapshots=None):
+        self.path = path
+        self.stores = stores
+        self.appliers = appliers or {}
+        self.snapshots = snapshots or {}
+        self.datetime_fields = datetime_fields or {}
+        self.record_types = record_types or {}
+        self.fsync = fsync
+        self._offset = 0
+        self._fd = None
+        self._pid = None
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._published = []
+        self._generation = 0
+        self._applied = {}
+        self._skip = {}
+        # Rows already in the stores (e.g. a loaded dataset) are not in the log.
+        self._base = {kind: len(store) for kind, store in stores.items()}
+
+    def _descriptor(self):
+        # flock belongs to the open file description, so a descriptor
+        # inherited across fork() would not exclude the parent.  Open one per
+        # process.
+        if self._pid != os.getpid():
+            inherited = self._fd
+            self._fd = os.open(self.path, _FLAGS, 0o644)
+            self._pid = os.getpid()
+            self._generation += 1
+            if inherited is not None and os.fstat(inherited).st_ino != os.fstat(self._fd).st_ino:
+                self._restart()
+        return self._fd
+
+    def _reopen(self):
+        old = self._fd
+        self._fd = os.open(self.path, _FLAGS, 0o644)
+        os.close(old)
+        self._generation += 1
+        self._restart()
+
+    def _restart(self):
+        # The log was compacted: read the new one from the start, skipping
+        # the store rows and applied records this worker already has.
+        self._offset = 0
+        self._skip = {kind: len(store) - self._base[kind] for kind, store in self.stores.items()}
+        self._skip.update((kind, count) for kind, count in self._applied.items() if kind not in self.snapshots)
+
+    def sync(self):
+        """Apply records appended by other workers.  Returns how many."""
+        fd = self._descriptor()
+        if os.fstat(fd).st_size == self._offset:
+            return 0
+        with self._lock:
+            applied = 0
+            while True:
+                fd = self._fd
+                size = os.fstat(fd).st_size
+                data = os.pread(fd, size - self._offset, self._offset)
+                end = data.rfind(b'\n') + 1
+                if not end:
+                    return applied
+                for line in data[:end].splitlines():
+                    kind, record = json.loads(line)
+                    if kind == _COMPACTED:
+                        self._reopen()
+                        break
+                    if self._skip.get(kind):
+                        self._skip[kind] -= 1
+                        continue
+                    self._apply(kind, record)
+                    applied += 1
+                else:
+                    self._offset += end
+                    return applied
+
+    def _lock_log(self):
+        # Lock the current log, following it to its replacement if it was
+        # compacted while this worker waited.
+        while True:
+            fd = self._descriptor()
+            generation = self._generation
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                self.sync()
+            except BaseException:
+                if self._generation == generation:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                raise
+            if self._generation == generation:
+                return fd
+
+    @contextmanager
+    def write(self):
+        """Run the block as the only writer and publish what it adds.
+
+        Blocks nest; records are published when the outermost one exits.
+        If it raises, nothing is published and the rows the block added are
+        removed from the stores again, so this worker stays in step with the
+        log.  Changes made through ``appliers`` kinds are not undone.
+        """
+        with self._lock:
+            outer = self._depth == 0
+            fd = self._lock_log() if outer else self._fd
+            self._depth += 1
+            marks = None
+            try:
+                if outer:
+                    marks = {kind: len(store) for kind, store in self.stores.items()}
+                    self._published = []
+                yield self
+                if outer:
+                    lines = [self._encode(kind, record)
+                             for kind, store in self.stores.items()
+                             for record in store[marks[kind]:]]
+                    lines.extend(self._encode(kind, record) for kind, record in self._published)
+                    if lines:
+                        data = ''.join(lines).encode('utf-8')
+                        written = os.write(fd, data)
+                        if written != len(data):
+                            raise OSError(f'short write to {self.path}')
+                        if self.fsync:
+                            os.fsync(fd)
+                        self._offset += written
+                    for kind, _ in self._published:
+                        self._applied[kind] = self._applied.get(kind, 0) + 1
+            except BaseException:
+                if marks is not None:
+                    for kind, store in self.stores.items():
+                        del store[marks[kind]:]
+                raise
+            finally:
+                self._depth -= 1
+                if outer:
+                    self._published = []
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def publish(self, kind, record):
+        """Queue a record of one of the ``appliers`` kinds from inside ``write()``."""
+        if not self._depth:
+            raise RuntimeError('publish() must be called inside write()')
+        self._published.append((kind, record))
+
+    def compact(self):
+        """Rewrite the log as the records that rebuild the current state.
+
+        Store rows are kept in order, ``snapshots`` kinds are replaced by
+        their current records and other ``appliers`` records are kept as
+        logged.  Must not be called inside ``write()``.  Returns the size of
+        the new log in bytes.
+        """
+        with self._lock:
+            if self._depth:
+                raise RuntimeError('compact() cannot be called inside write()')
+            old = self._lock_log()
+            try:
+                kept = tuple(b'[' + json.dumps(kind).encode() + b','
+                             for kind in self.appliers if kind not in self.snapshots)
+                lines = [line + b'\n' for line in os.pread(old, self._offset, 0).splitlines()
+                         if line.startswith(kept)]
+                lines.extend(self._encode(kind, record).encode('utf-8')
+                             for kind, store in self.stores.items() for record in store[self._base[kind]:])
+                lines.extend(self._encode(kind, record).encode('utf-8')
+                             for kind, snapshot in self.snapshots.items() for record in snapshot())
+                data = b''.join(lines)
+                temporary = f'{self.path}.compact'
+                fd = os.open(temporary, _FLAGS | os.O_TRUNC, 0o644)
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                try:
+                    if os.write(fd, data) != len(data):
+                        raise OSError(f'short write to {temporary}')
+                    os.fsync(fd)
+                    os.replace(temporary, self.path)
+                except BaseException:
+                    os.close(fd)
+                    raise
+                os.write(old, self._encode(_COMPACTED, {}).encode('utf-8'))
+                if self.fsync:
+                    os.fsync(old)
+                self._fd, self._offset = fd, len(data)
+                self._generation += 1
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            finally:
+                # Closing the old descriptor releases its lock; waiting
+                # writers then read the marker and move to the new log.
+                if self._fd != old:
+                    os.close(old)
+                else:
+                    fcntl.flock(old, fcntl.LOCK_UN)
+            return len(data)
+
+    def _encode(self, kind, record):
+        if not isinstance(record, dict):
+            record = dict(record)
+        fields = self.datetime_fields.get(kind)
+        if fields:
+            record = {**record, **{name: record[name].isoformat() for name in fields
+                                   if isinstance(record.get(name), datetime)}}
+        return json.dumps([kind, record], separators=(',', ':'), default=str) + '\n'
+
+    def _apply(self, kind, record):
+        for name in self.datetime_fields.get(kind, ()):
+            if isinstance(record.get(name), str):
+                record[name] = datetime.fromisoformat(record[name])
+        store = self.stores.get(kind)
+        if store is not None:
+            make = self.record_types.get(kind)
+            store.append(record if make is None else make(record))
+        else:
+            self.appliers[kind](record)
+            self._applied[kind] = self._applied.get(kind, 0) + 1
+
+    def close(self):
+        if self._fd is not None and self._pid == os.getpid():
+            os.close(self._fd)
+        self._fd = self._pid = None
@@ -0,0 +1,339 @@
+"""Seeded synthetic data for load testing the portal and the Django backend.
+
+The generator produces owners, customers, vendors, invoices, bills, journal
+entries and bank transactions shaped exactly like the records ``app.py``
+creates, plus a hierarchical chart of accounts of any size up to 5,000
+codes.  Paid invoices and bills get a receipt or payment posting and a bank
+line, signed like the cash movement (receipts positive, bill payments
+negative) as ``/bank/reconcile`` expects; most of those bank lines match
+their posting exactly, some are near misses (a cent off, or a reworded
+description) and the rest is noise, so reconciliation has realistic work
+to do.
+
+Output is a directory of NDJSON files (one per store) plus ``chart.csv``,
+written as it is generated so memory stays flat.  Start the portal with
+``PORTAL_DATA_DIR`` pointing at the directory to load it.  ``--django``
+also bulk inserts the chart and the owners into the Django ``Account`` and
+``User`` tables.
+
+    python -m portal.synthetic --out data/large --owners 2000 --invoices 1000000
+    python -m portal.synthetic --out data/small --accounts 200 --django
+
+The same seed and options always produce byte-identical files.
+"""
+
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+from portal.hierarchy import parent_codes
+from portal.ledger import entry_fields
+
+ACCOUNT_TYPES = ['Asset', 'Liability', 'Equity', 'Revenue', 'Expense']
+MAX_ACCOUNTS = 1000 * len(ACCOUNT_TYPES)
+
+# Accounts every generated chart contains, because the portal looks them up
+# by name (cash flow, invoices, bills) or the statements need them.
+NAMED_ACCOUNTS = {
+    1000: 'Assets', 1100: 'Current Assets', 1110: 'Cash', 1120: 'Accounts Receivable',
+    2000: 'Liabilities', 2100: 'Current Liabilities', 2110: 'Accounts Payable',
+    3000: 'Equity', 3100: "Owner's Equity", 3200: 'Retained Earnings',
+    4000: 'Revenue', 4100: 'Rental Income',
+    5000: 'Expenses', 5100: 'Repair Expenses',
+}
+CASH, RECEIVABLE, PAYABLE = 1110, 1120, 2110
+
+SYNTHETIC_PASSWORD = 'Synthetic123!'
+
+_PREFIXES = ['North', 'Blue', 'Summit', 'Oak', 'Harbor', 'Granite', 'Silver', 'Maple',
+             'River', 'Pioneer', 'Cedar', 'Atlas', 'Crescent', 'Union', 'Evergreen', 'Acme']
+_SUFFIXES = ['Holdings', 'Properties', 'Partners', 'Supply', 'Services', 'Logistics',
+             'Builders', 'Realty', 'Management', 'Group', 'Trading', 'Works']
+_INVOICE_ITEMS = ['Monthly rent', 'Late fee', 'Parking space', 'Storage unit', 'Service charge',
+                  'Utilities recharge', 'Common area maintenance', 'Lease renewal fee']
+_BILL_ITEMS = ['Plumbing repair', 'Roof inspection', 'Cleaning service', 'Landscaping',
+               'Electrical work', 'Pest control', 'Painting', 'HVAC maintenance']
+_NOISE = ['ATM withdrawal', 'Bank fee', 'Interest credit', 'Card payment', 'Transfer']
+
+
+def _hierarchy_order(type_index):
+    """Codes for one account type, parents before children.
+
+    Type ``k`` owns ``k000``-``k999``; codes with more trailing zeros are
+    higher in the hierarchy (``1000`` > ``1100`` > ``1110`` > ``1111``).
+    """
+    base = (type_index + 1) * 1000
+    codes = range(base, base + 1000)
+
+    def depth(code):
+        digits = str(code)[1:]
+        return len(digits) - len(digits.rstrip('0')) if digits != '000' else 3
+    return sorted(codes, key=lambda code: (-depth(code), code))
+
+
+def chart_rows(n_accounts):
+    """Return ``n_accounts`` chart rows as dicts, named accounts first.
+
+    Raises ``ValueError`` if the chart cannot hold the named accounts or
+    exceeds the 5,000 four-digit codes available.
+    """
+    if not len(NAMED_ACCOUNTS) <= n_accounts <= MAX_ACCOUNTS:
+        raise ValueError(f'accounts must be between {len(NAMED_ACCOUNTS)} and {MAX_ACCOUNTS}')
+    codes = list(NAMED_ACCOUNTS)
+    pools = [[c for c in _hierarchy_order(k) if c not in NAMED_ACCOUNTS] for k in range(len(ACCOUNT_TYPES))]
+    position = 0
+    while len(codes) < n_accounts:
+        pool = pools[position % len(pools)]
+        if pool:
+            codes.append(pool.pop(0))
+        position += 1
+    rows = []
+    for code in sorted(codes):
+        type_index = code // 1000 - 1
+        name = NAMED_ACCOUNTS.get(code) or f'{ACCOUNT_TYPES[type_index]} {code}'
+        rows.append({'code': code, 'name': name, 'type': ACCOUNT_TYPES[type_index], 'description': ''})
+    return rows
+
+
+def leaf_codes(rows, acc_type):
+    """Codes of ``acc_type`` in ``rows`` that have no children by code prefix."""
+    codes = [row['code'] for row in rows if row['type'] == acc_type]
+    parents = set()
+    for code in codes:
+        stem = str(code).rstrip('0')
+        parents.update(stem[:i] for i in range(1, len(stem)))
+    return [code for code in codes if str(code).rstrip('0') not in parents]
+
+
+def make_chart(n_accounts):
+    """Return the chart from ``chart_rows`` as a DataFrame like ``app.chart_df``."""
+    import pandas as pd
+
+    return pd.DataFrame(chart_rows(n_accounts), columns=['code', 'name', 'type', 'description'])
+
+
+class _Writer:
+    """Buffered NDJSON writer that counts rows."""
+
+    def __init__(self, directory, name):
+        self.path = os.path.join(directory, f'{name}.ndjson')
+        self._handle = open(self.path, 'w', encoding='utf-8', buffering=1 << 20)
+        self._dumps = json.JSONEncoder(separators=(',', ':')).encode
+        self.count = 0
+
+    def write(self, row):
+        self._handle.write(self._dumps(row))
+        self._handle.write('\n')
+        self.count += 1
+
+    def close(self):
+        self._handle.close()
+
+
+def _company(rng, serial):
+    return f'{rng.choice(_PREFIXES)} {rng.choice(_SUFFIXES)} {serial}'
+
+
+def generate(out_dir, owners=100, customers_per_owner=20, vendors_per_owner=10,
+             invoices=10000, bills=5000, accounts=200, seed=0,
+             start=date(2023, 1, 1), days=730, paid_ratio=0.6, near_miss_ratio=0.1,
+             noise_ratio=0.05, log=None):
+    """Write a synthetic dataset to ``out_dir`` and return row counts per store."""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    chart = chart_rows(accounts)
+    revenue_codes = leaf_codes(chart, 'Revenue')
+    expense_codes = leaf_codes(chart, 'Expense')
+    day_strings = [(start + timedelta(days=d)).isoformat() for d in range(days + 60)]
+
+    with open(os.path.join(out_dir, 'chart.csv'), 'w', newline='', encoding='utf-8') as handle:
+        writer = csv.DictWriter(handle, fieldnames=['code', 'name', 'type', 'description'])
+        writer.writeheader()
+        writer.writerows(chart)
+
+    names = ['users', 'customers', 'vendors', 'invoices', 'bills', 'journal_entries', 'bank_transactions']
+    out = {name: _Writer(out_dir, name) for name in names}
+    journal, bank = out['journal_entries'], out['bank_transactions']
+
+    owner_names = [f'owner{i:05d}' for i in range(1, owners + 1)]
+    customers_by_owner = {}
+    vendors_by_owner = {}
+    for owner in owner_names:
+        out['users'].write({'username': owner, 'password': SYNTHETIC_PASSWORD})
+        customers_by_owner[owner] = []
+        for _ in range(customers_per_owner):
+            cid = out['customers'].count + 1
+            customers_by_owner[owner].append(cid)
+            out['customers'].write({'id': cid, 'name': _company(rng, cid),
+                                    'contact': f'ap{cid}@example.com', 'owner': owner})
+        vendors_by_owner[owner] = []
+        for _ in range(vendors_per_owner):
+            vid = out['vendors'].count + 1
+            vendors_by_owner[owner].append(vid)
+            out['vendors'].write({'id': vid, 'name': _company(rng, vid),
+                                  'contact': f'billing{vid}@example.com', 'owner': owner})
+
+    def post(day, debit, credit, amount, description, owner):
+        journal.write({'id': journal.count + 1, 'date': day, 'debit_account': debit,
+                       'credit_account': credit, 'amount': amount,
+                       'description': description, 'user': owner})
+
+    def post_lines(day, lines, total, description, owner):
+        journal.write({'id': journal.count + 1, 'date': day, **entry_fields(lines, total),
+                       'description': description, 'user': owner})
+
+    def bank_line(day, amount, description, owner):
+        roll = rng.random()
+        if roll < near_miss_ratio:
+            if rng.random() < 0.5:
+                amount = round(amount + rng.choice([-0.01, 0.01]), 2)
+            else:
+                description = description.upper() + ' REF'
+        bank.write({'id': bank.count + 1, 'date': day, 'amount': amount,
+                    'description': description, 'owner': owner})
+        if rng.random() < noise_ratio:
+            bank.write({'id': bank.count + 1, 'date': day,
+                        'amount': round(rng.uniform(-300, 300), 2),
+                        'description': f'{rng.choice(_NOISE)} {bank.count + 1}', 'owner': owner})
+
+    def documents(kind, count, parties, item_names, line_codes):
+        writer = out[kind]
+        label = 'Invoice' if kind == 'invoices' else 'Bill'
+        party_key = 'customer_id' if kind == 'invoices' else 'vendor_id'
+        for _ in range(count):
+            owner = rng.choice(owner_names)
+            doc_id = writer.count + 1
+            day_index = rng.randrange(days)
+            day = day_strings[day_index]
+            items = [{'description': rng.choice(item_names), 'account': rng.choice(line_codes),
+                      'amount': round(rng.uniform(20, 5000), 2)}
+                     for _ in range(rng.randint(1, 4))]
+            total = round(sum(item['amount'] for item in items), 2)
+            paid = rng.random() < paid_ratio
+            writer.write({'id': doc_id, party_key: rng.choice(parties[owner]), 'items': items,
+                          'total': total, 'date': day, 'status': 'paid' if paid else 'draft',
+                          'owner': owner})
+            # One compound entry per document, as the portal posts them.
+            if kind == 'invoices':
+                lines = [{'account': RECEIVABLE, 'debit': total, 'credit': 0.0}]
+                lines += [{'account': item['account'], 'debit': 0.0, 'credit': item['amount'],
+                           'description': item['description']} for item in items]
+            else:
+                lines = [{'account': item['account'], 'debit': item['amount'], 'credit': 0.0,
+                          'description': item['description']} for item in items]
+                lines.append({'account': PAYABLE, 'debit': 0.0, 'credit': total})
+            post_lines(day, lines, total, f'{label} {doc_id}', owner)
+            if paid:
+                settled = day_strings[day_index + rng.randrange(60)]
+                description = f'{label} {doc_id} payment'
+                if kind == 'invoices':
+                    post(settled, CASH, RECEIVABLE, total, description, owner)
+                    bank_line(settled, total, description, owner)
+                else:
+                    post(settled, PAYABLE, CASH, total, description, owner)
+                    bank_line(settled, -total, description, owner)
+            if log and writer.count % 100000 == 0:
+                log(f'{kind}: {writer.count:,} of {count:,}')
+
+    documents('invoices', invoices, customers_by_owner, _INVOICE_ITEMS, revenue_codes)
+    documents('bills', bills, vendors_by_owner, _BILL_ITEMS, expense_codes)
+
+    for writer in out.values():
+        writer.close()
+    counts = {name: writer.count for name, writer in out.items()}
+    counts['accounts'] = len(chart)
+    return counts
+
+
+def load_django(out_dir, batch_size=5000):
+    """Bulk insert the chart and owners from ``out_dir`` into the Django tables.
+
+    Existing codes and usernames are left alone.  Every synthetic user gets
+    the same password, hashed once.
+    """
+    backend_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend')
+    if backend_dir not in sys.path:
+        sys.path.insert(0, backend_dir)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+    import django
+    django.setup()
+    from django.contrib.auth import get_user_model
+    from django.contrib.auth.hashers import make_password
+    from django.db import transaction
+
+    from app.accounts.models import Account
+
+    User = get_user_model()
+    with open(os.path.join(out_dir, 'chart.csv'), newline='', encoding='utf-8') as handle:
+        accounts = [Account(code=row['code'], name=row['name'], type=row['type'],
+                            description=row['description']) for row in csv.DictReader(handle)]
+    password = make_password(SYNTHETIC_PASSWORD)
+    with open(os.path.join(out_dir, 'users.ndjson'), encoding='utf-8') as handle:
+        users = [User(username=row['username'], email=f"{row['username']}@example.com",
+                      role='owner', password=password)
+                 for row in map(json.loads, handle)]
+    with transaction.atomic():
+        Account.objects.bulk_create(accounts, batch_size=batch_size, ignore_conflicts=True)
+        User.objects.bulk_create(users, batch_size=batch_size, ignore_conflicts=True)
+        # Link each account to its parent by code prefix, leaving explicit parents alone.
+        saved = {account.code: account for account in Account.objects.all()}
+        orphans = [account for account in saved.values() if account.parent_id is None]
+        parents = parent_codes(saved)
+        linked = []
+        for account in orphans:
+            parent = saved.get(parents[account.code])
+            if parent is not None:
+                account.parent = parent
+                linked.append(account)
+        Account.objects.bulk_update(linked, ['parent'], batch_size=batch_size)
+    return {'accounts': len(accounts), 'users': len(users)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate a synthetic portal dataset.')
+    parser.add_argument('--out', required=True, help='directory to write the dataset to')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--owners', type=int, default=100)
+    parser.add_argument('--customers-per-owner', type=int, default=20)
+    parser.add_argument('--vendors-per-owner', type=int, default=10)
+    parser.add_argument('--invoices', type=int, default=10000)
+    parser.add_argument('--bills', type=int, default=5000)
+    parser.add_argument('--accounts', type=int, default=200, help=f'chart size, at most {MAX_ACCOUNTS}')
+    parser.add_argument('--start', type=date.fromisoformat, default=date(2023, 1, 1))
+    parser.add_argument('--days', type=int, default=730)
+    parser.add_argument('--paid-ratio', type=float, default=0.6)
+    parser.add_argument('--near-miss-ratio', type=float, default=0.1,
+                        help='share of bank lines that almost match their posting')
+    parser.add_argument('--noise-ratio', type=float, default=0.05,
+                        help='chance of an unrelated bank line after each real one')
+    parser.add_argument('--django', action='store_true',
+                        help='also insert the chart and owners into the Django database')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    try:
+        counts = generate(args.out, owners=args.owners, customers_per_owner=args.customers_per_owner,
+                          vendors_per_owner=args.vendors_per_owner, invoices=args.invoices,
+                          bills=args.bills, accounts=args.accounts, seed=args.seed,
+                          start=args.start, days=args.days, paid_ratio=args.paid_ratio,
+                          near_miss_ratio=args.near_miss_ratio, noise_ratio=args.noise_ratio,
+                          log=print)
+    except ValueError as e:
+        parser.error(str(e))
+    for name, count in counts.items():
+        print(f'{name:<18} {count:>12,}')
+    print(f'Wrote {sum(counts.values()):,} rows to {args.out} in {time.perf_counter() - started:.1f}s')
+    if args.django:
+        inserted = load_django(args.out)
+        print(f"Django: {inserted['accounts']:,} accounts and {inserted['users']:,} users submitted")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""Token bucket throttling for the portal's login route.
+
+A bucket holds up to ``capacity`` tokens and refills at ``rate`` tokens per
+second. Each request takes one token; when the bucket is empty the request
+is rejected and the caller is told how long to wait.
+
+Two stores are provided. ``MemoryBucketStore`` keeps buckets in the current
+process. ``RedisBucketStore`` keeps them in Redis so every worker shares the
+same limits; it needs the optional ``redis`` package.
+"""
+
+import os
+import threading
+import time
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - optional dependency
+    redis = None
+
+
+class MemoryBucketStore:
+    """In-process bucket store guarded by a lock."""
+
+    def __init__(self, max_keys=100000):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.max_keys = max_keys
+
+    def take(self, key, capacity, rate, now=None):
+        """Take one token from ``key``.  Returns ``(allowed, retry_after)``."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            if len(self._buckets) >= self.max_keys and key not in self._buckets:
+                self._evict_full(now, capacity, rate)
+            self._buckets[key] = (tokens, now)
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+    def _evict_full(self, now, capacity, rate):
+        # Buckets that have refilled completely carry no state worth keeping.
+        for key, (tokens, updated_at) in list(self._buckets.items()):
+            if tokens + (now - updated_at) * rate >= capacity:
+                del self._buckets[key]
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+# Refill and take in a single round trip so concurrent workers cannot race.
+_TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + (now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisBucketStore:
+    """Bucket store shared between processes through Redis."""
+
+    def __init__(self, url, prefix="portal:throttle:"):
+        if redis is None:
+            raise RuntimeError("RedisBucketStore requires the 'redis' package")
+        self._client = redis.Redis.from_url(url)
+        self._take = self._client.register_script(_TAKE_SCRIPT)
+        self.prefix = prefix
+
+    def take(self, key, capacity, rate, now=None):
+        now = time.time() if now is None else now
+        allowed, tokens = self._take(keys=[self.prefix + key], args=[capacity, rate, now])
+        tokens = float(tokens)
+        return bool(allowed), 0.0 if allowed else (1 - tokens) / rate
+
+    def clear(self):
+        for key in self._client.scan_iter(self.prefix + "*"):
+            self._client.delete(key)
+
+
+class Throttle:
+    """A named token bucket limit applied to arbitrary keys."""
+
+    def __init__(self, name, capacity, per_seconds, store):
+        self.name = name
+        self.capacity = float(capacity)
+        self.rate = self.capacity / per_seconds
+        self.store = store
+
+    def hit(self, ident):
+        """Consume a token for ``ident``.  Returns ``(allowed, retry_after)``."""
+        return self.store.take(f"{self.name}:{ident}", self.capacity, self.rate)
+
+
+def parse_rate(rate):
+    """Parse ``"10/min"`` style rates into ``(capacity, seconds)``."""
+    count, period = rate.split("/")
+    seconds = {"s": 1, "m": 60, "h": 3600, "d": 86400}[period[0].lower()]
+    return int(count), seconds
+
+
+def store_from_env():
+    """Return a Redis store when ``THROTTLE_REDIS_URL`` is set, else a memory store."""
+    url = os.environ.get("THROTTLE_REDIS_URL")
+    if url:
+        return RedisBucketStore(url)
+    return MemoryBucketStore()
@@ -1,3 +1,1022 @@
-from django.test import TestCase
+"""Tests for the Flask portal in ``app.py``.
 
-# Create your tests here.
+Run with ``python -m pytest tests.py`` or ``python -m unittest tests``.
+"""
+
+import gzip
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from datetime import date, datetime, timedelta
+
+import app as portal
+from portal import batch, compression, metrics, records, synthetic
+from portal.aging import AgingReport
+from portal.cash import CashPosition
+from portal.consolidation import consolidate
+from portal.fingerprint import FingerprintIndex
+from portal.fx import LedgerConversion, MissingRate, RateTable
+from portal.hierarchy import AccountTree, parent_codes
+from portal.journal_log import JournalLog
+from portal.ledger import JournalError, balanced_lines, parse_csv, postings
+from portal.periods import close_period, open_positions
+from portal.records import Customer, JournalEntry
+from portal.search import SearchIndex
+from portal.shared import SharedStore
+
+
+class PortalTestCase(unittest.TestCase):
+    def setUp(self):
+        portal.app.config['TESTING'] = True
+        self.client = portal.app.test_client()
+        portal._throttle_store.clear()
+
+    def login(self, username='Admin', password='PretiumAdmin007'):
+        return self.client.post('/login', json={'username': username, 'password': password})
+
+
+class LoginThrottleTests(PortalTestCase):
+    def test_login_succeeds(self):
+        response = self.login()
+        self.assertEqual(response.status_code, 200)
+
+    def test_username_bucket_rejects_repeated_attempts(self):
+        capacity = int(portal.LOGIN_USER_THROTTLE.capacity)
+        for _ in range(capacity):
+            self.assertEqual(self.login(password='wrong').status_code, 401)
+        throttled = self.login(username='admin ', password='wrong')
+        self.assertEqual(throttled.status_code, 429)
+        self.assertIn('Retry-After', throttled.headers)
+        self.assertEqual(self.login(username='someone-else').status_code, 401)
+
+
+class SyntheticDatasetTests(PortalTestCase):
+    STORES = ['CUSTOMERS', 'VENDORS', 'INVOICES', 'BILLS', 'BANK_TRANSACTIONS', 'JOURNAL_ENTRIES']
+
+    def setUp(self):
+        super().setUp()
+        saved = {name: list(getattr(portal, name)) for name in self.STORES}
+        saved_chart, saved_users = portal.chart_df, dict(portal.USERS)
+
+        def restore():
+            for name, rows in saved.items():
+                getattr(portal, name)[:] = rows
+            portal._set_chart(saved_chart)
+            portal.USERS.clear()
+            portal.USERS.update(saved_users)
+        self.addCleanup(restore)
+
+    def test_generated_dataset_loads_into_stores(self):
+        with tempfile.TemporaryDirectory() as directory:
+            counts = synthetic.generate(directory, owners=3, customers_per_owner=2, vendors_per_owner=1,
+                                        invoices=20, bills=10, accounts=40, seed=7)
+            portal.load_dataset(directory)
+
+        self.assertEqual(len(portal.chart_df), 40)
+        self.assertEqual(len(portal.INVOICES), counts['invoices'])
+        self.assertEqual(len(portal.JOURNAL_ENTRIES), counts['journal_entries'])
+        self.assertEqual(portal.JOURNAL_ENTRIES[-1]['id'], counts['journal_entries'])
+        self.assertEqual(self.login('owner00001', synthetic.SYNTHETIC_PASSWORD).status_code, 200)
+        income = self.client.get('/statements/income').get_json()
+        self.assertAlmostEqual(income['revenue'], sum(inv['total'] for inv in portal.INVOICES), places=2)
+
+
+    def test_paid_documents_reconcile_against_their_bank_lines(self):
+        with tempfile.TemporaryDirectory() as directory:
+            synthetic.generate(directory, owners=1, customers_per_owner=2, vendors_per_owner=2,
+                               invoices=10, bills=10, accounts=40, seed=3, paid_ratio=1.0,
+                               near_miss_ratio=0.0, noise_ratio=0.0)
+            portal.load_dataset(directory)
+        self.login('owner00001', synthetic.SYNTHETIC_PASSWORD)
+        result = self.client.get('/bank/reconcile').get_json()
+        self.assertEqual(result['unmatched_bank_transactions'], [])
+        self.assertTrue(any(tx['amount'] < 0 for tx in portal.BANK_TRANSACTIONS))
+        # Only the document postings themselves have no bank line.
+        self.assertEqual(sorted({je['description'].split()[0] for je in result['unmatched_journal_entries']}),
+                         ['Bill', 'Invoice'])
+        self.assertEqual(len(result['unmatched_journal_entries']), 20)
+
+
+class MetricsTests(PortalTestCase):
+    def test_metrics_endpoint_reports_routes_and_functions(self):
+        self.login()
+        self.client.get('/statements/income')
+        body = self.client.get('/metrics').get_data(as_text=True)
+
+        self.assertIn('portal_http_request_duration_seconds_count{route="/statements/income",method="GET"}', body)
+        self.assertIn('portal_http_requests_total{route="/login",method="POST",status="200"}', body)
+        self.assertIn('portal_http_requests_in_flight{route="/statements/income",method="GET"} 0', body)
+        self.assertIn('portal_function_duration_seconds_count{function="compute_income_statement"}', body)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram('h', 'help', ('route',), (1, 2))
+        for value in (0.5, 1.5, 3):
+            histogram.observe(('/x',), value)
+        lines = histogram.render()
+        self.assertIn('h_bucket{route="/x",le="1"} 1', lines)
+        self.assertIn('h_bucket{route="/x",le="2"} 2', lines)
+        self.assertIn('h_bucket{route="/x",le="+Inf"} 3', lines)
+        self.assertIn('h_sum{route="/x"} 5.0', lines)
+
+    def test_profiler_dumps_folded_stacks_for_slow_requests(self):
+        with tempfile.TemporaryDirectory() as directory:
+            profiler = metrics.SlowRequestProfiler(0.01, 0.001, directory)
+            thread_id = threading.get_ident()
+            profiler.start(thread_id)
+            time.sleep(0.05)
+            path = profiler.finish(thread_id, '/bank/reconcile', 0.05)
+            with open(path) as handle:
+                lines = handle.read().splitlines()
+            self.assertIn('bank_reconcile', os.path.basename(path))
+            self.assertTrue(lines)
+            self.assertTrue(all(line.rsplit(' ', 1)[1].isdigit() for line in lines))
+            profiler.start(thread_id)
+            self.assertIsNone(profiler.finish(thread_id, '/fast', 0.001))
+
+
+def _journal_entry(entry_id, debit='1110', credit='4100', amount=10.0, currency='USD'):
+    return {'id': entry_id, 'date': datetime(2024, 1, 1, 9, 30), 'debit_account': debit,
+            'credit_account': credit, 'amount': amount, 'description': f'entry {entry_id}', 'user': 'Admin',
+            'currency': currency}
+
+
+class JournalLogTests(PortalTestCase):
+    def setUp(self):
+        super().setUp()
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.directory = self._tmp.name
+
+    def _reopen(self):
+        log = JournalLog(self.directory, commit_interval=0)
+        self.addCleanup(log.close)
+        return log, log.recover()
+
+    def test_recover_replays_durable_postings(self):
+        log, _ = self._reopen()
+        entries = [_journal_entry(i) for i in range(1, 4)]
+        for entry in entries:
+            seq = log.append(entry)
+        self.assertTrue(log.wait(seq, timeout=5))
+        log.close()
+        recovered_log, recovered = self._reopen()
+        self.assertEqual(recovered, entries)
+        self.assertEqual(recovered_log.last_seq, 3)
+
+    def test_torn_final_record_is_dropped(self):
+        log, _ = self._reopen()
+        log.append(_journal_entry(1))
+        log.close()
+        segment = os.path.join(self.directory, 'journal-000000000001.log')
+        with open(segment, 'a') as handle:
+            handle.write('[2,"2024-01-01T09:')
+        log, recovered = self._reopen()
+        self.assertEqual([entry['id'] for entry in recovered], [1])
+        log.append(_journal_entry(2))
+        log.close()
+        _, recovered = self._reopen()
+        self.assertEqual([entry['id'] for entry in recovered], [1, 2])
+
+    def test_writer_failure_releases_waiters(self):
+        log, _ = self._reopen()
+
+        def broken(lines):
+            raise RuntimeError('disk gone')
+        log._flush = broken
+        seq = log.append(_journal_entry(1))
+        with self.assertRaises(RuntimeError):
+            log.wait(seq, timeout=5)
+        with self.assertRaises(RuntimeError):
+            log.append(_journal_entry(2))
+
+    def test_checkpoint_then_tail_replay(self):
+        log, entries = self._reopen()
+        for entry_id in range(1, 4):
+            entries.append(_journal_entry(entry_id))
+            log.append(entries[-1])
+        log.begin_checkpoint(entries)()
+        entries.append(_journal_entry(4, amount=5.0))
+        log.append(entries[-1])
+        log.close()
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['journal-000000000004.log', 'rows-000000000001.json', 'snapshot-000000000003.json'])
+        recovered_log, recovered = self._reopen()
+        self.assertEqual(recovered, entries)
+        self.assertEqual(recovered_log.last_seq, 4)
+
+    def test_recovery_reads_only_segments_after_the_snapshot(self):
+        log, entries = self._reopen()
+        for entry_id in range(1, 6):
+            entries.append(_journal_entry(entry_id))
+            log.append(entries[-1])
+            if entry_id in (2, 4):
+                log.begin_checkpoint(entries)()
+        log.close()
+        with open(os.path.join(self.directory, 'snapshot-000000000004.json')) as handle:
+            snapshot = json.load(handle)
+        self.assertEqual(snapshot, {'last_seq': 4, 'chunks': ['rows-000000000001.json', 'rows-000000000003.json']})
+        # A covered segment left behind by a crash before pruning is not read.
+        with open(os.path.join(self.directory, 'journal-000000000003.log'), 'w') as handle:
+            handle.write('not a record\n')
+        recovered_log, recovered = self._reopen()
+        self.assertEqual(recovered, entries)
+        self.assertEqual(recovered_log.last_seq, 5)
+
+    def test_posting_waits_for_the_log(self):
+        log, _ = self._reopen()
+        original_entries = list(portal.JOURNAL_ENTRIES)
+        original_log = portal.JOURNAL_LOG
+        portal.JOURNAL_ENTRIES[:] = []
+        portal.JOURNAL_LOG = log
+        try:
+            self.login()
+            response = self.client.post('/journal/new', json={'debit_account': '1000', 'credit_account': '4000',
+                                                               'amount': '25', 'description': 'cash sale'})
+            self.assertEqual(response.status_code, 200)
+        finally:
+            portal.JOURNAL_LOG = original_log
+            portal.JOURNAL_ENTRIES[:] = original_entries
+        self.assertEqual(log._durable_seq, 1)
+        log.close()
+        _, recovered = self._reopen()
+        self.assertEqual(recovered[0]['description'], 'cash sale')
+
+
+def _shared_worker(path, count):
+    customers = []
+    store = SharedStore(path, {'customers': customers})
+    for _ in range(count):
+        with store.write():
+            customers.append({'id': len(customers) + 1, 'pid': os.getpid()})
+
+
+def _shared_compactor(path, stop):
+    store = SharedStore(path, {'customers': []})
+    while not stop.is_set():
+        store.compact()
+
+
+class SharedStoreTests(PortalTestCase):
+    def setUp(self):
+        super().setUp()
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.path = os.path.join(self._tmp.name, 'portal.log')
+
+    def _worker(self, **stores):
+        store = SharedStore(self.path, stores, datetime_fields={'journal_entries': ('date',)})
+        self.addCleanup(store.close)
+        return store
+
+    def test_workers_see_each_others_writes(self):
+        first_entries, second_entries = [], []
+        first = self._worker(journal_entries=first_entries)
+        second = self._worker(journal_entries=second_entries)
+        with first.write():
+            first_entries.append(_journal_entry(1))
+        with second.write():
+            # The writer catches up before running, so ids stay consistent.
+            self.assertEqual(len(second_entries), 1)
+            second_entries.append(_journal_entry(len(second_entries) + 1))
+        self.assertEqual(first.sync(), 1)
+        self.assertEqual(first_entries, second_entries)
+        self.assertEqual(first_entries[1]['date'], datetime(2024, 1, 1, 9, 30))
+
+    def test_failed_write_publishes_nothing(self):
+        customers = []
+        store = self._worker(customers=customers)
+        with self.assertRaises(ValueError):
+            with store.write():
+                customers.append({'id': 1})
+                with store.write():
+                    customers.append({'id': 2})
+                raise ValueError
+        self.assertEqual(os.path.getsize(self.path), 0)
+        self.assertEqual(customers, [])
+        with store.write():
+            customers.append({'id': 1})
+        replica = []
+        self._worker(customers=replica).sync()
+        self.assertEqual(replica, customers)
+
+    def test_concurrent_processes_allocate_unique_ids(self):
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=_shared_worker, args=(self.path, 50)) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        customers = []
+        self._worker(customers=customers).sync()
+        self.assertEqual([customer['id'] for customer in customers], list(range(1, 201)))
+        self.assertEqual(len({customer['pid'] for customer in customers}), 4)
+
+    def test_compaction_during_concurrent_writes(self):
+        context = multiprocessing.get_context('fork')
+        stop = context.Event()
+        compactor = context.Process(target=_shared_compactor, args=(self.path, stop))
+        compactor.start()
+        workers = [context.Process(target=_shared_worker, args=(self.path, 50)) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        stop.set()
+        compactor.join()
+        customers = []
+        self._worker(customers=customers).sync()
+        self.assertEqual([customer['id'] for customer in customers], list(range(1, 201)))
+
+    def test_portal_routes_publish_writes(self):
+        original = portal.SHARED
+        original_customers = list(portal.CUSTOMERS)
+        portal.SHARED = self._worker(customers=portal.CUSTOMERS)
+        try:
+            self.login()
+            response = self.client.post('/customers', json={'name': 'Acme', 'contact': 'a@example.com'})
+            self.assertEqual(response.status_code, 200)
+        finally:
+            portal.SHARED.close()
+            portal.SHARED = original
+            portal.CUSTOMERS[:] = original_customers
+        replica = []
+        self._worker(customers=replica).sync()
+        self.assertEqual([customer['name'] for customer in replica], ['Acme'])
+
+
+    def _keyed_worker(self, customers, latest, accounts):
+        def remember(record):
+            latest[record['key']] = record['value']
+        store = SharedStore(self.path, {'customers': customers},
+                            appliers={'latest': remember, 'accounts': accounts.append},
+                            snapshots={'latest': lambda: [{'key': k, 'value': v} for k, v in latest.items()]})
+        self.addCleanup(store.close)
+        return store
+
+    def test_compaction_keeps_state_and_other_workers_follow(self):
+        customers, latest, accounts = [], {}, []
+        writer = self._keyed_worker(customers, latest, accounts)
+        other_latest, other_accounts = {}, []
+        other = self._keyed_worker([], other_latest, other_accounts)
+        other.sync()
+        with writer.write() as shared:
+            customers.append({'id': 1})
+            accounts.append({'code': '1310'})
+            shared.publish('accounts', {'code': '1310'})
+        for value in range(20):
+            with writer.write() as shared:
+                latest['k'] = value
+                shared.publish('latest', {'key': 'k', 'value': value})
+        before = os.path.getsize(self.path)
+        self.assertLess(writer.compact(), before)
+        with writer.write() as shared:
+            customers.append({'id': 2})
+        # The other worker moves to the compacted log; of what it already
+        # has, only the snapshot record is applied again.
+        self.assertEqual(other.sync(), 22 + 2)
+        self.assertEqual(other.stores['customers'], customers)
+        self.assertEqual((other_latest, other_accounts), ({'k': 19}, [{'code': '1310'}]))
+        other_customers = other.stores['customers']
+        with other.write():
+            other_customers.append({'id': 3})
+        writer.sync()
+        self.assertEqual([customer['id'] for customer in customers], [1, 2, 3])
+        fresh_latest, fresh_accounts = {}, []
+        fresh = self._keyed_worker([], fresh_latest, fresh_accounts)
+        fresh.sync()
+        self.assertEqual(fresh.stores['customers'], customers)
+        self.assertEqual((fresh_latest, fresh_accounts), ({'k': 19}, [{'code': '1310'}]))
+
+    def test_idempotency_keys_are_shared_between_workers(self):
+        original = portal.SHARED
+        original_bank = list(portal.BANK_TRANSACTIONS)
+        published = []
+        portal.SHARED = SharedStore(self.path, {'bank_transactions': portal.BANK_TRANSACTIONS},
+                                    appliers={'bank_idempotency': published.append})
+        try:
+            self.login()
+            rows = [{'date': '2024-01-02', 'amount': 12.5, 'description': 'Coffee'}]
+            response = self.client.post('/bank/upload', json=rows, headers={'Idempotency-Key': 'shared-1'})
+            self.assertEqual(response.status_code, 200)
+        finally:
+            portal.SHARED.close()
+            portal.SHARED = original
+            portal.BANK_TRANSACTIONS[:] = original_bank
+        replica = SharedStore(self.path, {'bank_transactions': []}, appliers={'bank_idempotency': published.append})
+        self.addCleanup(replica.close)
+        replica.sync()
+        self.assertEqual([(record['key'], record['response']['imported']) for record in published],
+                         [('shared-1', 1)])
+
+
+class AccountHierarchyTests(PortalTestCase):
+    def test_parents_follow_the_longest_code_prefix(self):
+        parents = parent_codes([1000, 1100, 1110, 1123, 2000, '2110'], explicit={'2110': 1000})
+        self.assertEqual(parents, {'1000': None, '1100': '1000', '1110': '1100', '1123': '1100',
+                                   '2000': None, '2110': '1000'})
+
+    def test_rollup_subtotals_every_level(self):
+        tree = AccountTree([{'code': code, 'name': str(code), 'type': 'Asset'}
+                            for code in (1000, 1100, 1110, 1120, 1200)])
+        totals = tree.rollup({1110: 5.0, '1120': 7.0, 1200: 1.0, 1000: 2.0})
+        self.assertEqual(totals, {'1000': 15.0, '1100': 12.0, '1110': 5.0, '1120': 7.0, '1200': 1.0})
+        [root] = tree.nested(totals, depth=2)
+        self.assertEqual([child['code'] for child in root['children']], [1100, 1200])
+        self.assertNotIn('children', root['children'][0])
+
+    def test_chart_cache_follows_replacement(self):
+        original = portal.chart_df
+        self.addCleanup(portal._set_chart, original)
+        portal._set_chart(synthetic.make_chart(60))
+        self.assertIn('1110', portal._from_chart(portal._build_account_codes))
+        renumbered = synthetic.make_chart(60)
+        renumbered['code'] += 10000
+        portal._set_chart(renumbered)
+        self.assertNotIn('1110', portal._from_chart(portal._build_account_codes))
+
+    def test_statement_depth_parameter(self):
+        original_chart, original_entries = portal.chart_df, list(portal.JOURNAL_ENTRIES)
+        portal._set_chart(synthetic.make_chart(60))
+        portal.JOURNAL_ENTRIES[:] = [_journal_entry(1, debit=1110, credit=4100, amount=40.0)]
+        try:
+            self.login()
+            self.assertNotIn('accounts', self.client.get('/statements/income').get_json())
+            self.assertEqual(self.client.get('/statements/income?depth=0').status_code, 400)
+            body = self.client.get('/statements/balance?depth=all').get_json()
+            [assets] = [node for node in body['accounts'] if node['code'] == 1000]
+            self.assertEqual(assets['balance'], 40.0)
+            [current] = [node for node in assets['children'] if node['code'] == 1100]
+            self.assertEqual([(node['code'], node['balance']) for node in current['children']][:2],
+                             [(1110, 40.0), (1120, 0.0)])
+            body = self.client.get('/statements/income?depth=1').get_json()
+            self.assertEqual([node['type'] for node in body['accounts']], ['Revenue', 'Expense'])
+            self.assertEqual(body['accounts'][0]['balance'], 40.0)
+            self.assertNotIn('children', body['accounts'][0])
+        finally:
+            portal._set_chart(original_chart)
+            portal.JOURNAL_ENTRIES[:] = original_entries
+
+
+class SearchTests(PortalTestCase):
+    def test_index_picks_up_appended_records(self):
+        customers = [{'id': 1, 'name': 'Acme Holdings', 'owner': 'a'}]
+        index = SearchIndex({'customer': (customers, 'owner', lambda c: (c['name'],))})
+        self.assertEqual(index.search('acm'), [('customer', 1)])
+        customers.append({'id': 2, 'name': 'Acme Rentals', 'owner': 'b'})
+        self.assertEqual(index.search('acme'), [('customer', 2), ('customer', 1)])
+        self.assertEqual(index.search('acme', owner='a'), [('customer', 1)])
+        self.assertEqual(index.search('rent acm'), [('customer', 2)])
+        self.assertEqual(index.search('acme zz'), [])
+
+    def test_search_endpoint_is_scoped_by_owner(self):
+        saved = {name: list(store) for name, store in portal.SEARCH_STORES.items()}
+        original_index = portal.SEARCH
+        portal.SEARCH = SearchIndex(original_index.sources)
+        for store in portal.SEARCH_STORES.values():
+            store.clear()
+        portal.CUSTOMERS.append({'id': 1, 'name': 'Acme Corp', 'contact': 'ops@acme.test', 'owner': 'Admin'})
+        portal.INVOICES.append({'id': 1, 'customer_id': 1, 'items': [{'description': 'Spring roof repair'}],
+                                'total': 10.0, 'date': '2024-04-02', 'status': 'draft', 'owner': 'Admin'})
+        portal.CUSTOMERS.append({'id': 2, 'name': 'Acme Other', 'contact': '', 'owner': 'someone'})
+        try:
+            self.assertEqual(self.client.get('/search?q=acme').status_code, 401)
+            self.login()
+            body = self.client.get('/search?q=acme spr').get_json()
+            self.assertEqual([(r['type'], r['id']) for r in body['results']], [('invoice', 1)])
+            body = self.client.get('/search?q=acme&type=customer').get_json()
+            self.assertEqual([r['record']['name'] for r in body['results']], ['Acme Other', 'Acme Corp'])
+            self.assertEqual(self.client.get('/search?q=acme&type=nope').status_code, 400)
+            self.assertEqual(self.client.get('/search').status_code, 400)
+            with self.client.session_transaction() as sess:
+                sess['username'] = 'someone'
+            body = self.client.get('/search?q=acme').get_json()
+            self.assertEqual([(r['type'], r['id']) for r in body['results']], [('customer', 2)])
+        finally:
+            portal.SEARCH = original_index
+            for name, store in portal.SEARCH_STORES.items():
+                store[:] = saved[name]
+
+
+class AgingTests(PortalTestCase):
+    def _invoice(self, invoice_id, customer_id, day, total, status='draft', owner='Admin'):
+        return {'id': invoice_id, 'customer_id': customer_id, 'items': [], 'total': total,
+                'date': day, 'status': status, 'owner': owner}
+
+    def test_buckets_by_age_and_party(self):
+        invoices = [
+            self._invoice(1, 1, '2024-06-30', 10.0),
+            self._invoice(2, 1, '2024-05-01', 20.0),
+            self._invoice(3, 2, '2024-03-01', 40.0),
+            self._invoice(4, 2, '2024-03-01', 80.0, status='paid'),
+            self._invoice(5, 2, '2024-07-15', 160.0),
+            self._invoice(6, 3, '2024-06-01', 5.0, owner='other'),
+        ]
+        report = AgingReport(invoices, 'customer_id')
+        labels, parties, amounts = report.compute(date(2024, 6, 30))
+        self.assertEqual(labels, ['current', '31-60', '61-90', '91+'])
+        self.assertEqual(parties, [1, 2, 3])
+        self.assertEqual(amounts, [[10.0, 20.0, 0.0, 0.0], [0.0, 0.0, 0.0, 40.0], [5.0, 0.0, 0.0, 0.0]])
+        self.assertIs(report.compute(date(2024, 6, 30)), report.compute(date(2024, 6, 30)))
+        _, parties, amounts = report.compute(date(2024, 6, 30), (45,), owner='Admin')
+        self.assertEqual((parties, amounts), ([1, 2], [[10.0, 20.0], [0.0, 40.0]]))
+        invoices.append(self._invoice(7, 1, '2024-06-29', 1.0))
+        self.assertEqual(report.compute(date(2024, 6, 30))[2][0], [11.0, 20.0, 0.0, 0.0])
+        # 90 days old is the last day of 61-90; 91+ starts the day after.
+        invoices.append(self._invoice(8, 1, '2024-04-01', 2.0))
+        self.assertEqual(report.compute(date(2024, 6, 30))[2][0], [11.0, 20.0, 2.0, 0.0])
+        self.assertEqual(report.compute(date(2024, 7, 1))[2][0], [11.0, 0.0, 20.0, 2.0])
+
+    def test_aging_endpoints(self):
+        saved_customers, saved_invoices = list(portal.CUSTOMERS), list(portal.INVOICES)
+        portal.CUSTOMERS[:] = [{'id': 1, 'name': 'Acme', 'contact': '', 'owner': 'Admin'}]
+        portal.INVOICES[:] = [self._invoice(1, 1, '2024-01-01', 100.0)]
+        try:
+            self.login()
+            body = self.client.get('/reports/ar-aging?as_of=2024-02-15&buckets=30,60').get_json()
+            self.assertEqual(body['buckets'], ['current', '31-60', '61+'])
+            self.assertEqual(body['rows'], [{'customer_id': 1, 'name': 'Acme', 'current': 0.0,
+                                             '31-60': 100.0, '61+': 0.0, 'total': 100.0}])
+            self.assertEqual(body['totals']['total'], 100.0)
+            self.assertEqual(self.client.get('/reports/ar-aging?buckets=60,30').status_code, 400)
+            self.assertEqual(self.client.get('/reports/ap-aging').get_json()['rows'], [])
+        finally:
+            portal.CUSTOMERS[:] = saved_customers
+            portal.INVOICES[:] = saved_invoices
+
+
+class CashPositionTests(PortalTestCase):
+    def _entry(self, entry_id, day, debit, credit, amount):
+        return {**_journal_entry(entry_id, debit=debit, credit=credit, amount=amount),
+                'date': datetime.combine(day, datetime.min.time())}
+
+    def test_series_is_built_incrementally(self):
+        entries = [self._entry(1, date(2024, 1, 1), 1000, 4000, 100.0),
+                   self._entry(2, date(2024, 1, 3), 5000, '1000', 30.0),
+                   self._entry(3, date(2024, 1, 3), 5000, 2000, 999.0)]
+        position = CashPosition(entries)
+        position.refresh(frozenset({'1000'}))
+        opening, rows = position.series(date(2024, 1, 2), date(2024, 1, 4))
+        self.assertEqual(opening, 100.0)
+        self.assertEqual([(row[0].day, row[3]) for row in rows], [(2, 100.0), (3, 70.0), (4, 70.0)])
+        entries.append(self._entry(4, date(2024, 1, 4), 1000, 4000, 5.0))
+        position.refresh(frozenset({'1000'}))
+        self.assertEqual(position.series(date(2024, 1, 4), date(2024, 1, 4))[1][0][1:], (5.0, 0.0, 75.0))
+        self.assertEqual(position.totals(), (105.0, 30.0))
+        position.refresh(frozenset({'2000'}))
+        self.assertEqual(position.totals(), (0.0, 999.0))
+
+    def test_cash_position_endpoint(self):
+        saved = list(portal.JOURNAL_ENTRIES)
+        portal.JOURNAL_ENTRIES[:] = []
+        try:
+            self.login()
+            portal.create_journal_entry(1000, 4000, 50.0, 'rent', 'Admin')
+            today = date.today()
+            body = self.client.get('/statements/cash-position').get_json()
+            self.assertEqual(len(body['days']), 30)
+            self.assertEqual(body['end'], today.isoformat())
+            self.assertEqual(body['days'][-1], {'date': today.isoformat(), 'inflow': 50.0, 'outflow': 0.0,
+                                                'net': 50.0, 'balance': 50.0})
+            body = self.client.get(f'/statements/cash-position?start={today + timedelta(days=1)}'
+                                   f'&end={today + timedelta(days=2)}').get_json()
+            self.assertEqual((body['opening_balance'], body['days'][-1]['balance']), (50.0, 50.0))
+            self.assertEqual(self.client.get('/statements/cashflow').get_json()['net_cash'], 50.0)
+            self.assertEqual(self.client.get('/statements/cash-position?start=2024-02-01&end=2024-01-01')
+                             .status_code, 400)
+        finally:
+            portal.JOURNAL_ENTRIES[:] = saved
+
+
+class FxTests(PortalTestCase):
+    RATES = [('2024-01-01', 'EUR', 1.10), ('2024-01-10', 'EUR', 1.20), ('2024-01-01', 'GBP', 1.25)]
+
+    def test_rate_is_latest_on_or_before_day(self):
+        table = RateTable('USD', self.RATES)
+        self.assertEqual(table.rate('USD', date(2023, 1, 1)), 1.0)
+        self.assertEqual(table.rate('EUR', date(2024, 1, 9)), 1.10)
+        self.assertEqual(table.rate('EUR', datetime(2024, 1, 10, 12)), 1.20)
+        self.assertEqual(table.rates(['EUR', 'USD', 'EUR'], [date(2024, 1, 5).toordinal()] * 2
+                                     + [date(2024, 2, 1).toordinal()]).tolist(), [1.10, 1.0, 1.20])
+        self.assertAlmostEqual(table.factor('GBP', date(2024, 1, 5), 'EUR'), 1.25 / 1.10)
+        with self.assertRaises(MissingRate):
+            table.rate('EUR', date(2023, 12, 31))
+        with self.assertRaises(MissingRate):
+            table.rate('JPY', date(2024, 1, 5))
+
+    def test_ledger_conversion_follows_appends(self):
+        table = RateTable('USD', self.RATES)
+        entries = [_journal_entry(1), _journal_entry(2)]
+        conversion = LedgerConversion(entries, table)
+        self.assertIsNone(conversion.factors('USD'))
+        entries.append({**_journal_entry(3, currency='EUR'), 'date': datetime(2024, 1, 10)})
+        self.assertEqual(conversion.factors('USD'), [1.0, 1.0, 1.20])
+        self.assertIs(conversion.factors('USD'), conversion.factors('USD'))
+        self.assertEqual(conversion.factors('EUR'), [1 / 1.10, 1 / 1.10, 1.0])
+
+    def test_statements_convert_to_reporting_currency(self):
+        saved_entries, saved_rates = list(portal.JOURNAL_ENTRIES), portal.FX_RATES
+        rates = portal.FX_RATES = RateTable('USD', [(date.today(), 'EUR', 2.0)])
+        saved_fx, portal.JOURNAL_FX = portal.JOURNAL_FX, LedgerConversion(portal.JOURNAL_ENTRIES, rates)
+        saved_cash, portal.CASH_POSITION = portal.CASH_POSITION, CashPosition(portal.JOURNAL_ENTRIES)
+        portal.JOURNAL_ENTRIES[:] = []
+        try:
+            self.login()
+            portal.create_journal_entry(1000, 4000, 10.0, 'sale', 'Admin', currency='EUR')
+            portal.create_journal_entry(1000, 4000, 5.0, 'sale', 'Admin')
+            self.assertEqual(self.client.get('/statements/cashflow').get_json()['cash_inflow'], 25.0)
+            body = self.client.get('/statements/cashflow?currency=eur').get_json()
+            self.assertEqual((body['currency'], body['cash_inflow']), ('EUR', 12.5))
+            self.assertEqual(self.client.post('/journal/new', json={'debit': 1000, 'credit': 4000, 'amount': 1,
+                                                                     'currency': 'JPY'}).status_code, 400)
+            self.assertEqual(self.client.get('/statements/balance?currency=JPY').status_code, 400)
+        finally:
+            portal.JOURNAL_ENTRIES[:] = saved_entries
+            portal.FX_RATES, portal.JOURNAL_FX, portal.CASH_POSITION = saved_rates, saved_fx, saved_cash
+
+
+    def test_records_before_the_first_rate_are_rejected(self):
+        saved_entries, saved_bank = list(portal.JOURNAL_ENTRIES), list(portal.BANK_TRANSACTIONS)
+        saved_rates = portal.FX_RATES
+        rates = portal.FX_RATES = RateTable('USD', [('2024-06-01', 'EUR', 1.1)])
+        saved_fx, portal.JOURNAL_FX = portal.JOURNAL_FX, LedgerConversion(portal.JOURNAL_ENTRIES, rates)
+        portal.JOURNAL_ENTRIES[:] = []
+
+        def restore():
+            portal.JOURNAL_ENTRIES[:], portal.BANK_TRANSACTIONS[:] = saved_entries, saved_bank
+            portal.FX_RATES, portal.JOURNAL_FX = saved_rates, saved_fx
+        self.addCleanup(restore)
+        self.login()
+        early = ('{"date": "2024-01-15", "debit_account": 1000, "credit_account": 4000, "amount": 5,'
+                 ' "currency": "EUR"}\n')
+        response = self.client.post('/journal/import', data=early, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('no EUR rate', response.get_json()['errors'][0]['message'])
+        upload = self.client.post('/bank/upload', json=[{'date': '2024-01-15', 'amount': 5, 'currency': 'EUR'}])
+        self.assertEqual(upload.status_code, 400)
+        self.assertEqual((portal.JOURNAL_ENTRIES, portal.BANK_TRANSACTIONS), ([], saved_bank))
+        self.assertEqual(self.client.get('/statements/income').status_code, 200)
+
+class BankFingerprintTests(PortalTestCase):
+    def test_repeated_rows_are_matched_by_count(self):
+        store = [{'id': 1, 'date': '2024-01-02', 'amount': 4.5, 'description': 'Coffee  Shop', 'owner': 'a'}]
+        index = FingerprintIndex(store)
+        coffee = {'date': '2024-01-02', 'amount': 4.50, 'description': 'coffee shop'}
+        new, duplicates = index.split('a', [coffee, dict(coffee), {**coffee, 'reference': 'X1'}])
+        self.assertEqual((new, duplicates), ([coffee, {**coffee, 'reference': 'X1'}], 1))
+        self.assertEqual(index.split('b', [coffee]), ([coffee], 0))
+        store.append({'id': 2, **coffee, 'owner': 'a'})
+        self.assertEqual(index.split('a', [coffee, coffee]), ([], 2))
+
+    def test_upload_skips_duplicates_and_replays_retries(self):
+        saved = list(portal.BANK_TRANSACTIONS)
+        portal.BANK_TRANSACTIONS[:] = []
+        rows = [{'date': '2024-03-01', 'amount': 12, 'description': 'Fee'},
+                {'date': '2024-03-02', 'amount': 99, 'description': 'Deposit', 'reference': 'R7'}]
+        try:
+            self.login()
+            body = self.client.post('/bank/upload', json=rows[:1]).get_json()
+            self.assertEqual((body['imported'], body['duplicates']), (1, 0))
+            headers = {'Idempotency-Key': 'upload-1'}
+            body = self.client.post('/bank/upload', json=rows, headers=headers).get_json()
+            self.assertEqual((body['imported'], body['duplicates']), (1, 1))
+            retry = self.client.post('/bank/upload', json=rows, headers=headers)
+            self.assertEqual((retry.get_json(), retry.headers['Idempotent-Replayed']), (body, 'true'))
+            self.assertEqual(self.client.post('/bank/upload', json=rows[:1], headers=headers).status_code, 422)
+            self.assertEqual(len(portal.BANK_TRANSACTIONS), 2)
+            self.assertEqual(portal.BANK_TRANSACTIONS[1]['reference'], 'R7')
+        finally:
+            portal.BANK_TRANSACTIONS[:] = saved
+
+
+class CompoundEntryTests(PortalTestCase):
+    def setUp(self):
+        super().setUp()
+        saved = list(portal.JOURNAL_ENTRIES), list(portal.INVOICES), portal.CASH_POSITION
+        portal.CASH_POSITION = CashPosition(portal.JOURNAL_ENTRIES)
+        portal.JOURNAL_ENTRIES[:] = []
+
+        def restore():
+            portal.JOURNAL_ENTRIES[:], portal.INVOICES[:], portal.CASH_POSITION = saved
+        self.addCleanup(restore)
+        self.login()
+
+    def test_lines_must_balance(self):
+        lines, total = balanced_lines([{'account': 1000, 'debit': '30'},
+                                       {'account': 4000, 'credit': 10}, {'account': 4000, 'credit': 20}])
+        self.assertEqual(total, 30.0)
+        self.assertEqual(postings({'lines': lines}), [(1000, 30.0), (4000, -10.0), (4000, -20.0)])
+        with self.assertRaises(JournalError):
+            balanced_lines([{'account': 1000, 'debit': 30}, {'account': 4000, 'credit': 29.99}])
+        with self.assertRaises(JournalError):
+            balanced_lines([{'account': 1000, 'debit': 5, 'credit': 5}, {'account': 4000, 'credit': 0}])
+        with self.assertRaises(JournalError):
+            balanced_lines([{'account': 9999, 'debit': 5}, {'account': 4000, 'credit': 5}], {'4000': 4000})
+
+    def test_invoice_posts_one_compound_entry(self):
+        items = [{'description': 'Rent', 'account': 4000, 'amount': 100},
+                 {'description': 'Late fee', 'account': '4000', 'amount': 20}]
+        saved_chart = portal._chart().copy()
+        self.addCleanup(portal._set_chart, saved_chart)
+        portal._apply_account({'code': 1200, 'name': 'Accounts Receivable', 'type': 'Asset', 'description': ''})
+        response = self.client.post('/invoices', json={'customer_id': 1, 'items': items})
+        self.assertEqual(response.status_code, 200)
+        [entry] = portal.JOURNAL_ENTRIES
+        self.assertEqual((entry['amount'], entry['debit_account'], len(entry['lines'])), (120.0, None, 3))
+        self.assertEqual(self.client.get('/statements/income').get_json()['revenue'], 120.0)
+        bad = self.client.post('/invoices', json={'customer_id': 1, 'items': [{'account': 'x', 'amount': 1}]})
+        self.assertEqual(bad.status_code, 400)
+
+    def test_simple_entry_maps_codes_through_the_chart(self):
+        response = self.client.post('/journal/new', json={'debit_account': '1000', 'credit_account': '4000',
+                                                           'amount': '25'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(postings(portal.JOURNAL_ENTRIES[-1]), ((1000, 25.0), (4000, -25.0)))
+        self.assertEqual(self.client.get('/statements/balance').status_code, 200)
+        self.assertEqual(self.client.get('/statements/income').get_json()['revenue'], 25.0)
+        unknown = self.client.post('/journal/new', json={'debit_account': '9999', 'credit_account': '4000',
+                                                          'amount': 1})
+        self.assertEqual((unknown.status_code, len(portal.JOURNAL_ENTRIES)), (400, 1))
+
+    def test_rejected_document_is_not_stored(self):
+        saved = portal._chart().copy(), list(portal.PERIOD_CLOSES)
+
+        def restore():
+            portal._set_chart(saved[0])
+            portal.PERIOD_CLOSES[:] = saved[1]
+        self.addCleanup(restore)
+        portal._apply_account({'code': 1200, 'name': 'Accounts Receivable', 'type': 'Asset', 'description': '',
+                               'entity': ''})
+        portal._apply_account({'code': 4999, 'name': 'Sub Income', 'type': 'Revenue', 'description': '',
+                               'entity': 'sub'})
+        invoices = list(portal.INVOICES)
+        reserved = self.client.post('/invoices', json={'customer_id': 1, 'items': [{'account': 4999, 'amount': 5}]})
+        self.assertEqual(reserved.status_code, 400)
+        portal.PERIOD_CLOSES[:] = [{'before': '2999-01-01', 'carry': [], 'through_id': 0, 'balances': []}]
+        closed = self.client.post('/invoices', json={'customer_id': 1, 'items': [{'account': 4000, 'amount': 5}]})
+        self.assertEqual(closed.status_code, 409)
+        self.assertEqual((portal.INVOICES, portal.JOURNAL_ENTRIES), (invoices, []))
+
+    def test_import_csv_and_ndjson(self):
+        csv_body = ('entry,date,description,currency,account,debit,credit\n'
+                    'a,2024-01-05,Opening,,1000,500,\n'
+                    'a,,,,3000,,500\n'
+                    'b,2024-01-06,Rent,,1000,100,\n'
+                    'b,,,,4000,,60\n'
+                    'b,,,,4000,,40\n')
+        self.assertEqual([number for number, _ in parse_csv(csv_body)], [2, 4])
+        body = self.client.post('/journal/import', data=csv_body, content_type='text/csv').get_json()
+        self.assertEqual((body['imported'], body['first_id'], body['last_id']), (2, 1, 2))
+        self.assertEqual(portal.JOURNAL_ENTRIES[0]['debit_account'], 1000)
+        self.assertEqual(portal.JOURNAL_ENTRIES[1]['date'], datetime(2024, 1, 6))
+        self.assertEqual(self.client.get('/statements/cashflow').get_json()['cash_inflow'], 600.0)
+
+        ndjson = ('{"debit_account": 5000, "credit_account": 1000, "amount": 25}\n'
+                  '{"lines": [{"account": 5000, "debit": 1}, {"account": 1000, "credit": 2}]}\n'
+                  '{"debit_account": 1, "credit_account": 1000, "amount": 5}\n')
+        response = self.client.post('/journal/import', data=ndjson, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['line'] for error in response.get_json()['errors']], [2, 3])
+        self.assertEqual(len(portal.JOURNAL_ENTRIES), 2)
+        response = self.client.post('/journal/import', data=ndjson.splitlines()[0],
+                                    content_type='application/x-ndjson')
+        self.assertEqual(response.get_json()['imported'], 1)
+
+
+class PeriodCloseTests(PortalTestCase):
+    TYPES = {1000: 'Asset', 3000: 'Equity', 4000: 'Revenue', 5000: 'Expense'}
+
+    def _entry(self, entry_id, day, debit, credit, amount):
+        return {**_journal_entry(entry_id, debit=debit, credit=credit, amount=amount), 'date': day}
+
+    def test_close_folds_earlier_entries_and_carries_later_ones(self):
+        entries = [self._entry(1, datetime(2023, 3, 1), 1000, 4000, 100.0),
+                   self._entry(2, datetime(2024, 2, 1), 1000, 4000, 7.0),
+                   self._entry(3, datetime(2023, 6, 1), 5000, 1000, 40.0)]
+        balances, _, carry, net_income = close_period(entries, None, date(2024, 1, 1), self.TYPES, 3000)
+        self.assertEqual((dict(balances), carry, net_income), ({1000: 60.0, 3000: -60.0}, [2], 60.0))
+        entries.append(self._entry(4, datetime(2024, 3, 1), 5000, 1000, 5.0))
+        first = {'balances': balances, 'carry': carry, 'through_id': 3}
+        self.assertEqual(list(open_positions(entries, first)), [1, 3])
+        balances, _, carry, net_income = close_period(entries, first, date(2025, 1, 1), self.TYPES, 3000)
+        self.assertEqual((dict(balances), carry, net_income), ({1000: 62.0, 3000: -62.0}, [], 2.0))
+
+    def test_close_endpoint_freezes_balances_and_locks_postings(self):
+        saved = list(portal.JOURNAL_ENTRIES), list(portal.PERIOD_CLOSES), portal.CASH_POSITION
+        portal.CASH_POSITION = CashPosition(portal.JOURNAL_ENTRIES)
+        portal.JOURNAL_ENTRIES[:] = []
+
+        def restore():
+            portal.JOURNAL_ENTRIES[:], portal.PERIOD_CLOSES[:], portal.CASH_POSITION = saved
+        self.addCleanup(restore)
+        self.login()
+        ndjson = ('{"date": "2023-05-01", "debit_account": 1000, "credit_account": 4000, "amount": 100}\n'
+                  '{"date": "2023-07-01", "debit_account": 5000, "credit_account": 1000, "amount": 30}\n')
+        self.client.post('/journal/import', data=ndjson, content_type='application/x-ndjson')
+        portal.create_journal_entry(1000, 4000, 8.0, 'sale', 'Admin')
+        balance = self.client.get('/statements/balance').get_json()
+
+        response = self.client.post('/periods/close', json={'before': '2024-01-01', 'retained_earnings': 3000})
+        self.assertEqual(response.get_json()['close']['net_income'], 70.0)
+        self.assertEqual(self.client.get('/statements/balance').get_json()['assets'], balance['assets'])
+        self.assertEqual(self.client.get('/statements/balance').get_json()['equity'], -70.0)
+        self.assertEqual(self.client.get('/statements/income').get_json()['revenue'], 8.0)
+        self.assertEqual(self.client.post('/periods/close', json={'before': '2023-06-01',
+                                                                  'retained_earnings': 3000}).status_code, 409)
+        self.assertEqual(self.client.post('/periods/close', json={'before': '2024-01-01'}).status_code, 400)
+        rejected = self.client.post('/journal/import', data=ndjson, content_type='application/x-ndjson')
+        self.assertEqual(rejected.status_code, 400)
+        self.assertEqual([close['before'] for close in self.client.get('/periods').get_json()], ['2024-01-01'])
+
+
+class RecordTests(PortalTestCase):
+    def test_records_read_like_the_dicts_they_replace(self):
+        row = _journal_entry(1)
+        entry = JournalEntry.from_dict(dict(row))
+        self.assertEqual(entry, row)
+        self.assertEqual((entry['date'], entry.get('lines'), 'lines' in entry), (row['date'], None, False))
+        self.assertEqual({**entry}, row)
+        self.assertIs(JournalEntry.from_dict(dict(row, extra=1))['extra'], 1)
+        stamp = datetime(2024, 5, 6, 7, 8, 9, 123456)
+        self.assertEqual(JournalEntry.from_dict({**row, 'date': stamp.isoformat()})['date'], stamp)
+        self.assertIs(Customer(owner=''.join(['Ad', 'min']))['owner'], Customer(owner='Admin')['owner'])
+        self.assertIs(Customer(owner=True)['owner'], True)
+        codes = [JournalEntry.from_dict({**row, 'debit_account': code})['debit_account'] for code in (1, 1.0, True)]
+        self.assertEqual([type(code) for code in codes], [int, float, bool])
+        with self.assertRaises(KeyError):
+            entry['nope']
+
+    def test_shared_int_table_is_bounded(self):
+        day = int('739000')
+        self.assertIs(records._share(int('739000')), records._share(day))
+        saved = records.INT_TABLE_SIZE
+        records.INT_TABLE_SIZE = len(records._ints)
+        try:
+            code = int('987654321987')
+            self.assertIs(records._share(code), code)
+            self.assertNotIn(code, records._ints)
+        finally:
+            records.INT_TABLE_SIZE = saved
+
+    def test_json_shape_is_unchanged(self):
+        saved = list(portal.CUSTOMERS)
+        row = {'id': 1, 'name': 'Acme', 'contact': '', 'owner': 'Admin'}
+        portal.CUSTOMERS[:] = [Customer.from_dict(dict(row))]
+        try:
+            self.login()
+            self.assertEqual(self.client.get('/customers').get_json(), [row])
+            created = self.client.post('/customers', json={'name': 'Beta'}).get_json()['customer']
+            self.assertEqual(created, {**row, 'id': 2, 'name': 'Beta', 'currency': 'USD'})
+        finally:
+            portal.CUSTOMERS[:] = saved
+
+
+class TenantBatchTests(PortalTestCase):
+    def test_pool_matches_single_process(self):
+        entries = [_journal_entry(i, debit='1000', credit='4000', amount=float(i)) for i in range(1, 41)]
+        for entry in entries[::3]:
+            entry['user'] = 'client'
+        types = {'1000': 'Asset', '4000': 'Revenue'}
+        single = batch.run(entries, types, frozenset({'1000'}), open_from=30, carry={5}, workers=1)
+        self.assertEqual(batch.run(entries, types, frozenset({'1000'}), open_from=30, carry={5}, workers=2),
+                         single)
+        self.assertEqual([result['owner'] for result in single], ['Admin', 'client'])
+        client = single[1]
+        self.assertEqual(client['balance']['assets'], float(sum(range(1, 41, 3))))
+        self.assertEqual(client['income']['revenue'], float(sum(i for i in range(1, 41, 3) if i > 30)))
+        self.assertEqual(single[0]['cashflow']['cash_inflow'] + client['cashflow']['cash_inflow'], 820.0)
+
+    def test_batch_endpoint(self):
+        saved = list(portal.JOURNAL_ENTRIES)
+        portal.JOURNAL_ENTRIES[:] = []
+        try:
+            portal.create_journal_entry(1000, 4000, 10.0, 'sale', 'alice')
+            portal.create_journal_entry(5000, 1000, 4.0, 'repair', 'bob')
+            self.login()
+            response = self.client.get('/statements/batch')
+            self.assertEqual(response.mimetype, 'application/x-ndjson')
+            lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+            self.assertEqual([(line['owner'], line['income']['net_income'], line['currency']) for line in lines],
+                             [('alice', 10.0, 'USD'), ('bob', -4.0, 'USD')])
+            self.assertEqual(self.client.get('/statements/batch?currency=XXX').status_code, 400)
+        finally:
+            portal.JOURNAL_ENTRIES[:] = saved
+
+
+class ConsolidationTests(PortalTestCase):
+    def test_eliminations_remove_the_matched_part(self):
+        balances = {'main': {1300: 100.0}, 'sub': {2300: -90.0, 1000: 5.0}}
+        types = {1000: 'Asset', 1300: 'Asset', 2300: 'Liability'}
+        result = consolidate(balances, types, [(1300, 2300)])
+        self.assertEqual(result['eliminations'], [{'accounts': [1300, 2300], 'eliminated': 90.0,
+                                                   'difference': 10.0}])
+        self.assertEqual(result['consolidated']['balance'], {'assets': 15.0, 'liabilities': 0.0, 'equity': 0.0})
+        self.assertEqual(result['entities']['main']['balance']['assets'], 100.0)
+
+    def test_consolidated_endpoint(self):
+        saved = list(portal.JOURNAL_ENTRIES), list(portal.PERIOD_CLOSES), portal._chart().copy()
+        portal.JOURNAL_ENTRIES[:] = []
+
+        def restore():
+            portal.JOURNAL_ENTRIES[:], portal.PERIOD_CLOSES[:] = saved[:2]
+            portal._set_chart(saved[2])
+        self.addCleanup(restore)
+        self.login()
+        self.client.post('/accounts/add', json={'code': 1300, 'name': 'Due from Sub', 'type': 'Asset',
+                                                'entity': 'main'})
+        self.client.post('/accounts/add', json={'code': 2300, 'name': 'Due to Main', 'type': 'Liability'})
+        ndjson = ('{"date": "2023-05-01", "debit_account": 1300, "credit_account": 4000, "amount": 100}\n'
+                  '{"date": "2023-05-01", "debit_account": 5000, "credit_account": 2300, "amount": 100,'
+                  ' "entity": "sub"}\n'
+                  '{"date": "2023-06-01", "debit_account": 1000, "credit_account": 4000, "amount": 30,'
+                  ' "entity": "sub"}\n')
+        self.assertEqual(self.client.post('/journal/import', data=ndjson,
+                                          content_type='application/x-ndjson').status_code, 200)
+        wrong = self.client.post('/journal/new', json={'debit_account': 1300, 'credit_account': 4000,
+                                                       'amount': 1, 'entity': 'sub'})
+        self.assertEqual(wrong.status_code, 400)
+
+        response = self.client.get('/statements/consolidated?eliminations=1300:2300,4000:5000').get_json()
+        self.assertEqual(response['entities']['main']['income']['revenue'], 100.0)
+        self.assertEqual(response['entities']['sub']['income']['net_income'], -70.0)
+        self.assertEqual(response['consolidated']['income'], {'revenue': 30.0, 'expenses': 0.0, 'net_income': 30.0})
+        self.assertEqual(response['consolidated']['balance']['assets'], 30.0)
+        self.assertEqual(response['consolidated']['balance']['liabilities'], 0.0)
+        self.assertEqual(self.client.get('/statements/consolidated?eliminations=1300:9').status_code, 400)
+
+        self.client.post('/periods/close', json={'before': '2024-01-01', 'retained_earnings': 3000})
+        closed = self.client.get('/statements/consolidated?eliminations=1300:2300').get_json()
+        self.assertEqual(closed['entities']['sub']['balance']['equity'], 70.0)
+        self.assertEqual(closed['consolidated']['balance'], {'assets': 30.0, 'liabilities': 0.0, 'equity': -30.0})
+
+
+class CompressionTests(PortalTestCase):
+    def test_large_json_is_gzipped_and_revalidated(self):
+        saved = list(portal.CUSTOMERS)
+        portal.CUSTOMERS[:] = [{'id': i, 'name': f'Customer {i}', 'contact': '', 'owner': 'Admin'}
+                               for i in range(1, 200)]
+        try:
+            self.login()
+            plain = self.client.get('/customers')
+            response = self.client.get('/customers', headers={'Accept-Encoding': 'gzip;q=0.5, br;q=0'})
+            self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+            self.assertIn('Accept-Encoding', response.headers['Vary'])
+            self.assertEqual(gzip.decompress(response.data), plain.data)
+            self.assertTrue(response.headers['ETag'].startswith('W/'))
+            cached = self.client.get('/customers', headers={'If-None-Match': response.headers['ETag']})
+            self.assertEqual((cached.status_code, cached.data), (304, b''))
+        finally:
+            portal.CUSTOMERS[:] = saved
+
+    def test_small_responses_are_left_alone(self):
+        self.login()
+        response = self.client.get('/customers', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_pages_are_cached_and_revalidated(self):
+        self.login()
+        page = self.client.get('/dashboard-page', headers={'Accept-Encoding': 'identity'})
+        self.assertEqual(page.headers['Cache-Control'], 'private, no-cache')
+        again = self.client.get('/dashboard-page', headers={'If-None-Match': page.headers['ETag']})
+        self.assertEqual(again.status_code, 304)
+
+    @unittest.skipIf(compression.orjson is None, 'orjson is not installed')
+    def test_orjson_provider_matches_default_output(self):
+        payload = {'b': [1, 2.5, None], 'a': {'when': datetime(2024, 1, 2, 3, 4, 5), 'day': date(2024, 1, 2)}}
+        with portal.app.app_context():
+            expected = portal.app.json.response(payload).get_data()
+            actual = compression.OrjsonProvider(portal.app).response(payload).get_data()
+        self.assertEqual(actual, expected)
+
+
+class StartupTests(unittest.TestCase):
+    def test_import_does_not_load_pandas(self):
+        code = 'import sys, app; print("pandas" in sys.modules, "numpy" in sys.modules, app.chart_df is None)'
+        output = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.split(), ['False', 'False', 'True'])
+
+    def test_chart_is_loaded_on_first_use(self):
+        self.assertIn('code', portal._chart().columns)
+
+    def test_chart_is_not_loaded_before_authentication(self):
+        chart = portal._chart()
+        portal._set_chart(None)
+        try:
+            client = portal.app.test_client()
+            self.assertEqual(client.get('/accounts').status_code, 401)
+            self.assertEqual(client.get('/dashboard').status_code, 401)
+            client.post('/login', json={'username': 'Admin', 'password': 'PretiumAdmin007'})
+            self.assertEqual(client.get('/invoices').status_code, 200)
+            self.assertIsNone(portal.chart_df)
+        finally:
+            portal._set_chart(chart)
+
+
+if __name__ == '__main__':
+    unittest.main()